@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import sys
+import copy
+import random
+import argparse
+import numpy
+from simulation import Simulation, State, SEQUENCE_INCREMENT
+from savefile import get_save_path, get_slot_path, load_state, DEFAULT_SLOT
+
+UPGRADE_COMMANDS = 'uio'
+REBIRTH_COMMANDS = '12'
+METRICS = [ 'gold', 'level', 'rebirths' ]
+INT64_LIMIT = 2**63
+
+# encode build strings as a matrix of command indices, padded with -1 past the end
+def encode_builds(builds, commands):
+	width = max([ len(build) for build in builds ] + [ 0 ]) + 1
+	matrix = numpy.full((len(builds), width), -1, dtype=numpy.int64)
+	for row, build in enumerate(builds):
+		for column, command in enumerate(build):
+			matrix[row, column] = commands.index(command.lower())
+
+	return matrix
+
+# play many copies of a save at once, each lane following its own upgrade and rebirth build.
+# kills follow Simulation.update_reward(), except that evolves are not simulated and
+# buy max commands in upgrade builds only buy one
+class BatchSimulation:
+
+	def __init__(self, simulation, upgrade_builds, rebirth_builds):
+		state = simulation.state
+		fresh = State(simulation.version)
+		count = len(upgrade_builds)
+
+		self.count = count
+		self.time = 0.0
+		self.upgrade_builds = encode_builds(upgrade_builds, UPGRADE_COMMANDS)
+		self.rebirth_builds = encode_builds(rebirth_builds, REBIRTH_COMMANDS)
+		self.rebirth_values = simulation.rebirth_values
+		self.can_upgrade_damage_increase = 'can_upgrade_damage_increase' in state.perks
+		self.can_upgrade_attack_rate = 'can_upgrade_attack_rate' in state.perks
+		self.gold_multiplier = state.gold_multiplier
+		self.upgrade_growth = state.cost['upgrade'].growth
+		self.upgrade_multiplier = state.cost['upgrade'].multiplier
+		self.rebirth_growth = state.rebirth.cost_multiplier
+		self.health_growth = state.cost['health'].growth
+		self.health_multiplier = state.cost['health'].multiplier
+
+		# values restored on rebirth
+		self.base = {
+			'damage'               : state.base['damage'],
+			'damage_increase'      : state.base['damage_increase'],
+			'attack_rate'          : state.base['attack_rate'],
+			'damage_cost'          : fresh.damage.cost,
+			'damage_increase_cost' : fresh.damage_increase.cost,
+			'attack_rate_cost'     : fresh.attack_rate.cost,
+			'gold'                 : fresh.gold,
+		}
+
+		# gold, prices and counts are kept as int64, which a late save can outgrow
+		values = [ state.gold, state.damage.cost, state.damage_increase.cost, state.attack_rate.cost, state.rebirth.cost ]
+		if max(values) >= INT64_LIMIT:
+			raise ValueError("save's gold or prices are past 2**63, too large to play in batch")
+
+		def fill(value, dtype):
+			return numpy.full(count, value, dtype=dtype)
+
+		self.level = fill(state.level, numpy.int64)
+		self.health = fill(state.health, numpy.float64)
+		self.attack_timer = fill(simulation.attack_timer, numpy.float64)
+		self.gold = fill(state.gold, numpy.int64)
+		self.damage = fill(state.damage.value, numpy.float64)
+		self.damage_increase = fill(state.damage_increase.value, numpy.float64)
+		self.damage_increase_amount = fill(state.damage_increase_amount.value, numpy.float64)
+		self.attack_rate = fill(state.attack_rate.value, numpy.float64)
+		self.attack_rate_increase = fill(state.attack_rate_increase.value, numpy.float64)
+		self.damage_cost = fill(state.damage.cost, numpy.int64)
+		self.damage_increase_cost = fill(state.damage_increase.cost, numpy.int64)
+		self.attack_rate_cost = fill(state.attack_rate.cost, numpy.int64)
+		self.rebirths = fill(state.rebirth.value, numpy.int64)
+		self.rebirth_cost = fill(state.rebirth.cost, numpy.int64)
+		self.upgrade_sequence = fill(state.sequence['upgrade'], numpy.int64)
+		self.rebirth_sequence = fill(state.sequence['rebirth'], numpy.int64)
+		self.total_gold = fill(0, numpy.int64)
+		self.total_kills = fill(0, numpy.int64)
+		self.highest_level = fill(state.level, numpy.int64)
+
+	def get_max_health(self, level):
+		return numpy.floor(numpy.power(level.astype(numpy.float64), self.health_growth) * self.health_multiplier)
+
+	# advance every lane by seconds, one kill per lane per pass
+	def advance(self, seconds):
+		self.time += seconds
+		self.attack_timer += seconds
+		active = numpy.arange(self.count)
+		while len(active) > 0:
+			period = 1.0 / self.attack_rate[active]
+			attacks = numpy.floor(self.attack_timer[active] / period)
+			hits = numpy.maximum(1, numpy.ceil(self.health[active] / self.damage[active]))
+			killing = hits <= attacks
+
+			# spend the remaining attacks on enemies that survive them
+			wounded = active[~killing]
+			self.health[wounded] -= attacks[~killing] * self.damage[wounded]
+			self.attack_timer[wounded] -= attacks[~killing] * period[~killing]
+
+			active = active[killing]
+			self.attack_timer[active] -= hits[killing] * period[killing]
+			self.kill(active)
+
+		self.check_overflow()
+
+	# int64 wraps around silently and float prices past it convert to the lowest int64, either way a value goes negative
+	def check_overflow(self):
+		for values in (self.gold, self.damage_cost, self.damage_increase_cost, self.attack_rate_cost, self.rebirth_cost, self.total_gold):
+			if (values < 0).any():
+				raise OverflowError("gold or prices passed 2**63 while playing, try fewer hours")
+
+	# buy an upgrade for lanes that can afford it, return the lanes that bought
+	def buy_upgrade(self, lanes, cost, value, amount):
+		price = (cost[lanes] * self.upgrade_multiplier).astype(numpy.int64)
+		bought = self.gold[lanes] >= price
+		lanes = lanes[bought]
+		self.gold[lanes] -= price[bought]
+		cost[lanes] = (cost[lanes] * self.upgrade_growth).astype(numpy.int64)
+		value[lanes] += amount[lanes]
+
+		return lanes
+
+	def kill(self, lanes):
+		reward = (self.level[lanes] * self.gold_multiplier).astype(numpy.int64)
+		self.gold[lanes] += reward
+		self.total_gold[lanes] += reward
+		self.total_kills[lanes] += 1
+
+		# handle auto upgrades
+		command = self.upgrade_builds[lanes, self.upgrade_sequence[lanes]]
+		bought = [ self.buy_upgrade(lanes[command == 0], self.damage_cost, self.damage, self.damage_increase) ]
+		if self.can_upgrade_damage_increase:
+			bought.append(self.buy_upgrade(lanes[command == 1], self.damage_increase_cost, self.damage_increase, self.damage_increase_amount))
+		if self.can_upgrade_attack_rate:
+			bought.append(self.buy_upgrade(lanes[command == 2], self.attack_rate_cost, self.attack_rate, self.attack_rate_increase))
+		for upgraded in bought:
+			self.upgrade_sequence[upgraded] += 1
+
+		# handle auto rebirths
+		command = self.rebirth_builds[lanes, self.rebirth_sequence[lanes]]
+		rebirthing = (command >= 0) & (self.gold[lanes] >= self.rebirth_cost[lanes])
+		reborn = lanes[rebirthing]
+		command = command[rebirthing]
+		self.rebirths[reborn] += 1
+		self.rebirth_cost[reborn] = (self.rebirth_cost[reborn] * self.rebirth_growth).astype(numpy.int64)
+		self.rebirth_sequence[reborn] += 1
+		self.upgrade_sequence[reborn] = 0
+		self.level[reborn] = 1
+		self.gold[reborn] = self.base['gold']
+		self.damage[reborn] = self.base['damage']
+		self.damage_increase[reborn] = self.base['damage_increase']
+		self.attack_rate[reborn] = self.base['attack_rate']
+		self.damage_cost[reborn] = self.base['damage_cost']
+		self.damage_increase_cost[reborn] = self.base['damage_increase_cost']
+		self.attack_rate_cost[reborn] = self.base['attack_rate_cost']
+		self.damage_increase_amount[reborn[command == 0]] += self.rebirth_values[0]
+		self.attack_rate_increase[reborn[command == 1]] += self.rebirth_values[1]
+
+		# next level
+		leveled = lanes[~rebirthing]
+		self.level[leveled] += 1
+		self.highest_level[leveled] = numpy.maximum(self.highest_level[leveled], self.level[leveled])
+		self.health[lanes] = self.get_max_health(self.level[lanes])
+
+	def get_scores(self, metric):
+		if metric == 'gold':
+			return self.total_gold / max(self.time, 1e-9)
+		elif metric == 'level':
+			return self.highest_level.astype(numpy.float64)
+		elif metric == 'rebirths':
+			return self.rebirths.astype(numpy.float64)
+
+		raise ValueError("unknown metric " + metric)
+
+# random builds using the commands the save has unlocked, plus the current one
+def get_candidates(state, count, generator):
+	upgrade_commands = 'u'
+	if 'can_upgrade_damage_increase' in state.perks:
+		upgrade_commands += 'i'
+	if 'can_upgrade_attack_rate' in state.perks:
+		upgrade_commands += 'o'
+	upgrade_length = state.perks.get('auto_upgrade', 0) * SEQUENCE_INCREMENT
+	rebirth_length = state.perks.get('auto_rebirth', 0) * SEQUENCE_INCREMENT
+
+	upgrade_builds = [ state.builds.get('upgrade', '') ]
+	rebirth_builds = [ state.builds.get('rebirth', '') ]
+	for i in range(count - 1):
+		upgrade_builds.append(''.join(generator.choice(upgrade_commands) for j in range(upgrade_length)))
+		rebirth_builds.append(''.join(generator.choice(REBIRTH_COMMANDS) for j in range(rebirth_length)))
+
+	return upgrade_builds, rebirth_builds
+
+# play each build pair for seconds and return (score, upgrade build, rebirth build) best first
+def rank_builds(simulation, upgrade_builds, rebirth_builds, seconds, metric, step=60.0):
+	batch = BatchSimulation(simulation, upgrade_builds, rebirth_builds)
+	elapsed = 0.0
+	while elapsed < seconds:
+		frametime = min(step, seconds - elapsed)
+		batch.advance(frametime)
+		elapsed += frametime
+
+	scores = batch.get_scores(metric)
+	order = numpy.argsort(-scores, kind='stable')
+	return [ (scores[index], upgrade_builds[index], rebirth_builds[index]) for index in order ]
+
+def main():
+	parser = argparse.ArgumentParser(description="Rank auto_upgrade and rebirth builds by playing them out together")
+	parser.add_argument('file', nargs='?', help="save file, defaults to the save of --slot")
+	parser.add_argument('--slot', default=DEFAULT_SLOT, help="save slot to play")
+	parser.add_argument('--hours', type=float, default=1.0, help="simulated hours per candidate")
+	parser.add_argument('--candidates', type=int, default=1000, help="number of builds to compare")
+	parser.add_argument('--metric', choices=METRICS, default='gold', help="gold per second, highest level or rebirths")
+	parser.add_argument('--top', type=int, default=10, help="number of builds to print")
+	parser.add_argument('--seed', type=int, help="random seed for candidate builds")
+	parser.add_argument('--build', nargs=2, action='append', metavar=('UPGRADE', 'REBIRTH'), help="add a specific build to compare")
+	args = parser.parse_args()
+
+	try:
+		with open(args.file or get_slot_path(get_save_path(), args.slot), 'rb') as f:
+			state = load_state(f)
+	except OSError as e:
+		print(str(e))
+		sys.exit(1)
+
+	upgrade_builds, rebirth_builds = get_candidates(state, args.candidates, random.Random(args.seed))
+	for upgrade_build, rebirth_build in args.build or []:
+		upgrade_builds.append(upgrade_build)
+		rebirth_builds.append(rebirth_build)
+
+	simulation = Simulation(copy.deepcopy(state))
+	try:
+		ranking = rank_builds(simulation, upgrade_builds, rebirth_builds, args.hours * 3600, args.metric)
+	except (ValueError, OverflowError) as e:
+		print(str(e))
+		sys.exit(1)
+	print("%-6s %-14s %s" % ("Rank", args.metric.title(), "Build"))
+	for rank, (score, upgrade_build, rebirth_build) in enumerate(ranking[:args.top]):
+		print("%-6d %-14.2f u:'%s' r:'%s'" % (rank + 1, score, upgrade_build, rebirth_build))
+
+if __name__ == '__main__':
+	main()
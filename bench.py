@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+from simulation import Simulation, State, PRESTIGE_COSTS, MODE_PLAY, MODE_SHOP
+from savefile import SaveWriter, load_state, save_state, encode_state, decode_state
+
+PROFILES = [ 'early', 'mid', 'late' ]
+IDLE_TIMES = [ 60*60, 60*60*24, 60*60*24*365 ]
+DRAW_MODES = [ ('play', MODE_PLAY), ('shop', MODE_SHOP) ]
+WARMUP_TICKS = 10000
+FRAME_RATE = 150.0
+THROUGHPUTS = ( 'ticks_per_sec.', 'advance_per_sec.' )
+
+MIN_ROUND_TIME = 0.05
+
+# percentiles are reported but move too much between runs to fail on, the fastest sample is compared instead
+UNGATED = ( '.p50', '.p95', '.p99' )
+
+# build a canned save for a point in the game
+def make_state(profile):
+	state = State(Simulation().version)
+	if profile == 'early':
+		state.level = 40
+		state.gold = 300
+		state.damage.value = 12.0
+		state.damage.cost = 60
+		state.perks = { 'can_upgrade_damage_increase' : 1 }
+	elif profile == 'mid':
+		state.level = 2500
+		state.gold = 25000000
+		state.rebirth.value = 20
+		state.evolve.value = 6
+		state.damage.value = 4000.0
+		state.attack_rate.value = 8.0
+		state.perks = {
+			'can_upgrade_damage_increase' : 1,
+			'can_upgrade_attack_rate'     : 1,
+			'can_rebirth'                 : 1,
+			'can_evolve'                  : 1,
+			'show_dps'                    : 1,
+			'show_highest_level'          : 1,
+			'show_health_percent'         : 1,
+			'auto_upgrade'                : 4,
+		}
+		state.builds = { 'upgrade' : 'uuiuuiuuoouuiuuiuuoo' }
+	elif profile == 'late':
+
+		# the DEVMODE preset, with enough rebirths that its gold doesn't cover the next one
+		state.level = 30000
+		state.gold = 5000000000000000
+		state.rebirth.value = 300
+		state.evolve.value = 100
+		state.damage.value = 2000000.0
+		state.attack_rate.value = 40.0
+		state.perks = {
+			'can_upgrade_damage_increase' : 1,
+			'can_upgrade_attack_rate'     : 1,
+			'can_rebirth'                 : 1,
+			'can_evolve'                  : 1,
+			'can_transform'               : 1,
+			'show_dps'                    : 1,
+			'show_dps_increase'           : 1,
+			'show_highest_level'          : 1,
+			'show_highest_dps'            : 1,
+			'show_elapsed'                : 1,
+			'show_total_upgrades'         : 1,
+			'show_total_kills'            : 1,
+			'show_total_gold'             : 1,
+			'show_health_percent'         : 1,
+			'reduce_upgrade_price'        : 5,
+			'auto_upgrade'                : 20,
+			'auto_rebirth'                : 4,
+		}
+		state.cost['upgrade'].multiplier = 0.75
+		state.builds = { 'upgrade' : 'uuuuuiiiiioooooo' * 6, 'rebirth' : '12' * 10 }
+	else:
+		raise ValueError("unknown profile " + profile)
+
+	# prestige prices that go with the counts, bought the way the game buys them
+	for name in ('rebirth', 'evolve', 'transform'):
+		upgrade = getattr(state, name)
+		count = upgrade.value
+		upgrade.reset(0, PRESTIGE_COSTS[name], state.cost[name].growth)
+		for i in range(count):
+			upgrade.buy(1)
+
+	state.highest['level'] = state.level
+	return state
+
+def make_simulation(profile):
+	return Simulation(make_state(profile))
+
+def get_percentile(values, percent):
+	values = sorted(values)
+	index = min(len(values) - 1, int(len(values) * percent / 100.0))
+	return values[index]
+
+def get_percentiles(values):
+	return {
+		'best' : min(values),
+		'p50' : get_percentile(values, 50),
+		'p95' : get_percentile(values, 95),
+		'p99' : get_percentile(values, 99),
+	}
+
+def bench_ticks(profile, duration, repeat):
+	simulation = make_simulation(profile)
+
+	# a fixture that prestiges straight away would be timing the early game
+	level = simulation.state.level
+	simulation.step(WARMUP_TICKS)
+	if simulation.state.level < level:
+		raise RuntimeError(profile + " profile fell back to level " + str(simulation.state.level))
+
+	# best of several rounds, the slower ones measure whatever else the machine was doing
+	rates = []
+	for i in range(repeat):
+		ticks = 0
+		start = time.perf_counter()
+		elapsed = 0
+		while elapsed < duration:
+			simulation.step(100)
+			ticks += 100
+			elapsed = time.perf_counter() - start
+		rates.append(ticks / elapsed)
+
+	return max(rates)
+
+# frames of live play per second, each advancing the game by a frame at FRAME_RATE
+def bench_advance(profile, duration, repeat):
+	simulation = make_simulation(profile)
+	rates = []
+	for i in range(repeat):
+		frames = 0
+		start = time.perf_counter()
+		elapsed = 0
+		while elapsed < duration:
+			for j in range(100):
+				simulation.advance(1.0 / FRAME_RATE)
+			frames += 100
+			elapsed = time.perf_counter() - start
+		rates.append(frames / elapsed)
+
+	return max(rates)
+
+# best of repeat rounds of the average time of function, each round calling it on fresh
+# arguments from setup until MIN_ROUND_TIME has been spent in it
+def get_best_time(function, setup, repeat):
+	times = []
+	for i in range(repeat):
+		calls = 0
+		spent = 0.0
+		while spent < MIN_ROUND_TIME:
+			argument = setup()
+			start = time.perf_counter()
+			function(argument)
+			spent += time.perf_counter() - start
+			calls += 1
+		times.append(spent / calls)
+
+	return min(times)
+
+def bench_fast_forward(profile, idle_time, repeat):
+	def setup():
+		simulation = make_simulation(profile)
+		simulation.fast_forwarding = True
+		return simulation
+
+	return get_best_time(lambda simulation: simulation.advance(idle_time), setup, repeat)
+
+def bench_save(profile, count):
+	state = make_state(profile)
+	save_times = []
+	load_times = []
+	queue_times = []
+	write_times = []
+	formats = { 'encode' : [], 'decode' : [], 'pickle_dump' : [], 'pickle_load' : [] }
+	for i in range(count):
+		start = time.perf_counter()
+		data = encode_state(state)
+		formats['encode'].append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		decode_state(data)
+		formats['decode'].append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		data = pickle.dumps(state)
+		formats['pickle_dump'].append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		pickle.loads(data)
+		formats['pickle_load'].append(time.perf_counter() - start)
+
+	with tempfile.TemporaryDirectory() as path:
+		save_file = os.path.join(path, "save.dat")
+		for i in range(count):
+			start = time.perf_counter()
+			save_state(save_file, state)
+			save_times.append(time.perf_counter() - start)
+
+			start = time.perf_counter()
+			with open(save_file, 'rb') as f:
+				load_state(f)
+			load_times.append(time.perf_counter() - start)
+
+		# time spent on the frame loop when saving through the background writer
+		writer = SaveWriter()
+		for i in range(count):
+			start = time.perf_counter()
+			writer.save(save_file, state.snapshot())
+			queue_times.append(time.perf_counter() - start)
+			writer.flush()
+			write_times.append(writer.get_stats()['latency'])
+		writer.close()
+
+		size = os.path.getsize(save_file)
+
+	results = {
+		'save'        : get_percentiles(save_times),
+		'load'        : get_percentiles(load_times),
+		'save_queue'  : get_percentiles(queue_times),
+		'save_writer' : get_percentiles(write_times),
+	}
+	for name in formats:
+		results[name] = get_percentiles(formats[name])
+
+	return results, size, len(data)
+
+# time Game.draw() on the real terminal, returns None when there isn't one. idle frames draw
+# an unchanged state, live frames advance the game between frames the way live play does.
+# the game saves to a temporary directory so the user's saves and snapshots aren't touched
+def bench_draw(profiles, frames):
+	if not sys.stdout.isatty():
+		return None
+
+	import game
+
+	with tempfile.TemporaryDirectory() as path:
+		return bench_game_draw(game.Game(os.path.join(path, '')), profiles, frames)
+
+def bench_game_draw(instance, profiles, frames):
+	import curses
+
+	results = {}
+	try:
+		for profile in profiles:
+			for name, mode in DRAW_MODES:
+				for live in (False, True):
+					instance.state = make_state(profile)
+					instance.init_level()
+					instance.mode = mode
+					frame_times = []
+					for i in range(frames):
+						if live:
+							instance.advance(1.0 / instance.max_fps)
+						start = time.perf_counter()
+						instance.draw()
+						frame_times.append(time.perf_counter() - start)
+
+					results[profile + '.' + name + ('.live' if live else '.idle')] = get_percentiles(frame_times)
+	finally:
+		instance.writer.close()
+		curses.endwin()
+
+	return results
+
+def run(profiles, duration, frames, count, repeat):
+	results = {}
+	for profile in profiles:
+		results['ticks_per_sec.' + profile] = bench_ticks(profile, duration, repeat)
+		results['advance_per_sec.' + profile] = bench_advance(profile, duration, repeat)
+		for idle_time in IDLE_TIMES:
+			results['fast_forward.' + profile + '.' + str(idle_time)] = bench_fast_forward(profile, idle_time, repeat)
+
+		saves, size, pickle_size = bench_save(profile, count)
+		for name in saves:
+			for key in saves[name]:
+				results[name + '.' + profile + '.' + key] = saves[name][key]
+		results['save_size.' + profile] = size
+		results['pickle_size.' + profile] = pickle_size
+
+	draw = bench_draw(profiles, frames)
+	if draw is not None:
+		for name in draw:
+			for key in draw[name]:
+				results['draw.' + name + '.' + key] = draw[name][key]
+
+	return results
+
+# return metrics that got worse than the baseline by more than threshold, leaving out tail percentiles
+def get_regressions(results, baseline, threshold):
+	regressions = []
+	for name in results:
+		if name not in baseline or baseline[name] <= 0 or name.endswith(UNGATED):
+			continue
+
+		# higher is better only for throughput
+		if name.startswith(THROUGHPUTS):
+			change = baseline[name] / results[name] - 1
+		else:
+			change = results[name] / baseline[name] - 1
+
+		if change > threshold:
+			regressions.append((name, baseline[name], results[name], change))
+
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the tick, draw, save and fast-forward hot paths")
+	parser.add_argument('--profile', action='append', choices=PROFILES, help="save profile to run, defaults to all")
+	parser.add_argument('--duration', type=float, default=0.5, help="seconds to spend per round of the tick benchmark")
+	parser.add_argument('--repeat', type=int, default=5, help="rounds of the tick and fast forward benchmarks, the best is kept")
+	parser.add_argument('--frames', type=int, default=300, help="frames to draw per mode")
+	parser.add_argument('--count', type=int, default=50, help="saves and loads per profile")
+	parser.add_argument('--save', metavar='FILE', help="write results as a baseline")
+	parser.add_argument('--compare', metavar='FILE', help="fail if results regress past the baseline in FILE")
+	parser.add_argument('--threshold', type=float, default=0.25, help="allowed relative regression, default 0.25")
+	args = parser.parse_args()
+
+	results = run(args.profile or PROFILES, args.duration, args.frames, args.count, args.repeat)
+	for name in sorted(results):
+		print("%-40s %g" % (name, results[name]))
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+
+		regressions = get_regressions(results, baseline, args.threshold)
+		for name, old, new, change in regressions:
+			print("REGRESSION %s: %g -> %g (%+.0f%%)" % (name, old, new, change * 100))
+
+		if len(regressions) > 0:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
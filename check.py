@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import sys
+import time
+import argparse
+from simulation import Simulation, State, GAME_VERSION, APPROXIMATE_LIMIT
+from bench import make_state, PROFILES, FRAME_RATE
+from replay import get_fields
+from game import CATCH_UP_CHUNK
+
+# states that lean on the shortcuts in advance(): bulk buys from capital build commands, auto rebirth
+# runs that fast forwarding skips with a RunShadow, and kill rewards summed with a gold multiplier
+SCENARIOS = [ 'bulk', 'rebirth', 'evolve', 'multiplier' ]
+
+# name, frame length and whether to fast forward, the way live play and catching up call advance()
+FRAMES = [ ('frame', 1 / FRAME_RATE, False), ('second', 1.0, False), ('chunk', CATCH_UP_CHUNK, True) ]
+
+# attacks at round rates land exactly on whole seconds, where float rounding decides whether a run's
+# last attack falls inside it or just after. ending a little past one keeps that out of the comparison
+END_OFFSET = 0.37
+
+# upgrades bought with each key, and the stat each purchase adds
+BULK_TARGETS = [ ('damage', 'damage_increase'), ('damage_increase', 'damage_increase_amount'), ('attack_rate', 'attack_rate_increase') ]
+
+def make_scenario(name):
+	if name in PROFILES:
+		return make_state(name)
+
+	state = State(GAME_VERSION)
+	state.perks = {
+		'can_upgrade_damage_increase' : 1,
+		'can_upgrade_attack_rate'     : 1,
+		'can_rebirth'                 : 1,
+		'can_evolve'                  : 1,
+		'auto_upgrade'                : 10,
+		'auto_rebirth'                : 10,
+		'auto_evolve'                 : 10,
+	}
+	if name == 'bulk':
+		state.gold = 10**12
+		state.builds = { 'upgrade' : 'UuIuO' }
+	elif name == 'rebirth':
+
+		# no attack rate in the build, so every run after a rebirth repeats the last one
+		state.base['damage'] = 200.0
+		state.base['attack_rate'] = 4.0
+		state.builds = { 'upgrade' : 'UuuI', 'rebirth' : '2' * 60 }
+	elif name == 'evolve':
+		state.base['damage'] = 1000.0
+		state.base['attack_rate'] = 4.0
+		state.builds = { 'upgrade' : 'uuoi', 'rebirth' : '12' * 30, 'evolve' : '1' }
+	elif name == 'multiplier':
+
+		# int(level * 1.15) rounds up to a whole number at levels where the exact product falls just short
+		state.base['gold_multiplier'] = 1.15
+		state.gold_multiplier = 1.15
+		state.base['damage'] = 200.0
+		state.base['attack_rate'] = 4.0
+		state.builds = { 'upgrade' : 'UuuI', 'rebirth' : '2' * 60 }
+	else:
+		raise ValueError("unknown scenario " + name)
+
+	state.calc()
+	state.highest['level'] = state.level
+	return state
+
+# names of the fields that differ. time is only counted a tick at a time by update(),
+# so it and the attack timer are allowed to be off by up to tolerance seconds
+def get_differences(simulation, expected, tolerance):
+	fields = get_fields(simulation.state)
+	expected_fields = get_fields(expected.state)
+	differences = []
+	for name in fields:
+		value = fields[name]
+		expected_value = expected_fields[name]
+		if name in ('total', 'since'):
+			if abs(value['time'] - expected_value['time']) > tolerance:
+				differences.append(name + '.time')
+			value = dict(value, time=0)
+			expected_value = dict(expected_value, time=0)
+		if value != expected_value:
+			differences.append(name)
+
+	if abs(simulation.attack_timer - expected.attack_timer) > tolerance:
+		differences.append('attack_timer')
+
+	return differences
+
+# play a state for seconds with fixed update() ticks, then again with advance() in frames of each length
+def check_advance(state, seconds):
+	expected = Simulation(state.snapshot())
+	expected.step(int(round(seconds / expected.timestep)))
+
+	results = []
+	for name, frametime, fast_forwarding in FRAMES:
+		simulation = Simulation(state.snapshot())
+		simulation.fast_forwarding = fast_forwarding
+		played = 0.0
+		started = time.perf_counter()
+		while played < seconds:
+			frame = min(frametime, seconds - played)
+			simulation.advance(frame)
+			played += frame
+		elapsed = time.perf_counter() - started
+		results.append((name, get_differences(simulation, expected, expected.timestep), elapsed))
+
+	return expected, results
+
+# buy_upgrades() against the same purchases made one at a time with buy_upgrade()
+def check_bulk(state):
+	results = []
+	for name, amount in BULK_TARGETS:
+		bulk = Simulation(state.snapshot())
+		count = bulk.buy_upgrades(getattr(bulk.state, name), getattr(bulk.state, amount).value)
+
+		single = Simulation(state.snapshot())
+		bought = 0
+		while bought < count and single.buy_upgrade(getattr(single.state, name), getattr(single.state, amount).value):
+			bought += 1
+
+		differences = get_differences(bulk, single, 0)
+		if bought != count:
+			differences.append('count')
+		results.append((name, count, differences))
+
+	return results
+
+# approximate mode turns prices past APPROXIMATE_LIMIT into floats. returns the names of the values that came back
+# as ints after buying upgrades one at a time and in bulk, checked before a kill would turn them into floats again
+def check_approximate():
+	state = make_scenario('bulk')
+	state.gold = APPROXIMATE_LIMIT * 10**9
+	for name, amount in BULK_TARGETS:
+		getattr(state, name).cost = APPROXIMATE_LIMIT * 4
+	simulation = Simulation(state)
+	simulation.approximate = True
+	simulation.approximate_state()
+
+	for name, amount in BULK_TARGETS:
+		simulation.buy_upgrade(getattr(simulation.state, name), getattr(simulation.state, amount).value)
+		simulation.buy_upgrades(getattr(simulation.state, name), getattr(simulation.state, amount).value, 100)
+
+	values = [ ('gold', simulation.state.gold) ] + [ (name, getattr(simulation.state, name).cost) for name, amount in BULK_TARGETS ]
+	return [ name for name, value in values if not isinstance(value, float) ]
+
+def main():
+	parser = argparse.ArgumentParser(description="Check that advance() and bulk buys end where update() ticks and single buys do")
+	parser.add_argument('--scenario', action='append', choices=PROFILES + SCENARIOS, help="state to check, defaults to all")
+	parser.add_argument('--hours', type=float, default=0.25, help="game hours to play each state for")
+	args = parser.parse_args()
+
+	failed = False
+	for scenario in args.scenario or PROFILES + SCENARIOS:
+		state = make_scenario(scenario)
+		expected, results = check_advance(state, args.hours * 3600 + END_OFFSET)
+		print("%-10s level %d, %d rebirths, %d evolves" % (scenario, expected.state.level, expected.state.rebirth.value, expected.state.evolve.value))
+		for name, differences, elapsed in results:
+			print("  advance %-7s %7.3fs  %s" % (name, elapsed, ", ".join(differences) or "ok"))
+			failed = failed or len(differences) > 0
+
+		for name, count, differences in check_bulk(state):
+			print("  bulk    %-16s %-5d %s" % (name, count, ", ".join(differences) or "ok"))
+			failed = failed or len(differences) > 0
+
+	differences = check_approximate()
+	print("approximate %s" % (", ".join(differences) or "ok"))
+	failed = failed or len(differences) > 0
+
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -1,27 +1,35 @@
 #!/usr/bin/env python3
+import io
 import os
+import re
 import curses
 import time
-import math
 import random
 import sys
-import pickle
 import signal
+import bisect
+import argparse
+import selectors
+import threading
+from simulation import Simulation, State, scale_cost, MAX_IDLE_TIME, PERKS, PERK_LEVELS, PERK_REBIRTHS, PERK_EVOLVES, SEQUENCE_INCREMENT, MODE_PLAY, MODE_REBIRTH, MODE_EVOLVE, MODE_SHOP, MODE_SEQUENCE, MODE_TRANSFORM
+from savefile import SaveWriter, get_save_path, get_slot_path, list_slots, read_state, migrate_state, DEFAULT_SLOT
+from profiler import Profiler, NullProfiler
+from notation import NOTATIONS, format_number
+from recording import Recorder, NullRecorder
+from snapshots import SnapshotStore, SNAPSHOT_DIR, PRESTIGE_INTERVAL, DAILY_INTERVAL
+from projection import main as simulate
+from history import History, TIERS, TIER_NAMES, METRICS, get_history_path, load_history, get_sparkline
 
 DEVMODE = 0
-GAME_VERSION = 14
 TIME_SCALE = 1
-AUTOSAVE_TIME = 60
-SEQUENCE_INCREMENT = 5
-PENALTIES_ALLOWED = 10
-MODE_PLAY = 0
-MODE_REBIRTH = 1
-MODE_EVOLVE = 2
-MODE_SHOP = 3
-MODE_SEQUENCE = 4
-MODE_TRANSFORM = 5
 HEALTH_WIDTH = 20
-MAX_IDLE_TIME = 60*60*24*365
+MAX_WAIT_TIME = 1.0
+MAX_KEYS = 100
+CATCH_UP_CHUNK = 3600
+PROGRESS_TIME = 0.1
+
+# purchase keys that are bought together when repeated, keys for the same upgrade share a value
+PURCHASE_KEYS = { ord('u') : 'u', ord('1') : 'u', ord('i') : 'i', ord('2') : 'i', ord('o') : 'o', ord('3') : 'o' }
 
 def signal_handler(signal, frame):
 	curses.endwin()
@@ -38,166 +46,116 @@ def get_max_sizes(data, padding):
 
 	return sizes
 
-class Perk:
-
-	def __init__(self, ranks, name, label, info, cost, level, rebirths, evolves, cost_multiplier):
-		self.ranks = ranks
-		self.name = name
-		self.label = label
-		self.info = info
-		self.cost = cost
-		self.level = level
-		self.rebirths = rebirths
-		self.evolves = evolves
-		self.cost_multiplier = cost_multiplier
-
-class Upgrade:
-
-	def __init__(self, value, cost, cost_multiplier):
-		self.value = value
-		self.cost = cost
-		self.cost_multiplier = cost_multiplier
-
-	def buy(self, amount):
-		self.cost = int(self.cost * self.cost_multiplier)
-		self.value += amount
-
-class Cost:
-
-	def __init__(self, growth, multiplier):
-		self.growth = growth
-		self.multiplier = multiplier
-
-class State:
-
-	def __init__(self, version):
-		self.version = version
-
-		# base stats
-		self.base = {
-			'level'                    : 1,
-			'damage'                   : 1.0,
-			'damage_increase'          : 1.0,
-			'damage_increase_amount'   : 1.0,
-			'attack_rate'              : 1.0,
-			'attack_rate_increase'     : 0.1,
-			'gold'                     : 0,
-			'gold_multiplier'          : 1.0,
-			'gold_multiplier_increase' : 0.05,
-		}
-
-		# values associated with cost and increasing prices
-		self.cost = {
-			'upgrade'   : Cost(1.2, 1),
-			'rebirth'   : Cost(1.1, 1),
-			'evolve'    : Cost(1.1, 1),
-			'transform' : Cost(1.1, 1),
-			'health'    : Cost(1.5, 1),
-		}
-
-		# stats for records
-		self.highest = {
-			'dps'       : 0,
-			'level'     : 0,
-			'rebirth'   : 0,
-			'evolve'    : 0,
-			'transform' : 0,
-		}
-
-		# stats for running counts
-		self.total = {
-			'time'      : 0,
-			'kill'      : 0,
-			'gold'      : 0,
-			'gold_lost' : 0,
-			'upgrade'   : 0,
-			'rebirth'   : 0,
-			'evolve'    : 0,
-			'transform' : 0,
-		}
-
-		# stats since last rebirth/evolve/reset
-		self.since = {
-			'time'      : 0,
-			'gold'      : 0,
-			'upgrade'   : 0,
-		}
-
-		# current sequences
-		self.sequence = {
-			'upgrade'   : 0,
-			'rebirth'   : 0,
-			'evolve'    : 0,
-			'transform' : 0,
-		}
-
-		self.level = self.base['level']
-		self.damage = Upgrade(self.base['damage'], 5, self.cost['upgrade'].growth)
-		self.damage_increase = Upgrade(self.base['damage_increase'], 50, self.cost['upgrade'].growth)
-		self.damage_increase_amount = Upgrade(self.base['damage_increase_amount'], 1000, self.cost['upgrade'].growth)
-		self.attack_rate = Upgrade(self.base['attack_rate'], 100, self.cost['upgrade'].growth)
-		self.attack_rate_increase = Upgrade(self.base['attack_rate_increase'], 10000, self.cost['upgrade'].growth)
-		self.gold = self.base['gold']
-		self.gold_multiplier = self.base['gold_multiplier']
-		self.gold_increase = Upgrade(self.base['gold_multiplier_increase'], 0, 0)
-		self.rebirth = Upgrade(0, 10000, self.cost['rebirth'].growth)
-		self.evolve = Upgrade(0, 10, self.cost['evolve'].growth)
-		self.transform = Upgrade(0, 10, self.cost['transform'].growth)
-		self.perks = {}
-		self.builds = {}
-		self.health = 0
-		self.max_health = 0
-		self.time = time.time()
-		self.calc()
-
-	# set values from base stats after rebirth/evolve
-	def calc(self):
-		self.damage.value = self.base['damage']
-		self.damage_increase.value = self.base['damage_increase']
-		self.damage_increase_amount.value = self.base['damage_increase_amount']
-		self.attack_rate.value = self.base['attack_rate']
-		self.attack_rate_increase.value = self.base['attack_rate_increase']
-
-	# copy values after reset
-	def copy(self, existing):
-		self.cost = existing.cost
-		self.perks = existing.perks
-		self.highest = existing.highest
-		self.total = existing.total
-		self.builds = existing.builds
-		self.sequence = existing.sequence
-
-class Game:
+# format strings for each set of column widths
+templates = {}
+
+def get_template(sizes):
+	if sizes not in templates:
+		templates[sizes] = " ".join("{%d:%d}" % (index, size) for index, size in enumerate(sizes))
+
+	return templates[sizes]
+
+# cell lengths, template and formatted rows of a table from the last time it was built
+class TableLayout:
 
 	def __init__(self):
-		self.save_file = "save.dat"
-		self.version = GAME_VERSION
+		self.lengths = None
+		self.template = None
+		self.rows = []
+
+# plays offline time on a copy of the state in a background thread, a chunk at a time,
+# so the screen can show progress and the player can stop it part way
+class CatchUp:
+
+	def __init__(self, state, idle_time, approximate, history):
+		self.simulation = Simulation(state.snapshot())
+		self.simulation.fast_forwarding = True
+		self.simulation.approximate = approximate
+		self.history = history
+		self.total = idle_time
+		self.played = 0.0
+		self.stopped = False
+		self.finished = False
+		self.error = None
+		self.started = time.perf_counter()
+		self.thread = threading.Thread(target=self.run, name="CatchUp", daemon=True)
+		self.thread.start()
+
+	def run(self):
+		try:
+			while self.played < self.total and not self.stopped:
+				chunk = min(CATCH_UP_CHUNK, self.total - self.played)
+				self.simulation.advance(chunk)
+				self.history.record(self.simulation.state)
+				self.played += chunk
+		except Exception as e:
+			self.error = e
+		self.finished = True
+
+	# stop after the current chunk, waiting for it unless wait is False
+	def stop(self, wait=True):
+		self.stopped = True
+		if wait:
+			self.thread.join()
+
+	# simulated seconds per real second
+	def get_rate(self):
+		elapsed = time.perf_counter() - self.started
+		if elapsed <= 0:
+			return 0.0
+
+		return self.played / elapsed
+
+	# real seconds left, or None before there's a rate to go by
+	def get_eta(self):
+		rate = self.get_rate()
+		if rate <= 0:
+			return None
+
+		return (self.total - self.played) / rate
+
+class Game(Simulation):
+
+	# save_path defaults to the user's save directory
+	def __init__(self, save_path=None):
+		Simulation.__init__(self)
+		self.save_path = save_path or get_save_path()
+		self.slot = DEFAULT_SLOT
 		self.done = 0
 		self.message_size_y = 1
 		self.screen = None
-		self.state = None
-		self.save_timer = 0
 		self.max_fps = 150.0
-		self.timestep = 1 / 100.0
-		self.mode = MODE_PLAY
-		self.rebirth_values = [ 1.0, 0.05 ]
-		self.evolve_values = [ 10.0, 1.0 ]
-		self.transform_values = [ 10.0, 1.0 ]
 		self.cursor = 0
-		self.fast_forwarding = False
-		self.attack_timer = 0
-		self.set_message("")
-
-		if sys.platform.startswith("win"):
-			self.save_path = os.getenv("APPDATA") + "\\terminalheroes\\"
-		else:
-			self.save_path = os.getenv("HOME") + "/.local/share/terminalheroes/"
-
+		self.sections = {}
+		self.layouts = {}
+		self.profiler = NullProfiler()
+		self.show_profile = False
+		self.shop_ranks = None
+		self.shop_costs = []
+		self.drawn_lines = []
+		self.drawn_message = None
+		self.drawn_size = None
+		self.recorder = NullRecorder()
+		self.history = History()
+		self.history_tier = 0
+		self.snapshot_prestiges = 0
+		self.snapshot_time = 0
+		self.next_daily = 0
+		self.open()
+
+	# set up save files and the terminal
+	def open(self):
 		if not os.path.exists(self.save_path):
 			os.makedirs(self.save_path)
+		self.writer = SaveWriter()
+		self.store = SnapshotStore(self.save_path + SNAPSHOT_DIR)
+		self.next_daily = self.store.get_last_time('daily') + DAILY_INTERVAL
 
+		# let curses decode arrow keys without holding a lone escape for a second
+		os.environ.setdefault('ESCDELAY', '25')
 		self.screen = curses.initscr()
 		self.screen.nodelay(1)
+		self.screen.keypad(1)
 		(self.max_y, self.max_x) = self.screen.getmaxyx()
 
 		try:
@@ -218,28 +176,69 @@ class Game:
 		curses.curs_set(0)
 		curses.noecho()
 
-	# handle key presses
+	# read every waiting key, up to MAX_KEYS. arrows come back as KEY_UP and KEY_DOWN,
+	# a lone escape as 27 and alt+key as the key, other escape sequences are dropped whole
+	def read_keys(self):
+		keys = []
+		while len(keys) < MAX_KEYS:
+			c = self.screen.getch()
+			if c == -1:
+				break
+
+			if c == 27:
+				nc = self.screen.getch()
+				if nc == ord('[') or nc == ord('O'):
+					c = self.read_sequence()
+					if c is None:
+						continue
+				elif nc != -1:
+					c = nc
+
+			keys.append(c)
+
+		return keys
+
+	# read the rest of an escape sequence curses didn't decode, returning the key it stands for.
+	# parameter bytes are skipped up to the final byte, which is a letter or ~
+	def read_sequence(self):
+		while True:
+			c = self.screen.getch()
+			if c == -1 or c < 0x20 or c > 0x7e:
+				return None
+			if c >= 0x40:
+				break
+
+		if c == ord('A'):
+			return curses.KEY_UP
+		elif c == ord('B'):
+			return curses.KEY_DOWN
+
+		return None
+
+	# handle every waiting key, returns how many there were
 	def handle_input(self):
+		keys = self.read_keys()
+		self.recorder.add_keys(keys)
+		self.handle_keys(keys)
 
-		# get key
-		escape = False
-		key_up = False
-		key_down = False
-		c = self.screen.getch()
-
-		# handle multibyte keys
-		if c == 27:
-			nc = self.screen.getch()
-			if nc == -1:
-				escape = True
-			else:
-				c = self.screen.getch()
-				if c == ord('A'):
-					key_down = True
-				elif c == ord('B'):
-					key_up = True
+		return len(keys)
+
+	# runs of the same purchase key are bought in one go so a held or pasted key is applied within a frame
+	def handle_keys(self, keys):
+		index = 0
+		while index < len(keys) and not self.done:
+			c = keys[index]
+			count = 1
+			if self.mode == MODE_PLAY and c in PURCHASE_KEYS:
+				while index + count < len(keys) and PURCHASE_KEYS.get(keys[index + count]) == PURCHASE_KEYS[c]:
+					count += 1
 
-				#self.message = "Escape Command: " + str(curses.keyname(c)) + " " + str(c) + " " + str(nc)
+			self.handle_key(c, count)
+			index += count
+
+	# handle a key pressed count times in a row
+	def handle_key(self, c, count=1):
+		escape = c == 27
 
 		# handle window resizes
 		if c == curses.KEY_RESIZE:
@@ -250,11 +249,15 @@ class Game:
 				self.win_game.resize(self.max_y-1, self.max_x)
 				self.win_message.mvwin(int(self.max_y - self.message_size_y), 0)
 
+		# toggle the profiler overlay
+		if c == ord('p') and self.profiler.enabled:
+			self.show_profile = not self.show_profile
+
 		# handle based on mode
 		if self.mode == MODE_PLAY:
 			# ^X
 			if c == 24:
-				self.save('.' + str(round(time.time()*1000)))
+				self.add_snapshot('new_game')
 				self.state = State(self.version)
 				self.init_level()
 				self.set_message("New game!")
@@ -274,16 +277,27 @@ class Game:
 				self.mode = MODE_SHOP
 				self.set_message("[j] Down [k] Up [b] Buy [s] Cancel")
 			elif c == ord('u') or c == ord('1'):
-				if self.buy_upgrade(self.state.damage, self.state.damage_increase.value) == False:
-					self.penalize()
+				self.buy_presses(self.state.damage, self.state.damage_increase.value, count)
 			elif c == ord('i') or c == ord('2'):
 				if 'can_upgrade_damage_increase' in self.state.perks:
-					if self.buy_upgrade(self.state.damage_increase, self.state.damage_increase_amount.value) == False:
-						self.penalize()
+					self.buy_presses(self.state.damage_increase, self.state.damage_increase_amount.value, count)
 			elif c == ord('o') or c == ord('3'):
 				if 'can_upgrade_attack_rate' in self.state.perks:
-					if self.buy_upgrade(self.state.attack_rate, self.state.attack_rate_increase.value) == False:
-						self.penalize()
+					self.buy_presses(self.state.attack_rate, self.state.attack_rate_increase.value, count)
+			elif c == ord('U'):
+				self.buy_max(self.state.damage, self.state.damage_increase.value)
+			elif c == ord('I'):
+				if 'can_upgrade_damage_increase' in self.state.perks:
+					self.buy_max(self.state.damage_increase, self.state.damage_increase_amount.value)
+			elif c == ord('O'):
+				if 'can_upgrade_attack_rate' in self.state.perks:
+					self.buy_max(self.state.attack_rate, self.state.attack_rate_increase.value)
+			elif c == ord('n'):
+				self.set_notation(NOTATIONS[(NOTATIONS.index(self.notation) + 1) % len(NOTATIONS)])
+				self.set_message("Showing " + self.notation + " numbers")
+			elif c == ord('h'):
+				self.history_tier = (self.history_tier + 1) % len(TIERS)
+				self.set_message("Showing history per " + TIER_NAMES[self.history_tier])
 			elif c == ord('Q'):
 				self.done = 1
 			elif c == ord('q') or escape:
@@ -327,13 +341,13 @@ class Game:
 				self.mode = MODE_PLAY
 				self.set_message("")
 				self.cursor = 0
-			elif c == 10 or c == ord('b'):
+			elif c == 10 or c == curses.KEY_ENTER or c == ord('b'):
 				self.buy_perk(self.cursor)
-			elif key_up or c == ord('j'):
+			elif c == curses.KEY_DOWN or c == ord('j'):
 				self.cursor += 1
 				if self.cursor > len(PERKS)-1:
 					self.cursor = len(PERKS)-1
-			elif key_down or c == ord('k'):
+			elif c == curses.KEY_UP or c == ord('k'):
 				self.cursor -= 1
 				if self.cursor < 0:
 					self.cursor = 0
@@ -345,21 +359,17 @@ class Game:
 				self.cursor = 0
 				self.state.builds[self.mode_build] = self.old_sequence
 				return
-			elif c == 10:
+			elif c == 10 or c == curses.KEY_ENTER:
 				self.mode = self.mode_previous
 				self.set_message("")
 				self.cursor = 0
-			elif c == ord('x') or c == 127:
+			elif c == ord('x') or c == 127 or c == curses.KEY_BACKSPACE:
 				if len(build) > 0:
 					build = build[:-1]
 
 			if self.mode_build == 'upgrade':
-				if c == ord('u'):
-					build += 'u'
-				elif c == ord('i'):
-					build += 'i'
-				elif c == ord('o'):
-					build += 'o'
+				if c in (ord('u'), ord('i'), ord('o'), ord('U'), ord('I'), ord('O')):
+					build += chr(c)
 			elif self.mode_build == 'rebirth' or self.mode_build == 'evolve':
 				if c == ord('1'):
 					build += '1'
@@ -373,6 +383,42 @@ class Game:
 		if 0 and c != -1:
 			self.set_message("Command: " + str(curses.keyname(c)) + " " + str(c))
 
+	# buy one upgrade per key press, penalizing the presses gold didn't cover
+	def buy_presses(self, target, value, count):
+		bought = self.buy_upgrades(target, value, count)
+		for i in range(count - bought):
+			self.penalize()
+
+	def add_snapshot(self, kind):
+		try:
+			return self.store.add(kind, self.state, self.slot)
+		except OSError as e:
+			self.set_alert("Snapshot failed: " + str(e))
+
+	# snapshot the state after prestiges, at most once every PRESTIGE_INTERVAL, and once a day
+	def update_snapshots(self):
+		now = time.time()
+		if self.prestiges != self.snapshot_prestiges and now - self.snapshot_time >= PRESTIGE_INTERVAL:
+			self.snapshot_prestiges = self.prestiges
+			self.snapshot_time = now
+			self.add_snapshot('prestige')
+		elif now >= self.next_daily:
+			self.next_daily = now + DAILY_INTERVAL
+			self.add_snapshot('daily')
+
+	# switch how large numbers are shown, the cached sections hold text in the old one
+	def set_notation(self, notation):
+		self.notation = notation
+		self.sections = {}
+
+	# buy as many upgrades as gold allows
+	def buy_max(self, target, value):
+		count = self.buy_upgrades(target, value)
+		if count == 0:
+			self.penalize()
+		else:
+			self.set_message("Bought " + str(count) + " upgrades!")
+
 	def start(self):
 		self.state = State(self.version)
 		self.state.version = self.version
@@ -390,6 +436,66 @@ class Game:
 		self.penalties = 0
 		self.init_level()
 
+	# play from a save slot, start() loads it
+	def set_slot(self, slot):
+		self.slot = slot
+		self.store.import_backups(get_slot_path(self.save_path, slot), slot)
+		self.next_daily = self.store.get_last_time('daily', slot) + DAILY_INTERVAL
+
+	# let the player choose one of the save slots, or a new one. returns its name, or None to quit.
+	# only the summary headers are read, the chosen slot is loaded afterwards
+	def pick_slot(self, slots):
+		names = [ name for name, summary in slots ]
+		self.set_message("[j] Down [k] Up [Enter] Open [n] New Slot [q] Quit")
+		self.screen.refresh()
+		self.cursor = 0
+		slot = None
+		while slot is None:
+			self.draw_screen(self.get_slot_lines(slots))
+			for c in self.read_keys():
+				if c == curses.KEY_RESIZE:
+					self.handle_key(c)
+				elif c == curses.KEY_DOWN or c == ord('j'):
+					self.cursor = min(self.cursor + 1, len(slots) - 1)
+				elif c == curses.KEY_UP or c == ord('k'):
+					self.cursor = max(self.cursor - 1, 0)
+				elif c == 10 or c == curses.KEY_ENTER:
+					slot = names[self.cursor]
+				elif c == ord('n'):
+					number = 2
+					while 'slot' + str(number) in names:
+						number += 1
+					slot = 'slot' + str(number)
+				elif c == ord('q') or c == 27:
+					return None
+				if slot is not None:
+					break
+			time.sleep(PROGRESS_TIME)
+
+		self.cursor = 0
+		self.set_message("")
+
+		return slot
+
+	def get_slot_lines(self, slots):
+		data = []
+		data.append([curses.A_BOLD, "Slot", "Level", "Gold", "Rebirths", "Evolves", "Transforms", "Played", "Saved"])
+		for index, (name, summary) in enumerate(slots):
+			style = curses.A_NORMAL
+			if index == self.cursor:
+				style = self.get_color(2)
+			if summary is None:
+				data.append([style, name, "?", "", "", "", "", "", ""])
+				continue
+
+			saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(summary['saved']))
+			data.append([
+				style, name, str(summary['level']), format_number(summary['gold'], self.notation), str(summary['rebirths']),
+				str(summary['evolves']), str(summary['transforms']), self.get_time(summary['played']), saved,
+			])
+
+		return [ ("Save Slots", curses.A_BOLD), None ] + self.get_table_lines('slots', data)
+
 	def set_sequence_mode(self, build):
 		if 'auto_' + build not in self.state.perks:
 			return
@@ -398,7 +504,7 @@ class Game:
 		self.mode = MODE_SEQUENCE
 		message = ""
 		if build == 'upgrade':
-			message = "[u][i][o]"
+			message = "[u][i][o] Buy one [U][I][O] Buy max"
 		elif build == 'rebirth':
 			message = "[1][2]"
 		elif build == 'evolve':
@@ -408,472 +514,391 @@ class Game:
 		self.mode_build = build
 		self.old_sequence = self.get_build(self.mode_build)
 
-	def penalize(self):
-		self.penalties += 1
-		if self.penalties > PENALTIES_ALLOWED:
-			gold_lost = math.ceil(self.state.gold * 0.1)
-			if gold_lost > 0:
-				self.state.total['gold_lost'] += gold_lost
-				self.state.gold -= gold_lost
-				self.set_message("PENALIZED! YOU LOST " + str(gold_lost) + " GOLD!", curses.color_pair(2))
-		else:
-			self.set_message("PENALTIES LEFT: " + str(PENALTIES_ALLOWED - self.penalties), curses.color_pair(2))
+	def set_alert(self, message):
+		self.set_message(message, self.get_color(2))
 
-	def set_message(self, message, style=curses.A_NORMAL):
-		self.message = message
-		self.message_style = style
+	# style of a color pair set up in open()
+	def get_color(self, pair):
+		return curses.color_pair(pair)
 
-	def draw_message(self):
+	def draw_message(self, message=None, style=0):
 		self.win_message.erase()
 
+		if message is None:
+			message, style = self.message, self.message_style
 		try:
-			self.win_message.addstr(0, 0, self.message[:self.max_x], self.message_style)
+			self.win_message.addstr(0, 0, message[:self.max_x], style)
 		except:
 			pass
 
-	def draw_table(self, y, template, data):
-		for row in data:
-			try:
-				game.win_game.addstr(y, 0, template.format(*row[1:])[:self.max_x], row[0])
-			except:
-				pass
-
-			y += 1
-			if y >= self.max_y:
-				return y
-
-		return y
-
-	def draw(self):
-		state = game.state
-
-		# clear screen
-		self.draw_message()
-		game.win_game.erase()
+	# format a table, measuring columns only when a cell length changes and formatting only changed rows
+	def get_table_lines(self, name, data):
+		layout = self.layouts.get(name)
+		if layout is None:
+			layout = TableLayout()
+			self.layouts[name] = layout
+
+		lengths = [ tuple(map(len, row[1:])) for row in data ]
+		if lengths != layout.lengths:
+			layout.lengths = lengths
+			layout.template = get_template(tuple(get_max_sizes(data, 2)))
+			layout.rows = []
+
+		lines = []
+		for index, row in enumerate(data):
+			if index < len(layout.rows) and layout.rows[index][0] == row:
+				lines.append(layout.rows[index][1])
+				continue
+
+			line = (layout.template.format(*row[1:])[:self.max_x], row[0])
+			if index < len(layout.rows):
+				layout.rows[index] = (row, line)
+			else:
+				layout.rows.append((row, line))
+			lines.append(line)
+
+		return lines
+
+	# return the lines of a section, rebuilding them only when its key changes
+	def get_section(self, name, key, build):
+		section = self.sections.get(name)
+		if section is None or section[0] != key:
+			section = (key, build())
+			self.sections[name] = section
+
+		return section[1]
+
+	def get_upgrade_lines(self):
+		state = self.state
+		notation = self.notation
+		multiplier = state.cost['upgrade'].multiplier
+		damage = round(state.damage.value, 2)
+		damage_increase = round(state.damage_increase.value, 2)
+		damage_increase_amount = round(state.damage_increase_amount.value, 2)
+		attack_rate = round(state.attack_rate.value, 2)
+		attack_rate_increase = round(state.attack_rate_increase.value, 2)
+		damage_cost = scale_cost(state.damage.cost, multiplier)
+		damage_increase_cost = scale_cost(state.damage_increase.cost, multiplier)
+		attack_rate_cost = scale_cost(state.attack_rate.cost, multiplier)
+
+		# determine dps increase data
+		dps_increase_header = ""
+		dps_increase_damage = ""
+		dps_increase_rate = ""
+		if 'show_dps_increase' in state.perks:
+			dps_increase_header = "DPS"
+			dps_increase_damage = format_number(round(damage_increase * state.attack_rate.value, 2), notation)
+			dps_increase_rate = format_number(round(damage * attack_rate_increase, 2), notation)
+
+		# draw perks
+		colors = [ curses.A_NORMAL, curses.A_BOLD ]
+		data = []
+		data.append([colors[1], 'Key', 'Upgrade', 'Base', 'Current', 'Increase', dps_increase_header, 'Cost'])
+		data.append([colors[state.gold >= damage_cost], '[u]', 'Damage', format_number(state.base['damage'], notation), format_number(damage, notation), format_number(damage_increase, notation), dps_increase_damage, format_number(damage_cost, notation) + 'g'])
+		if 'can_upgrade_damage_increase' in state.perks:
+			data.append([colors[state.gold >= damage_increase_cost], '[i]', 'Damage Increase', format_number(state.base['damage_increase'], notation), format_number(damage_increase, notation), format_number(damage_increase_amount, notation), '', format_number(damage_increase_cost, notation) + 'g'])
+		if 'can_upgrade_attack_rate' in state.perks:
+			data.append([colors[state.gold >= attack_rate_cost], '[o]', 'Attack Rate', format_number(state.base['attack_rate'], notation), format_number(attack_rate, notation), format_number(attack_rate_increase, notation), dps_increase_rate, format_number(attack_rate_cost, notation) + 'g'])
+		if 'can_rebirth' in state.perks:
+			data.append([colors[state.gold >= state.rebirth.cost], '[r]', 'Rebirths', '', str(state.rebirth.value), str(1), '', format_number(state.rebirth.cost, notation) + 'g'])
+		if 'can_evolve' in state.perks:
+			data.append([colors[state.rebirth.value >= state.evolve.cost], '[e]', 'Evolves', '', str(state.evolve.value), str(1), '', str(state.evolve.cost) + ' rebirths'])
+		if 'can_transform' in state.perks:
+			data.append([colors[state.evolve.value >= state.transform.cost], '[t]', 'Transforms', '', str(state.transform.value), str(1), '', str(state.transform.cost) + ' evolves'])
+		data.append([colors[0], '[s]', 'Shop', '', '', '', '', ''])
+
+		return self.get_table_lines('upgrades', data)
+
+	def get_stats_lines(self):
+		state = self.state
+		notation = self.notation
+		dps = round(state.damage.value * state.attack_rate.value, 2)
+		gold_lost = state.total['gold_lost']
+
+		data = []
+		data.append([curses.A_BOLD, 'Stats', 'Value'])
+		if 'show_dps' in state.perks:
+			data.append([curses.A_NORMAL, 'DPS', format_number(dps, notation)])
+		data.append([curses.A_NORMAL, 'Gold', format_number(state.gold, notation)])
+		if gold_lost > 0:
+			data.append([curses.A_NORMAL, 'Gold Lost', format_number(gold_lost, notation)])
+		if 'auto_upgrade' in state.perks:
+			next_sequence = self.get_next_sequence('upgrade')
+			if next_sequence != "":
+				data.append([curses.A_NORMAL, 'Next Upgrade', "'" + next_sequence + "' (" + str(state.sequence['upgrade']) + " of " + str(state.perks['auto_upgrade'] * SEQUENCE_INCREMENT) + ")"])
+		if 'auto_rebirth' in state.perks:
+			next_sequence = self.get_next_sequence('rebirth')
+			if next_sequence != "":
+				data.append([curses.A_NORMAL, 'Next Rebirth', "'" + next_sequence + "' (" + str(state.sequence['rebirth']) + " of " + str(state.perks['auto_rebirth'] * SEQUENCE_INCREMENT) + ")"])
+		if 'auto_evolve' in state.perks:
+			next_sequence = self.get_next_sequence('evolve')
+			if next_sequence != "":
+				data.append([curses.A_NORMAL, 'Next Evolve', "'" + next_sequence + "' (" + str(state.sequence['evolve']) + " of " + str(state.perks['auto_evolve'] * SEQUENCE_INCREMENT) + ")"])
+		if state.gold_multiplier != 1:
+			data.append([curses.A_NORMAL, 'Gold Multiplier', str(round(state.gold_multiplier, 2))])
+		if 'show_highest_level' in state.perks:
+			data.append([curses.A_NORMAL, 'Highest Level', str(state.highest['level'])])
+		if 'show_highest_dps' in state.perks:
+			data.append([curses.A_NORMAL, 'Highest DPS', format_number(state.highest['dps'], notation)])
+		if 'show_elapsed' in state.perks:
+			data.append([curses.A_NORMAL, 'Elapsed Time', self.get_time(state.total['time'])])
+
+		if 'show_total_upgrades' in state.perks:
+			data.append([curses.A_NORMAL, 'Total Upgrades', format_number(state.total['upgrade'], notation)])
+		if 'show_total_kills' in state.perks:
+			data.append([curses.A_NORMAL, 'Total Kills', format_number(state.total['kill'], notation)])
+		if 'show_total_gold' in state.perks:
+			data.append([curses.A_NORMAL, 'Total Gold', format_number(state.total['gold'], notation)])
+
+		#data.append([curses.A_NORMAL, 'Time Since', self.get_time(state.since['time'])])
+		#data.append([curses.A_NORMAL, 'Upgrades Since', str(state.since['upgrade'])])
+		#data.append([curses.A_NORMAL, 'Gold Since', str(state.since['gold'])])
+
+		#data.append([curses.A_NORMAL, 'Highest Rebirths', str(state.highest['rebirth'])])
+		#data.append([curses.A_NORMAL, 'Highest Evolves', str(state.highest['evolve'])])
+
+		return self.get_table_lines('stats', data)
+
+	def get_enemy_lines(self):
+		state = self.state
+
+		# draw health bar
+		health_bar_header = ""
+		health_bar_string = ""
+		if 'show_health_percent' in state.perks:
+			health_bars = int(HEALTH_WIDTH * (state.health / state.max_health))
+			health_bar_header = "Percent"
+			health_bar_string = ("#" * health_bars).ljust(HEALTH_WIDTH, "-")
+			health_bar_string = "%s %.2f%%" % (health_bar_string, 100 * state.health / state.max_health)
+
+		# draw enemy
+		data = []
+		data.append([curses.A_BOLD, 'Level', 'Health', 'Max Health', health_bar_header])
+		data.append([curses.A_NORMAL, str(state.level), format_number(int(state.health), self.notation), format_number(int(state.max_health), self.notation), health_bar_string])
+
+		return self.get_table_lines('enemy', data)
+
+	# sparklines of the history at the chosen resolution, newest on the right
+	def get_history_lines(self):
+		tier = self.history.tiers[self.history_tier]
+		labels = { 'dps' : 'DPS', 'gold' : 'Gold/s', 'level' : 'Level' }
+		width = max(0, self.max_x - 24)
+
+		lines = [ ("History per " + TIER_NAMES[self.history_tier] + " [h]", curses.A_BOLD) ]
+		for index, metric in enumerate(METRICS):
+			ring = tier.rings[index]
+			values = ring.get_values()[-width:] if width > 0 else []
+			last = format_number(round(ring.get_last(), 2), self.notation) if ring.count > 0 else ""
+			lines.append(("%-7s %s %s" % (labels[metric], get_sparkline(values), last), curses.A_NORMAL))
+
+		return lines
+
+	def get_option_lines(self, title, options, affordable, build, cancel):
+		lines = [ (title, curses.A_BOLD), None ]
+		if affordable:
+			for option in options:
+				lines.append((option, curses.A_NORMAL))
+
+		if 'auto_' + build in self.state.perks:
+			lines.append(("[3] Set " + build.title() + " Sequence", curses.A_NORMAL))
+
+		lines.append(None)
+		lines.append((cancel, curses.A_NORMAL))
+
+		return lines
+
+	def get_shop_lines(self):
+		ranks = self.get_perk_ranks()
+
+		# build upgrade list
+		data = []
+		data.append([curses.A_BOLD, "Rank", "Name", "Description", "Cost", "Level", "Rebirths", "Evolves"])
+		for index, perk in enumerate(PERKS):
+			rank = ranks[index]
+			cost = self.get_perk_cost(rank, index)
+
+			color = 3
+			if self.cursor == index:
+				if rank > 0:
+					color = 5
+				else:
+					color = 2
+			elif rank == perk.ranks:
+				color = 4
+			elif self.can_buy_perk(rank, index):
+				color = 1
+
+			data.append([self.get_color(color), str(rank) + "/" + str(perk.ranks), perk.label, perk.info, format_number(cost, self.notation) + 'g', str(perk.level), str(perk.rebirths), str(perk.evolves)])
+
+		return self.get_table_lines('shop', data)
+
+	def get_sequence_lines(self):
+		build = self.get_build(self.mode_build)
+		max_sequences = self.state.perks['auto_' + self.mode_build] * SEQUENCE_INCREMENT
+
+		return [
+			(self.mode_build.title() + " Sequence", curses.A_BOLD),
+			None,
+			(build, curses.A_NORMAL),
+			None,
+			("Used " + str(len(build)) + " of " + str(max_sequences), curses.A_BOLD),
+		]
+
+	# get the lines of the game window for the current mode
+	def get_lines(self):
+		state = self.state
+		perks = tuple(state.perks.items())
 
 		if self.mode == MODE_PLAY:
-
-			# precalculate stats
-			dps = round(state.damage.value * state.attack_rate.value, 2)
-			if dps > state.highest['dps']:
-				state.highest['dps'] = dps
-
-			gold = state.gold
-			gold_lost = state.total['gold_lost']
-			gold_multiplier = round(state.gold_multiplier, 2)
-			rebirths = state.rebirth.value
-			evolves = state.evolve.value
-			transforms = state.transform.value
-			damage = round(state.damage.value, 2)
-			damage_increase = round(state.damage_increase.value, 2)
-			damage_increase_amount = round(state.damage_increase_amount.value, 2)
-			attack_rate = round(state.attack_rate.value, 2)
-			attack_rate_increase = round(state.attack_rate_increase.value, 2)
-			damage_cost = int(state.damage.cost * state.cost['upgrade'].multiplier)
-			damage_increase_cost = int(state.damage_increase.cost * state.cost['upgrade'].multiplier)
-			damage_increase_amount_cost = int(state.damage_increase_amount.cost * state.cost['upgrade'].multiplier)
-			attack_rate_cost = int(state.attack_rate.cost * state.cost['upgrade'].multiplier)
-			attack_rate_increase_cost = int(state.attack_rate_increase.cost * state.cost['upgrade'].multiplier)
-			if 'auto_upgrade' in state.perks:
-				auto_upgrade_max = self.state.perks['auto_upgrade'] * SEQUENCE_INCREMENT
-				auto_upgrade_current = self.state.sequence['upgrade']
-			if 'auto_rebirth' in state.perks:
-				auto_rebirth_max = self.state.perks['auto_rebirth'] * SEQUENCE_INCREMENT
-				auto_rebirth_current = self.state.sequence['rebirth']
-			if 'auto_evolve' in state.perks:
-				auto_evolve_max = self.state.perks['auto_evolve'] * SEQUENCE_INCREMENT
-				auto_evolve_current = self.state.sequence['evolve']
-
-			# determine dps increase data
-			dps_increase_header = ""
-			dps_increase_damage = ""
-			dps_increase_rate = ""
-			if 'show_dps_increase' in state.perks:
-				dps_increase_header = "DPS"
-				dps_increase_damage = str(round(damage_increase * state.attack_rate.value, 2))
-				dps_increase_rate = str(round(damage * attack_rate_increase, 2))
-
-			# draw perks
-			colors = [ curses.A_NORMAL, curses.A_BOLD ]
-			data = []
-			data.append([colors[1], 'Key', 'Upgrade', 'Base', 'Current', 'Increase', dps_increase_header, 'Cost'])
-			data.append([colors[state.gold >= damage_cost], '[u]', 'Damage', str(state.base['damage']), str(damage), str(damage_increase), dps_increase_damage, str(damage_cost) + 'g'])
-			if 'can_upgrade_damage_increase' in state.perks:
-				data.append([colors[state.gold >= damage_increase_cost], '[i]', 'Damage Increase', str(state.base['damage_increase']), str(damage_increase), str(damage_increase_amount), '', str(damage_increase_cost) + 'g'])
-			if 'can_upgrade_attack_rate' in state.perks:
-				data.append([colors[state.gold >= attack_rate_cost], '[o]', 'Attack Rate', str(state.base['attack_rate']), str(attack_rate), str(attack_rate_increase), dps_increase_rate, str(attack_rate_cost) + 'g'])
-			if 'can_rebirth' in state.perks:
-				data.append([colors[state.gold >= state.rebirth.cost], '[r]', 'Rebirths', '', str(rebirths), str(1), '', str(state.rebirth.cost) + 'g'])
-			if 'can_evolve' in state.perks:
-				data.append([colors[state.rebirth.value >= state.evolve.cost], '[e]', 'Evolves', '', str(evolves), str(1), '', str(state.evolve.cost) + ' rebirths'])
-			if 'can_transform' in state.perks:
-				data.append([colors[state.evolve.value >= state.transform.cost], '[t]', 'Transforms', '', str(transforms), str(1), '', str(state.transform.cost) + ' evolves'])
-			data.append([colors[0], '[s]', 'Shop', '', '', '', '', ''])
-
-			sizes = get_max_sizes(data, 2)
-			y = 0
-			y = self.draw_table(y, "{0:%s} {1:%s} {2:%s} {3:%s} {4:%s} {5:%s} {6:%s}" % (*sizes,), data)
-			y += 1
-
-			# draw stats
-			data = []
-			data.append([curses.A_BOLD, 'Stats', 'Value'])
-			if 'show_dps' in state.perks:
-				data.append([curses.A_NORMAL, 'DPS', str(dps)])
-			data.append([curses.A_NORMAL, 'Gold', str(gold)])
-			if gold_lost > 0:
-				data.append([curses.A_NORMAL, 'Gold Lost', str(gold_lost)])
-			if 'auto_upgrade' in state.perks:
-				next_sequence = self.get_next_sequence('upgrade')
-				if next_sequence != "":
-					data.append([curses.A_NORMAL, 'Next Upgrade', "'" + next_sequence + "' (" + str(auto_upgrade_current) + " of " + str(auto_upgrade_max) + ")"])
-			if 'auto_rebirth' in state.perks:
-				next_sequence = self.get_next_sequence('rebirth')
-				if next_sequence != "":
-					data.append([curses.A_NORMAL, 'Next Rebirth', "'" + next_sequence + "' (" + str(auto_rebirth_current) + " of " + str(auto_rebirth_max) + ")"])
-			if 'auto_evolve' in state.perks:
-				next_sequence = self.get_next_sequence('evolve')
-				if next_sequence != "":
-					data.append([curses.A_NORMAL, 'Next Evolve', "'" + next_sequence + "' (" + str(auto_evolve_current) + " of " + str(auto_evolve_max) + ")"])
-			if state.gold_multiplier != 1:
-				data.append([curses.A_NORMAL, 'Gold Multiplier', str(gold_multiplier)])
-			if 'show_highest_level' in state.perks:
-				data.append([curses.A_NORMAL, 'Highest Level', str(state.highest['level'])])
-			if 'show_highest_dps' in state.perks:
-				data.append([curses.A_NORMAL, 'Highest DPS', str(state.highest['dps'])])
+			multiplier = state.cost['upgrade'].multiplier
+			key = (
+				perks, multiplier, state.base['damage'], state.base['damage_increase'], state.base['attack_rate'],
+				state.damage.value, state.damage.cost, state.damage_increase.value, state.damage_increase.cost, state.damage_increase_amount.value,
+				state.attack_rate.value, state.attack_rate.cost, state.attack_rate_increase.value,
+				state.rebirth.value, state.rebirth.cost, state.evolve.value, state.evolve.cost, state.transform.value, state.transform.cost,
+				state.gold >= scale_cost(state.damage.cost, multiplier), state.gold >= scale_cost(state.damage_increase.cost, multiplier),
+				state.gold >= scale_cost(state.attack_rate.cost, multiplier), state.gold >= state.rebirth.cost,
+			)
+			lines = list(self.get_section('upgrades', key, self.get_upgrade_lines))
+			lines.append(None)
+
+			elapsed = ''
 			if 'show_elapsed' in state.perks:
-				data.append([curses.A_NORMAL, 'Elapsed Time', self.get_time(state.total['time'])])
-
-			if 'show_total_upgrades' in state.perks:
-				data.append([curses.A_NORMAL, 'Total Upgrades', str(state.total['upgrade'])])
-			if 'show_total_kills' in state.perks:
-				data.append([curses.A_NORMAL, 'Total Kills', str(state.total['kill'])])
-			if 'show_total_gold' in state.perks:
-				data.append([curses.A_NORMAL, 'Total Gold', str(state.total['gold'])])
-
-			#data.append([curses.A_NORMAL, 'Time Since', self.get_time(state.since['time'])])
-			#data.append([curses.A_NORMAL, 'Upgrades Since', str(state.since['upgrade'])])
-			#data.append([curses.A_NORMAL, 'Gold Since', str(state.since['gold'])])
-
-			#data.append([curses.A_NORMAL, 'Highest Rebirths', str(state.highest['rebirth'])])
-			#data.append([curses.A_NORMAL, 'Highest Evolves', str(state.highest['evolve'])])
-
-			sizes = get_max_sizes(data, 2)
-			y = self.draw_table(y, "{0:%s} {1:%s}" % (*sizes,), data)
-			y += 1
-
-			# draw health bar
-			health_bar_header = ""
-			health_bar_string = ""
-			if 'show_health_percent' in state.perks:
-				health_bars = int(HEALTH_WIDTH * (state.health / state.max_health))
-				health_bar_header = "Percent"
-				health_bar_string = ("#" * health_bars).ljust(HEALTH_WIDTH, "-")
-				health_bar_string = "%s %.2f%%" % (health_bar_string, 100 * state.health / state.max_health)
-
-			# draw enemy
-			data = []
-			data.append([curses.A_BOLD, 'Level', 'Health', 'Max Health', health_bar_header])
-			data.append([curses.A_NORMAL, str(state.level), str(int(state.health)), str(int(state.max_health)), health_bar_string])
-
-			sizes = get_max_sizes(data, 2)
-			y = self.draw_table(y, "{0:%s} {1:%s} {2:%s} {3:%s}" % (*sizes,), data)
+				elapsed = self.get_time(state.total['time'])
+			# large totals are keyed by their shown text, so they only rebuild the table when it changes
+			notation = self.notation
+			key = (
+				perks, state.damage.value, state.attack_rate.value, format_number(state.gold, notation), state.total['gold_lost'], state.gold_multiplier,
+				tuple(state.sequence.values()), tuple(state.builds.values()), state.highest['level'], state.highest['dps'], elapsed,
+				state.total['upgrade'], format_number(state.total['kill'], notation), format_number(state.total['gold'], notation),
+			)
+			lines.extend(self.get_section('stats', key, self.get_stats_lines))
+			lines.append(None)
+
+			key = ('show_health_percent' in state.perks, state.level, state.health, state.max_health, notation)
+			lines.extend(self.get_section('enemy', key, self.get_enemy_lines))
+			lines.append(None)
+
+			# graphs only change when a sample closes
+			tier = self.history.tiers[self.history_tier]
+			key = (self.history_tier, tier.bucket, tier.rings[0].count, self.max_x, notation)
+			lines.extend(self.get_section('history', key, self.get_history_lines))
 
 		elif self.mode == MODE_REBIRTH:
-
-			try:
-				y = 0
-				game.win_game.addstr(y, 0, "Rebirth Options", curses.A_BOLD)
-				y += 1
-
-				if self.state.gold >= self.state.rebirth.cost:
-					y += 1
-					game.win_game.addstr(y, 0, "[1] Upgrade Damage Increase Amount by " + str(self.rebirth_values[0]))
-
-					y += 1
-					game.win_game.addstr(y, 0, "[2] Upgrade Attack Rate Increase by " + str(self.rebirth_values[1]))
-
-				if 'auto_upgrade' in state.perks:
-					y += 1
-					game.win_game.addstr(y, 0, "[3] Set Upgrade Sequence")
-
-				y += 2
-				game.win_game.addstr(y, 0, "[r] Cancel")
-			except:
-				pass
+			options = [
+				"[1] Upgrade Damage Increase Amount by " + str(self.rebirth_values[0]),
+				"[2] Upgrade Attack Rate Increase by " + str(self.rebirth_values[1]),
+			]
+			lines = self.get_option_lines("Rebirth Options", options, state.gold >= state.rebirth.cost, 'upgrade', "[r] Cancel")
 
 		elif self.mode == MODE_EVOLVE:
-
-			try:
-				y = 0
-				game.win_game.addstr(y, 0, "Evolve Options", curses.A_BOLD)
-				y += 1
-
-				if self.state.rebirth.value >= self.state.evolve.cost:
-					y += 1
-					game.win_game.addstr(y, 0, "[1] Upgrade Base Damage by " + str(self.evolve_values[0]))
-
-					y += 1
-					game.win_game.addstr(y, 0, "[2] Upgrade Base Attack Rate by " + str(self.evolve_values[1]))
-
-				if 'auto_rebirth' in state.perks:
-					y += 1
-					game.win_game.addstr(y, 0, "[3] Set Rebirth Sequence")
-
-				y += 2
-				game.win_game.addstr(y, 0, "[e] Cancel")
-			except:
-				pass
+			options = [
+				"[1] Upgrade Base Damage by " + str(self.evolve_values[0]),
+				"[2] Upgrade Base Attack Rate by " + str(self.evolve_values[1]),
+			]
+			lines = self.get_option_lines("Evolve Options", options, state.rebirth.value >= state.evolve.cost, 'rebirth', "[e] Cancel")
 
 		elif self.mode == MODE_TRANSFORM:
-
-			try:
-				y = 0
-				game.win_game.addstr(y, 0, "Transform Options", curses.A_BOLD)
-				y += 1
-
-				if self.state.evolve.value >= self.state.transform.cost:
-					y += 1
-					game.win_game.addstr(y, 0, "[1] Upgrade Base Damage Increase by " + str(self.transform_values[0]))
-
-					y += 1
-					game.win_game.addstr(y, 0, "[2] Upgrade Base Attack Rate Increase by " + str(self.transform_values[1]))
-
-				if 'auto_evolve' in state.perks:
-					y += 1
-					game.win_game.addstr(y, 0, "[3] Set Evolve Sequence")
-
-				y += 2
-				game.win_game.addstr(y, 0, "[t] Cancel")
-			except:
-				pass
+			options = [
+				"[1] Upgrade Base Damage Increase by " + str(self.transform_values[0]),
+				"[2] Upgrade Base Attack Rate Increase by " + str(self.transform_values[1]),
+			]
+			lines = self.get_option_lines("Transform Options", options, state.evolve.value >= state.transform.cost, 'evolve', "[t] Cancel")
 
 		elif self.mode == MODE_SHOP:
+			lines = [ ("Shop", curses.A_BOLD), None, ("You have " + format_number(state.gold, self.notation) + " gold", curses.A_NORMAL), None ]
+
+			# affordability only changes when a perk threshold is crossed
+			ranks = tuple(self.get_perk_ranks())
+			if ranks != self.shop_ranks:
+				self.shop_ranks = ranks
+				self.shop_costs = self.get_perk_thresholds(ranks)
+			key = (
+				ranks, self.cursor, bisect.bisect_right(self.shop_costs, state.gold), bisect.bisect_right(PERK_LEVELS, state.level),
+				bisect.bisect_right(PERK_REBIRTHS, state.rebirth.value), bisect.bisect_right(PERK_EVOLVES, state.evolve.value),
+			)
+			lines.extend(self.get_section('shop', key, self.get_shop_lines))
 
-			try:
-				y = 0
-				game.win_game.addstr(y, 0, "Shop", curses.A_BOLD)
-
-				y += 2
-				game.win_game.addstr(y, 0, "You have " + str(state.gold) + " gold")
-			except:
-				pass
-
-			y += 2
-
-			# build upgrade list
-			index = 0
-			data = []
-			data.append([curses.A_BOLD, "Rank", "Name", "Description", "Cost", "Level", "Rebirths", "Evolves"])
-			for perk in PERKS:
-
-				rank = 0
-				if perk.name in self.state.perks:
-					rank = self.state.perks[perk.name]
-
-				cost = self.get_perk_cost(rank, index)
-
-				color = 3
-				if self.cursor == index:
-					if perk.name in self.state.perks:
-						color = 5
-					else:
-						color = 2
-				elif rank == perk.ranks:
-					color = 4
-				elif self.can_buy_perk(rank, index):
-					color = 1
-
-				data.append([curses.color_pair(color), str(rank) + "/" + str(perk.ranks), perk.label, perk.info, str(cost) + 'g', str(perk.level), str(perk.rebirths), str(perk.evolves)])
-				index += 1
-
-			# draw upgrade table
-			sizes = get_max_sizes(data, 2)
-			y = self.draw_table(y, "{0:%s} {1:%s} {2:%s} {3:%s} {4:%s} {5:%s} {6:%s}" % (*sizes,), data)
-			y += 1
 		elif self.mode == MODE_SEQUENCE:
-			build = self.get_build(self.mode_build)
-			rank = self.state.perks['auto_' + self.mode_build]
-			max_sequences = rank * SEQUENCE_INCREMENT
-
-			try:
-				y = 0
-				game.win_game.addstr(y, 0, self.mode_build.title() + " Sequence", curses.A_BOLD)
+			key = (self.mode_build, self.get_build(self.mode_build), self.state.perks['auto_' + self.mode_build])
+			lines = self.get_section('sequence', key, self.get_sequence_lines)
 
-				y += 2
-				game.win_game.addstr(y, 0, build, curses.A_NORMAL)
+		return lines
 
-				y += 2
-				game.win_game.addstr(y, 0, "Used " + str(len(build)) + " of " + str(max_sequences), curses.A_BOLD)
+	# write the lines that differ from the last frame
+	def draw_lines(self, lines):
+		drawn = self.drawn_lines
+		for y in range(min(max(len(lines), len(drawn)), self.max_y - 1)):
+			line = None
+			if y < len(lines):
+				line = lines[y]
+			if y < len(drawn) and drawn[y] == line:
+				continue
 
+			try:
+				self.win_game.move(y, 0)
+				self.win_game.clrtoeol()
+				if line is not None:
+					self.win_game.addstr(y, 0, line[0][:self.max_x], line[1])
 			except:
 				pass
 
-		self.win_game.noutrefresh()
-		self.win_message.noutrefresh()
-		curses.doupdate()
-
-	def get_next_sequence(self, name):
-		build = self.get_build(name)
-		sequence = self.state.sequence[name]
-		if sequence < len(build):
-			return build[sequence]
-
-		return ""
-
-	def get_build(self, build):
-		if build not in self.state.builds:
-			self.state.builds[build] = ""
-
-		return self.state.builds[build]
-
-	def get_perk_cost(self, rank, index):
-		perk = PERKS[index]
-		if rank >= perk.ranks:
-			rank = perk.ranks-1
-
-		return int(perk.cost * math.pow(perk.cost_multiplier, rank))
-
-	def can_buy_perk(self, rank, index):
-		perk = PERKS[index]
-		if self.state.rebirth.value < perk.rebirths:
-			return False
-
-		if self.state.evolve.value < perk.evolves:
-			return False
-
-		if self.state.level < perk.level:
-			return False
-
-		return self.state.gold >= self.get_perk_cost(rank, index)
-
-	def buy_perk(self, index):
-		perk = PERKS[index]
-
-		# get existing upgrade
-		has_upgrade = False
-		rank = 0
-		next_rank = 1
-		if perk.name in self.state.perks:
-			has_upgrade = True
-			rank = self.state.perks[perk.name]
-			next_rank = rank + 1
-
-		# check buy conditions
-		if rank < perk.ranks and self.can_buy_perk(rank, index):
-			self.state.perks[perk.name] = next_rank
-			self.state.gold -= self.get_perk_cost(rank, index)
-			self.set_message("Bought " + perk.name)
-			if perk.name == "reduce_upgrade_price":
-				self.state.cost['upgrade'].multiplier = 1.0 - next_rank * 0.05
-
-	def buy_upgrade(self, target, value):
-		cost = int(target.cost * self.state.cost['upgrade'].multiplier)
-		if self.state.gold >= cost:
-			self.state.gold -= cost
-			self.state.total['upgrade'] += 1
-			self.state.since['upgrade'] += 1
-			target.buy(value)
-			self.penalties = 0
-			return True
-
-		return False
-
-	def buy_rebirth(self, option):
-		if option == '' or self.state.gold < self.state.rebirth.cost:
-			return False
-
-		self.state.rebirth.buy(1)
-		if self.state.rebirth.value > self.state.highest['rebirth']:
-			self.state.highest['rebirth'] = self.state.rebirth.value
-		old_state = self.state
-		self.state = State(self.version)
-		self.state.copy(old_state)
-		self.state.rebirth = old_state.rebirth
-		self.state.evolve = old_state.evolve
-		self.state.transform = old_state.transform
-		self.state.sequence['upgrade'] = 0
-		self.state.sequence['rebirth'] = self.state.sequence['rebirth'] + 1
-		self.state.base['damage'] = old_state.base['damage']
-		self.state.base['damage_increase'] = old_state.base['damage_increase']
-		self.state.base['attack_rate'] = old_state.base['attack_rate']
-		self.state.base['attack_rate_increase'] = old_state.base['attack_rate_increase']
-		self.state.calc()
-		self.state.damage_increase_amount.value = old_state.damage_increase_amount.value
-		self.state.attack_rate_increase.value = old_state.attack_rate_increase.value
-		if option == '1':
-			self.state.damage_increase_amount.value += self.rebirth_values[0]
-		elif option == '2':
-			self.state.attack_rate_increase.value += self.rebirth_values[1]
+		self.drawn_lines = lines
 
-		self.init_level()
-		self.penalties = 0
-		self.save()
-		self.mode = MODE_PLAY
+	def track_dps(self):
+		state = self.state
+		dps = round(state.damage.value * state.attack_rate.value, 2)
+		if dps > state.highest['dps']:
+			state.highest['dps'] = dps
 
-		return True
-
-	def buy_evolve(self, option):
-		if option == '' or self.state.rebirth.value < self.state.evolve.cost:
-			return False
-
-		self.state.evolve.buy(1)
-		if self.state.evolve.value > self.state.highest['evolve']:
-			self.state.highest['evolve'] = self.state.evolve.value
-		old_state = self.state
-		self.state = State(self.version)
-		self.state.copy(old_state)
-		self.state.evolve = old_state.evolve
-		self.state.transform = old_state.transform
-		self.state.sequence['upgrade'] = 0
-		self.state.sequence['rebirth'] = 0
-		self.state.sequence['evolve'] = self.state.sequence['evolve'] + 1
-		self.state.base['damage'] = old_state.base['damage']
-		self.state.base['damage_increase'] = old_state.base['damage_increase']
-		self.state.base['attack_rate'] = old_state.base['attack_rate']
-		self.state.base['attack_rate_increase'] = old_state.base['attack_rate_increase']
-		if option == '1':
-			self.state.base['damage'] += self.evolve_values[0]
-		elif option == '2':
-			self.state.base['attack_rate'] += self.evolve_values[1]
-
-		self.state.calc()
-		self.penalties = 0
-		self.init_level()
-		self.save()
-		self.mode = MODE_PLAY
-
-		return True
+	def draw(self):
+		self.recorder.add_draw()
+		self.track_dps()
+
+		# start over after a resize
+		size = (self.max_y, self.max_x)
+		if size != self.drawn_size:
+			self.drawn_size = size
+			self.drawn_lines = []
+			self.drawn_message = None
+			self.sections = {}
+			self.layouts = {}
+			self.win_game.erase()
+
+		lines = self.get_lines()
+		message = (self.message, self.message_style)
+		if self.show_profile:
+			message = (self.profiler.get_summary(), curses.A_NORMAL)
+
+		# skip the frame when nothing visible changed
+		if lines == self.drawn_lines and message == self.drawn_message:
+			return
 
-	def buy_transform(self, option):
-		if option == '' or self.state.evolve.value < self.state.transform.cost:
-			return False
+		if lines != self.drawn_lines:
+			self.draw_lines(lines)
+			self.win_game.noutrefresh()
 
-		if option == '1':
-			self.state.base['damage_increase'] += self.transform_values[0]
-		elif option == '2':
-			self.state.base['attack_rate_increase'] += self.transform_values[1]
+		if message != self.drawn_message:
+			self.drawn_message = message
+			self.draw_message(*message)
+			self.win_message.noutrefresh()
 
-		self.state.transform.buy(1)
-		if self.state.transform.value > self.state.highest['transform']:
-			self.state.highest['transform'] = self.state.transform.value
-		old_state = self.state
-		self.state = State(self.version)
-		self.state.copy(old_state)
-		self.state.transform = old_state.transform
-		self.state.sequence['upgrade'] = 0
-		self.state.sequence['rebirth'] = 0
-		self.state.sequence['evolve'] = 0
-		self.state.sequence['transform'] = old_state.sequence['transform'] + 1
-		self.state.base['damage_increase'] = old_state.base['damage_increase']
-		self.state.base['attack_rate_increase'] = old_state.base['attack_rate_increase']
-		self.state.calc()
-		self.penalties = 0
-		self.init_level()
-		self.save()
-		self.mode = MODE_PLAY
+		curses.doupdate()
 
-		return True
+	# real seconds until something on screen can change, capped so resizes are noticed
+	# and floored so fast attack rates don't draw more than max_fps
+	def get_wait_time(self):
+		wait = self.get_next_event() / TIME_SCALE
+		if self.mode == MODE_PLAY and 'show_elapsed' in self.state.perks:
+			elapsed = self.state.total['time']
+			step = 1
+			if elapsed >= 86400:
+				step = 3600
+			elif elapsed >= 60:
+				step = 60
+			wait = min(wait, (step - elapsed % step) / TIME_SCALE)
+
+		return max(1.0 / self.max_fps, min(wait, MAX_WAIT_TIME))
 
 	def get_time(self, time):
 		if time < 60:
@@ -885,178 +910,249 @@ class Game:
 		else:
 			return str(int(time / 86400)) + "d" + str(int(time / 3600 % 24)) + "h"
 
-	def init_level(self):
-		self.state.max_health = int(math.pow(self.state.level, self.state.cost['health'].growth) * self.state.cost['health'].multiplier)
-		if self.state.health <= 0:
-			self.state.health = self.state.max_health
-
-	def update_health(self):
-		if self.state.health <= 0:
-			if self.update_reward():
-				self.state.level += 1
-				if self.state.level > self.state.highest['level']:
-					self.state.highest['level'] = self.state.level
-
-				self.init_level()
-
-	def get_reward(self, multiplier):
-		return int(self.state.level * multiplier)
-
-	# return true if not restarting
-	def update_reward(self):
-		total_reward = self.get_reward(self.state.gold_multiplier)
-
-		if not self.fast_forwarding and self.mode == MODE_PLAY:
-			self.set_message("You earned " + str(total_reward) + " gold!")
-
-		self.state.gold += total_reward
-		self.state.total['gold'] += total_reward
-		self.state.since['gold'] += total_reward
-		self.state.total['kill'] += 1
-
-		# handle auto upgrades
-		if self.mode == MODE_PLAY:
-			command = self.get_next_sequence('upgrade')
-			bought = False
-			if command == 'u':
-				bought = self.buy_upgrade(self.state.damage, self.state.damage_increase.value)
-			elif command == 'i':
-				if 'can_upgrade_damage_increase' in self.state.perks:
-					bought = self.buy_upgrade(self.state.damage_increase, self.state.damage_increase_amount.value)
-			elif command == 'o':
-				if 'can_upgrade_attack_rate' in self.state.perks:
-					bought = self.buy_upgrade(self.state.attack_rate, self.state.attack_rate_increase.value)
-
-			if bought:
-				self.state.sequence['upgrade'] += 1
-
-			# handle auto rebirths
-			command = self.get_next_sequence('rebirth')
-			bought_rebirth = self.buy_rebirth(command)
-
-			# handle auto evolve
-			command = self.get_next_sequence('evolve')
-			bought_evolve = self.buy_evolve(command)
-
-			if bought_evolve or bought_rebirth:
-				return False
-
-		return True
-
-	def fast_forward(self, time):
-
-		# draw message
-		self.set_message("Fast forwarding for " + str(int(time)) + " seconds...")
+	# move the game on by frametime, jumping from one kill or autosave to the next
+	# so the work follows what happens instead of how long it took. returns the kills made
+	def play(self, frametime):
+		kills = self.state.total['kill']
+		self.advance(frametime)
+		self.recorder.add_advance(frametime)
+		self.history.record(self.state)
+		self.update_snapshots()
+
+		return self.state.total['kill'] - kills
+
+	# play offline time in the background while showing its progress. enter keeps what's been played
+	# so far and escape drops it, either way the game starts from there without waiting for the rest
+	def fast_forward(self, idle_time):
+		catch_up = CatchUp(self.state, idle_time, self.approximate, self.history.copy())
+		self.set_message("[Enter] Keep progress so far [Esc] Skip catching up")
+		keep = True
+		catch_up.thread.join(PROGRESS_TIME)
+
+		# reading keys refreshes the main screen, clear it first so that doesn't wipe the progress
+		self.screen.refresh()
+		while not catch_up.finished:
+			self.draw_catch_up(catch_up)
+			for c in self.read_keys():
+				if c == curses.KEY_RESIZE:
+					self.handle_key(c)
+				elif c == 10 or c == curses.KEY_ENTER:
+					catch_up.stop()
+				elif c == 27:
+					catch_up.stop()
+					keep = False
+			catch_up.thread.join(PROGRESS_TIME)
+		catch_up.thread.join()
+		self.finish_catch_up(catch_up, keep, idle_time)
+
+	# start from where catching up stopped, or from the save when the progress isn't kept
+	def finish_catch_up(self, catch_up, keep, idle_time):
+		if catch_up.error is not None:
+			self.set_alert("Catching up failed: " + str(catch_up.error))
+		elif keep:
+			simulation = catch_up.simulation
+			self.state = simulation.state
+			self.attack_timer = simulation.attack_timer
+			self.save_timer = simulation.save_timer
+			self.prestiges += simulation.prestiges
+			self.history = catch_up.history
+			self.set_message("")
+			if catch_up.stopped:
+				self.set_message("Caught up on " + self.get_time(catch_up.played) + " of " + self.get_time(idle_time) + " away")
+		else:
+			self.set_message("Skipped catching up on " + self.get_time(idle_time) + " away")
+
+	def draw_catch_up(self, catch_up):
+		self.draw_screen(self.get_catch_up_lines(catch_up))
+
+	def get_catch_up_lines(self, catch_up):
+		bars = int(HEALTH_WIDTH * catch_up.played / catch_up.total)
+		eta = catch_up.get_eta()
+		return [
+			("Catching up on " + self.get_time(catch_up.total) + " away", curses.A_BOLD),
+			None,
+			("%s %.2f%%" % (("#" * bars).ljust(HEALTH_WIDTH, "-"), 100 * catch_up.played / catch_up.total), curses.A_NORMAL),
+			(self.get_time(catch_up.played) + " played, " + self.get_time(catch_up.get_rate()) + " per second", curses.A_NORMAL),
+			("About " + (self.get_time(eta) if eta is not None else "?") + " left", curses.A_NORMAL),
+		]
+
+	# draw lines and the message outside of the game screens
+	def draw_screen(self, lines):
+		self.draw_lines(lines)
+		self.win_game.noutrefresh()
 		self.draw_message()
 		self.win_message.noutrefresh()
 		curses.doupdate()
 
-		# simulate game
-		self.fast_forwarding = True
-		self.update(time)
-		self.fast_forwarding = False
-		self.set_message("")
-
-	def update(self, frametime):
-		self.state.total['time'] += frametime
-		self.state.since['time'] += frametime
-
-		# handle autosave
-		self.save_timer += frametime
-		if self.save_timer >= AUTOSAVE_TIME:
-			self.save_timer = 0
-			self.save()
-
-		# make an attack
-		period = 1.0 / self.state.attack_rate.value
-		self.attack_timer += frametime
-		while self.attack_timer >= period:
-			self.attack_timer -= period
-			self.state.health -= self.state.damage.value
-			self.update_health()
-			period = 1.0 / self.state.attack_rate.value
-
 	def load(self):
 		try:
-			with open(game.save_path + game.save_file, 'rb') as f:
-				self.state = pickle.load(f)
+			with open(get_slot_path(self.save_path, self.slot), 'rb') as f:
+				data = f.read()
+			state = read_state(io.BytesIO(data))
 		except:
 			return
 
-		# check save version
-		if self.state.version != self.version:
-			os.rename(game.save_path + game.save_file, game.save_path + game.save_file + '.' + str(self.state.version))
+		# upgrade older saves, set aside ones from newer versions
+		try:
+			self.state = migrate_state(state)
+		except ValueError:
+			self.store.add_data('newer', data, { 'version' : state.version, 'slot' : self.slot })
 			self.state = State(self.version)
+			self.set_alert("Save from newer version " + str(state.version) + " moved to snapshots")
+		self.history = load_history(get_history_path(self.save_path, self.slot))
 
 		# fast forward
 		idle_time = time.time() - self.state.time
 		if idle_time > 0:
 			self.fast_forward(min(idle_time, MAX_IDLE_TIME))
 
-	def save(self, suffix=''):
+	def save(self):
 		if self.fast_forwarding:
 			return
 
-		self.state.time = time.time()
-		with open(game.save_path + game.save_file + suffix, 'wb') as f:
-			pickle.dump(self.state, f)
-
-PERKS = [
-	#     Max  Name                            Label                    Info                                                             Cost         Level   Reb  Ev   Cost Mult
-	Perk( 1,   "can_upgrade_damage_increase" , "Game is Hard I"       , "Allow Damage Increase to be upgraded"                         , 250        , 0,      0,   0,   0   ),
-	Perk( 1,   "can_upgrade_attack_rate"     , "Game is Hard II"      , "Allow Attack Rate to be upgraded"                             , 2000       , 0,      0,   0,   0   ),
-	Perk( 1,   "can_rebirth"                 , "Game is Hard III"     , "Allow Rebirthing"                                             , 20000      , 0,      0,   0,   0   ),
-	Perk( 1,   "can_evolve"                  , "Game is Hard IV"      , "Allow Evolving"                                               , 1000000    , 0,      0,   0,   0   ),
-	Perk( 1,   "can_transform"               , "Game is Hard V"       , "Allow Transforming"                                           , 100000000  , 0,      0,   15,  0   ),
-	Perk( 1,   "show_dps"                    , "Math is Hard I"       , "Show DPS"                                                     , 20000      , 0,      1,   0,   0   ),
-	Perk( 1,   "show_dps_increase"           , "Math is Hard II"      , "Show DPS increase next to upgrades"                           , 100000     , 0,      20,  0,   0   ),
-	Perk( 1,   "show_highest_level"          , "Memory is Hard I"     , "Show Highest Level"                                           , 50000      , 1000,   0,   1,   0   ),
-	Perk( 1,   "show_highest_dps"            , "Memory is Hard II"    , "Show Highest DPS"                                             , 100000     , 2000,   5,   1,   0   ),
-	Perk( 1,   "show_elapsed"                , "Memory is Hard III"   , "Show Elapsed Time"                                            , 150000     , 3000,   10,  5,   0   ),
-	Perk( 1,   "show_total_upgrades"         , "Counting is Hard I"   , "Show Total Upgrades"                                          , 10000000   , 10000,  0,   5,   0   ),
-	Perk( 1,   "show_total_kills"            , "Counting is Hard II"  , "Show Total Kills"                                             , 10000000   , 20000,  0,   10,  0   ),
-	Perk( 1,   "show_total_gold"             , "Counting is Hard III" , "Show Total Gold"                                              , 10000000   , 30000,  0,   15,  0   ),
-	Perk( 1,   "show_health_percent"         , "Reading is Hard I"    , "Show Health Percent"                                          , 500000     , 0,      1,   0,   0   ),
-	Perk( 10,  "reduce_upgrade_price"        , "Buying is Hard"       , "Reduce Upgrade Cost by 5% per Rank"                           , 1000000    , 0,      0,   10,  10  ),
-	Perk( 100, "auto_upgrade"                , "Upgrading is Hard"    , "Set an Upgrade Sequence on Rebirth"                           , 1000000    , 0,      0,   5,   2   ),
-	Perk( 100, "auto_rebirth"                , "Rebirthing is Hard"   , "Set a Rebirth Sequence on Evolve"                             , 10000000   , 0,      0,   10,  2   ),
-	Perk( 100, "auto_evolve"                 , "Evolving is Hard"     , "Set an Evolve Sequence on Transform"                          , 100000000  , 0,      0,   20,  2   ),
-]
-
-signal.signal(signal.SIGINT, signal_handler)
-
-try:
-	game = Game()
-except Exception as e:
-	curses.endwin()
-	print(str(e))
-	sys.exit(1)
+		if self.writer.error is not None:
+			self.set_alert("Save failed: " + str(self.writer.error))
+			self.writer.error = None
 
-timer = time.time()
-accumulator = 0.0
-game.start()
-while not game.done:
+		start = self.profiler.start()
+		self.state.time = time.time()
+		self.writer.save(get_slot_path(self.save_path, self.slot), self.state.snapshot())
+		self.writer.save_data(get_history_path(self.save_path, self.slot), self.history.encode(), sync=False)
+		self.profiler.stop('save', start)
 
-	# get frame time
-	frametime = (time.time() - timer)
+# poll for input and move the game on by the time each frame took
+def run_polling(game):
+	profiler = game.profiler
 	timer = time.time()
+	while not game.done:
+
+		# get frame time
+		frametime = (time.time() - timer)
+		timer = time.time()
+
+		# update input
+		start = profiler.start()
+		game.handle_input()
+		profiler.stop('input', start)
+
+		# update game
+		start = profiler.start()
+		kills = game.play(frametime * TIME_SCALE)
+		profiler.stop('update', start)
+
+		# draw
+		start = profiler.start()
+		game.draw()
+		profiler.stop('draw', start)
+		profiler.end_frame(game, kills)
+
+		# sleep
+		if frametime > 0:
+			extratime = 1.0 / game.max_fps - frametime
+			if extratime > 0:
+				start = profiler.start()
+				time.sleep(extratime)
+				profiler.stop('wait', start)
+
+# sleep until a key arrives or the next game event is due
+def run_events(game):
+	profiler = game.profiler
+	selector = selectors.DefaultSelector()
+	selector.register(sys.stdin, selectors.EVENT_READ)
+	timer = time.time()
+	while not game.done:
+		start = profiler.start()
+		game.draw()
+		profiler.stop('draw', start)
+
+		start = profiler.start()
+		selector.select(game.get_wait_time())
+		profiler.stop('wait', start)
+
+		# get frame time
+		frametime = (time.time() - timer)
+		timer = time.time()
+
+		# handle every waiting key, curses may have buffered more than select can see
+		start = profiler.start()
+		game.handle_input()
+		profiler.stop('input', start)
+
+		start = profiler.start()
+		kills = game.play(frametime * TIME_SCALE)
+		profiler.stop('update', start)
+		profiler.end_frame(game, kills)
+
+	selector.close()
+
+def get_slot_name(value):
+	if not re.match(r'^[\w-]+$', value):
+		raise argparse.ArgumentTypeError("slot names can only use letters, digits, - and _")
+
+	return value
+
+def main():
+	global TIME_SCALE
+
+	# headless commands that never start curses
+	if len(sys.argv) > 1 and sys.argv[1] == 'simulate':
+		simulate(sys.argv[2:])
+		return
+
+	parser = argparse.ArgumentParser(description="Terminal Heroes")
+	parser.add_argument('--slot', type=get_slot_name, help="save slot to play, created if it doesn't exist. with more than one slot the game asks otherwise")
+	parser.add_argument('--event-loop', action='store_true', help="sleep until the next key press or game event instead of polling")
+	parser.add_argument('--notation', choices=NOTATIONS, default=NOTATIONS[0], help="how to show numbers past a million, [n] switches while playing")
+	parser.add_argument('--approximate', action='store_true', help="keep gold and prices as floats once they pass 2**63 so late game arithmetic stays fast")
+	parser.add_argument('--time-scale', type=float, default=TIME_SCALE, help="game seconds that pass each real second")
+	parser.add_argument('--record', metavar='FILE', help="record key presses and frame times to FILE, play it back with replay.py")
+	parser.add_argument('--profile', metavar='FILE', help="time each part of a frame, [p] shows the timings, and write a chrome trace to FILE on exit")
+	args = parser.parse_args()
+	TIME_SCALE = args.time_scale
+
+	signal.signal(signal.SIGINT, signal_handler)
+
+	try:
+		game = Game()
+	except Exception as e:
+		curses.endwin()
+		print(str(e))
+		sys.exit(1)
+
+	if args.profile:
+		game.profiler = Profiler()
+	game.set_notation(args.notation)
+	game.approximate = args.approximate
+
+	# choose a slot, the picker only reads the summary header of each save
+	slot = args.slot
+	if slot is None:
+		slots = list_slots(game.save_path)
+		slot = DEFAULT_SLOT
+		if any(name != DEFAULT_SLOT for name, summary in slots):
+			slot = game.pick_slot(slots)
+	if slot is None:
+		game.writer.close()
+		curses.endwin()
+		return
+	game.set_slot(slot)
+
+	game.start()
+	if args.record:
+		game.recorder = Recorder(args.record, game)
+
+	# select() only works on sockets on windows
+	if args.event_loop and not sys.platform.startswith("win"):
+		run_events(game)
+	else:
+		run_polling(game)
+
+	game.writer.close()
+	game.recorder.close(game.state)
+	curses.endwin()
 
-	# update input
-	game.handle_input()
-
-	# update game
-	accumulator += frametime * TIME_SCALE
-	while accumulator >= game.timestep:
-		game.update(game.timestep)
-		accumulator -= game.timestep
-
-	# draw
-	game.draw()
-
-	# sleep
-	if frametime > 0:
-		extratime = 1.0 / game.max_fps - frametime
-		if extratime > 0:
-			time.sleep(extratime)
+	if args.profile:
+		game.profiler.write_trace(args.profile)
 
-curses.endwin()
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,180 @@
+import sys
+import math
+import array
+import struct
+
+MAGIC = b'THHS'
+FORMAT_VERSION = 1
+HISTORY_EXTENSION = '.history'
+MAX_FLOAT = sys.float_info.max
+METRICS = [ 'dps', 'gold', 'level' ]
+
+# seconds each sample covers and how many samples are kept, from finest to coarsest
+TIERS = [ (1, 120), (60, 120), (3600, 168) ]
+TIER_NAMES = [ 'second', 'minute', 'hour' ]
+SPARK_CHARS = "_.-:=+*#"
+
+HEADER = struct.Struct('<4sHH')
+LAST = struct.Struct('<ddd')
+TIER = struct.Struct('<qIII' + 'd' * len(METRICS))
+
+# fixed number of samples, the newest overwriting the oldest
+class Ring:
+
+	def __init__(self, size):
+		self.values = array.array('d', bytes(8 * size))
+		self.index = 0
+		self.count = 0
+
+	def append(self, value):
+		self.values[self.index] = value
+		self.index = (self.index + 1) % len(self.values)
+		self.count = min(self.count + 1, len(self.values))
+
+	# samples from oldest to newest
+	def get_values(self):
+		if self.count < len(self.values):
+			return self.values[:self.count]
+
+		return self.values[self.index:] + self.values[:self.index]
+
+	def get_last(self):
+		return self.values[self.index - 1]
+
+# averages of each metric over buckets of resolution seconds
+class Tier:
+
+	def __init__(self, resolution, size):
+		self.resolution = resolution
+		self.rings = [ Ring(size) for metric in METRICS ]
+		self.bucket = -1
+		self.samples = 0
+		self.sums = [ 0.0 ] * len(METRICS)
+
+	def add(self, time, values):
+		bucket = int(time // self.resolution)
+		if bucket != self.bucket and self.bucket >= 0:
+			self.close(bucket - self.bucket - 1)
+		self.bucket = bucket
+		for index, value in enumerate(values):
+			self.sums[index] += value
+		self.samples += 1
+
+	# push the average of the current bucket, and repeat it over buckets nothing was sampled in
+	def close(self, gap):
+		for index, ring in enumerate(self.rings):
+			average = self.sums[index] / self.samples
+			for i in range(min(gap, len(ring.values)) + 1):
+				ring.append(average)
+			self.sums[index] = 0.0
+		self.samples = 0
+
+# samples dps, gold income and level once per game second into tiers of fixed size rings, so
+# memory stays the same however long a session runs or however much time is fast forwarded
+class History:
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.tiers = [ Tier(resolution, size) for resolution, size in TIERS ]
+		self.last_time = 0.0
+		self.last_gold = 0.0
+		self.next_sample = 0.0
+
+	def copy(self):
+		history = History()
+		history.tiers = []
+		for tier in self.tiers:
+			copy = Tier(tier.resolution, len(tier.rings[0].values))
+			copy.bucket = tier.bucket
+			copy.samples = tier.samples
+			copy.sums = list(tier.sums)
+			for ring, ring_copy in zip(tier.rings, copy.rings):
+				ring_copy.values = array.array('d', ring.values)
+				ring_copy.index = ring.index
+				ring_copy.count = ring.count
+			history.tiers.append(copy)
+		history.last_time = self.last_time
+		history.last_gold = self.last_gold
+		history.next_sample = self.next_sample
+
+		return history
+
+	def record(self, state):
+		time = state.total['time']
+		if time < self.last_time:
+			self.reset()
+		if time < self.next_sample:
+			return
+
+		gold = to_float(state.total['gold'])
+		income = 0.0
+		if time > self.last_time and gold >= self.last_gold:
+			income = (gold - self.last_gold) / (time - self.last_time)
+		values = (to_float(state.damage.value * state.attack_rate.value), income, float(state.level))
+		for tier in self.tiers:
+			tier.add(time, values)
+
+		self.last_time = time
+		self.last_gold = gold
+		self.next_sample = math.floor(time) + 1
+
+	def encode(self):
+		parts = [ HEADER.pack(MAGIC, FORMAT_VERSION, len(self.tiers)), LAST.pack(self.last_time, self.last_gold, self.next_sample) ]
+		for tier in self.tiers:
+			ring = tier.rings[0]
+			parts.append(TIER.pack(tier.bucket, tier.samples, ring.index, ring.count, *tier.sums))
+			for ring in tier.rings:
+				parts.append(ring.values.tobytes())
+
+		return b''.join(parts)
+
+	def decode(self, data):
+		magic, format_version, count = HEADER.unpack_from(data, 0)
+		if magic != MAGIC or format_version != FORMAT_VERSION or count != len(TIERS):
+			raise ValueError("unknown history format")
+
+		offset = HEADER.size
+		self.last_time, self.last_gold, self.next_sample = LAST.unpack_from(data, offset)
+		offset += LAST.size
+		for tier in self.tiers:
+			values = TIER.unpack_from(data, offset)
+			offset += TIER.size
+			tier.bucket, tier.samples = values[0], values[1]
+			tier.sums = list(values[4:])
+			for ring in tier.rings:
+				size = len(ring.values) * ring.values.itemsize
+				ring.values = array.array('d', data[offset:offset + size])
+				ring.index, ring.count = values[2], values[3]
+				offset += size
+
+# values past what a float holds are kept at the largest one, the graphs only need their shape
+def to_float(value):
+	return float(min(value, MAX_FLOAT))
+
+def get_history_path(save_path, slot):
+	return save_path + slot + HISTORY_EXTENSION
+
+def load_history(path):
+	history = History()
+	try:
+		with open(path, 'rb') as f:
+			history.decode(f.read())
+	except (OSError, ValueError, struct.error):
+		history.reset()
+
+	return history
+
+# one character per value, scaled between the smallest and largest
+def get_sparkline(values):
+	if len(values) == 0:
+		return ""
+
+	low = min(values)
+	high = max(values)
+	if high <= low:
+		return SPARK_CHARS[0] * len(values)
+
+	scale = (len(SPARK_CHARS) - 1) / (high - low)
+	return "".join(SPARK_CHARS[int((value - low) * scale)] for value in values)
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import time
+import heapq
+import curses
+import signal
+import asyncio
+import argparse
+import game
+from game import Game, CatchUp
+from simulation import State
+from savefile import SaveWriter, get_save_path
+from snapshots import SnapshotStore, SNAPSHOT_DIR, DAILY_INTERVAL
+
+DEFAULT_PORT = 7017
+MAX_FPS = 30.0
+IDLE_TIME = 60
+IDLE_WAIT = 1.0
+REPORT_TIME = 60
+MAX_BUFFER = 65536
+MAX_NAME = 32
+
+# telnet commands, sent so clients switch to one character at a time without local echo
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SGA = 3
+NAWS = 31
+TELNET_SETUP = bytes([ IAC, WILL, ECHO, IAC, WILL, SGA, IAC, DO, NAWS ])
+
+CLEAR = "\x1b[0m\x1b[2J\x1b[?25l"
+RESTORE = "\x1b[0m\x1b[2J\x1b[H\x1b[?25h"
+
+# sgr codes of the color pairs game.py sets up
+COLORS = {
+	1 : '37;40',
+	2 : '37;41',
+	3 : '90;40',
+	4 : '32;40',
+	5 : '32;41',
+}
+
+def get_sgr(style):
+	codes = [ '0' ]
+	if style & curses.A_BOLD:
+		codes.append('1')
+	pair = (style & curses.A_COLOR) >> 8
+	if pair in COLORS:
+		codes.append(COLORS[pair])
+
+	return "\x1b[" + ";".join(codes) + "m"
+
+# take telnet commands out of data from a client, returns the rest and the last window size sent or None
+def split_telnet(data):
+	plain = bytearray()
+	size = None
+	index = 0
+	while index < len(data):
+		c = data[index]
+		if c != IAC:
+			plain.append(c)
+			index += 1
+			continue
+
+		command = data[index + 1] if index + 1 < len(data) else None
+		if command in (WILL, WONT, DO, DONT):
+			index += 3
+		elif command == SB:
+			end = data.find(bytes([ IAC, SE ]), index)
+			if end < 0:
+				break
+			if data[index + 2] == NAWS and end - index == 7:
+				size = (data[index + 3] << 8 | data[index + 4], data[index + 5] << 8 | data[index + 6])
+			index = end + 2
+		else:
+			index += 2
+
+	return bytes(plain), size
+
+# a game played over a socket. the screen goes out as ansi escapes, keys come in as bytes,
+# and the host decides when it moves on instead of a loop of its own
+class Session(Game):
+
+	def __init__(self, host, slot, stream, telnet):
+		self.host = host
+		Game.__init__(self)
+		self.slot = slot
+		self.next_daily = self.store.get_last_time('daily', slot) + DAILY_INTERVAL
+		self.stream = stream
+		self.telnet = telnet
+		self.max_x = 80
+		self.max_y = 24
+		self.max_fps = host.max_fps
+		self.keys = []
+		self.catch_up = None
+		self.idle_time = 0
+		self.keep = True
+		self.timer = time.time()
+		self.last_input = self.timer
+		self.next_tick = self.timer
+		self.ticks = 0
+		self.tick_time = 0.0
+		self.max_tick_time = 0.0
+		self.sent = 0
+
+	# saves and snapshots are shared by every session of the host, the store keeps each slot's snapshots apart
+	def open(self):
+		self.save_path = self.host.save_path
+		self.writer = self.host.writer
+		self.store = self.host.store
+
+	def get_color(self, pair):
+		return pair << 8
+
+	def start(self):
+		self.state = State(self.version)
+		self.state.calc()
+		self.load()
+		self.penalties = 0
+		self.init_level()
+
+	# catch up in the background while the host goes on with other sessions
+	def fast_forward(self, idle_time):
+		self.catch_up = CatchUp(self.state, idle_time, self.approximate, self.history.copy())
+		self.idle_time = idle_time
+		self.keep = True
+		self.set_message("[Enter] Keep progress so far [Esc] Skip catching up")
+
+	def is_active(self, now):
+		return now - self.last_input < self.host.idle_time
+
+	# decode bytes from the client into keys. arrows become KEY_UP and KEY_DOWN, enter becomes 10,
+	# and telnet commands are dropped apart from window sizes
+	def add_data(self, data):
+		if self.telnet:
+			data, size = split_telnet(data)
+			if size is not None:
+				self.set_size(*size)
+
+		index = 0
+		while index < len(data):
+			c = data[index]
+			index += 1
+			if c == 27 and index < len(data):
+				if data[index] in b'[O':
+					end = index + 1
+					while end < len(data) and 0x20 <= data[end] < 0x40:
+						end += 1
+					if end >= len(data):
+						break
+					index = end + 1
+					if data[end] == ord('A'):
+						self.keys.append(curses.KEY_UP)
+					elif data[end] == ord('B'):
+						self.keys.append(curses.KEY_DOWN)
+					continue
+
+				# alt+key
+				c = data[index]
+				index += 1
+			elif c == 13:
+				c = 10
+				if index < len(data) and data[index] in (0, 10):
+					index += 1
+
+			self.keys.append(c)
+
+		self.last_input = time.time()
+
+	def set_size(self, max_x, max_y):
+		if max_x == 0 or max_y == 0:
+			return
+
+		self.max_x = max_x
+		self.max_y = max(2, max_y)
+
+	# tick() picks the result up once the current chunk is done, so the host never waits on it
+	def handle_catch_up_keys(self, keys):
+		for c in keys:
+			if c == 10:
+				self.catch_up.stop(False)
+			elif c == 27:
+				self.catch_up.stop(False)
+				self.keep = False
+
+	# handle waiting keys, move the game on to now and draw it. returns the real seconds until it needs to run again
+	def tick(self, now):
+		start = time.perf_counter()
+		keys = self.keys[:game.MAX_KEYS]
+		del self.keys[:game.MAX_KEYS]
+		frametime = now - self.timer
+		self.timer = now
+
+		if self.catch_up is not None:
+			self.handle_catch_up_keys(keys)
+			if self.catch_up.finished:
+				self.finish_catch_up(self.catch_up, self.keep, self.idle_time)
+				self.catch_up = None
+			wait = game.PROGRESS_TIME
+		else:
+			self.handle_keys(keys)
+			if not self.done:
+				self.play(frametime * game.TIME_SCALE)
+			wait = self.get_wait_time()
+
+		if not self.done:
+			self.draw()
+
+		elapsed = time.perf_counter() - start
+		self.ticks += 1
+		self.tick_time += elapsed
+		self.max_tick_time = max(self.max_tick_time, elapsed)
+
+		# sessions nobody's typed in for a while are only drawn once a second
+		if not self.is_active(now):
+			wait = max(wait, IDLE_WAIT)
+		if len(self.keys) > 0:
+			wait = 0
+
+		return wait
+
+	# send the rows that changed since the last frame, skipping frames while the client is behind
+	def draw(self):
+		self.track_dps()
+		if self.stream.transport.get_write_buffer_size() > MAX_BUFFER:
+			return
+
+		output = []
+		size = (self.max_y, self.max_x)
+		if size != self.drawn_size:
+			self.drawn_size = size
+			self.drawn_lines = []
+			self.drawn_message = None
+			self.sections = {}
+			self.layouts = {}
+			output.append(CLEAR)
+
+		if self.catch_up is not None:
+			lines = self.get_catch_up_lines(self.catch_up)
+		else:
+			lines = self.get_lines()
+		message = (self.message, self.message_style)
+		if lines == self.drawn_lines and message == self.drawn_message:
+			return
+
+		drawn = self.drawn_lines
+		for y in range(min(max(len(lines), len(drawn)), self.max_y - 1)):
+			line = None
+			if y < len(lines):
+				line = lines[y]
+			if y < len(drawn) and drawn[y] == line:
+				continue
+
+			output.append("\x1b[%d;1H\x1b[0m\x1b[K" % (y + 1))
+			if line is not None:
+				output.append(get_sgr(line[1]) + line[0][:self.max_x])
+		self.drawn_lines = lines
+
+		if message != self.drawn_message:
+			self.drawn_message = message
+			output.append("\x1b[%d;1H\x1b[0m\x1b[K" % self.max_y + get_sgr(message[1]) + message[0][:self.max_x - 1])
+
+		self.send(output)
+
+	def send(self, output):
+		data = "".join(output).encode()
+		self.stream.write(data)
+		self.sent += len(data)
+
+	# keep what's been caught up so far, saving now would otherwise drop the rest of the offline time
+	def save(self):
+		if self.catch_up is not None:
+			self.catch_up.stop()
+			self.finish_catch_up(self.catch_up, self.keep, self.idle_time)
+			self.catch_up = None
+		Game.save(self)
+
+	def close(self):
+		if self.catch_up is not None:
+			self.catch_up.stop(False)
+		try:
+			self.send([ RESTORE ])
+			self.stream.close()
+		except:
+			pass
+
+# many sessions in one process. each is run when its next event is due or when its player types,
+# so the host's work follows what players do and what's on their screens, not how many are connected
+class Host:
+
+	def __init__(self, save_path, max_fps=MAX_FPS, idle_time=IDLE_TIME):
+		self.save_path = save_path
+		if not os.path.exists(save_path):
+			os.makedirs(save_path)
+		self.writer = SaveWriter()
+		self.store = SnapshotStore(save_path + SNAPSHOT_DIR)
+		self.max_fps = max_fps
+		self.idle_time = idle_time
+		self.sessions = {}
+		self.clients = {}
+		self.queue = []
+		self.count = 0
+		self.wake = None
+		self.report_time = time.time()
+		self.report_cpu = time.process_time()
+
+	def schedule(self, session, wait):
+		session.next_tick = time.time() + wait
+		self.count += 1
+		heapq.heappush(self.queue, (session.next_tick, self.count, session))
+		if self.wake is not None:
+			self.wake.set()
+
+	# run sessions as they come due, queue entries left behind by an earlier tick are skipped
+	async def run(self):
+		self.wake = asyncio.Event()
+		while True:
+			now = time.time()
+			while len(self.queue) > 0 and self.queue[0][0] <= now:
+				next_tick, count, session = heapq.heappop(self.queue)
+				if next_tick != session.next_tick or self.sessions.get(session.slot) is not session:
+					continue
+				self.run_session(session, now)
+
+			wait = 1.0
+			if len(self.queue) > 0:
+				wait = min(wait, self.queue[0][0] - now)
+			self.wake.clear()
+			try:
+				await asyncio.wait_for(self.wake.wait(), max(0, wait))
+			except asyncio.TimeoutError:
+				pass
+
+	def run_session(self, session, now):
+		try:
+			wait = session.tick(now)
+		except Exception as e:
+			print(session.slot + ": " + str(e))
+			session.done = 1
+		if session.done:
+			self.end_session(session)
+		else:
+			self.schedule(session, wait)
+
+	def end_session(self, session):
+		if self.sessions.get(session.slot) is session:
+			del self.sessions[session.slot]
+		session.close()
+
+	# ask for a slot name, echoing it back since telnet clients leave echo to the host.
+	# returns the name and the window size the client sent meanwhile
+	async def read_slot(self, reader, writer, telnet):
+		name = b''
+		size = None
+		while True:
+			writer.write(b'\r\x1b[KSlot: ' + name)
+			data = await reader.read(256)
+			if not data:
+				return None, size
+
+			if telnet:
+				data, new_size = split_telnet(data)
+				size = new_size or size
+			for c in data:
+				if c == 13 or c == 10:
+					slot = name.decode()
+					if re.match(r'^[\w-]+$', slot):
+						return slot, size
+					name = b''
+				elif c == 127 or c == 8:
+					name = name[:-1]
+				elif c == 3 or c == 4:
+					return None, size
+				elif 0x20 < c < 0x7f and len(name) < MAX_NAME:
+					name += bytes([ c ])
+
+	async def handle_client(self, reader, writer, telnet):
+		task = asyncio.current_task()
+		self.clients[task] = writer
+		try:
+			await self.play_client(reader, writer, telnet)
+		finally:
+			del self.clients[task]
+
+	async def play_client(self, reader, writer, telnet):
+		if telnet:
+			writer.write(TELNET_SETUP)
+		slot, size = await self.read_slot(reader, writer, telnet)
+		if slot is None or slot in self.sessions:
+			if slot is not None:
+				writer.write(b'\r\nSlot ' + slot.encode() + b' is being played\r\n')
+			writer.close()
+			return
+
+		session = Session(self, slot, writer, telnet)
+		if size is not None:
+			session.set_size(*size)
+		self.sessions[slot] = session
+		session.start()
+		self.schedule(session, 0)
+
+		# keys run the session right away, without waiting for its next event
+		try:
+			while not session.done:
+				data = await reader.read(4096)
+				if not data:
+					break
+				session.add_data(data)
+				if self.sessions.get(slot) is session:
+					self.run_session(session, time.time())
+		except ConnectionError:
+			pass
+
+		# a dropped connection saves like quitting does
+		if self.sessions.get(slot) is session:
+			await self.save_session(session)
+
+	# save and close a session. a catch up is waited for off the loop so other sessions keep running meanwhile
+	async def save_session(self, session):
+		del self.sessions[session.slot]
+		if session.catch_up is not None:
+			session.catch_up.stop(False)
+			await asyncio.get_running_loop().run_in_executor(None, session.catch_up.thread.join)
+		session.save()
+		session.close()
+
+	# save and close every session, and let the connections wind down
+	async def close(self):
+		for session in list(self.sessions.values()):
+			await self.save_session(session)
+		self.writer.close()
+
+		for writer in self.clients.values():
+			writer.close()
+		if len(self.clients) > 0:
+			await asyncio.wait(list(self.clients), timeout=1.0)
+
+	# tick counts and costs of each session since the last report, and the host's cpu use over the same time
+	def report(self):
+		now = time.time()
+		cpu = time.process_time()
+		elapsed = max(now - self.report_time, 1e-9)
+		sessions = list(self.sessions.values())
+		active = sum(1 for session in sessions if session.is_active(now))
+		print("%d sessions, %d active, %.1f%% cpu" % (len(sessions), active, 100 * (cpu - self.report_cpu) / elapsed))
+		print("%-16s %-7s %8s %10s %10s %10s" % ("Slot", "State", "Ticks", "Avg ms", "Max ms", "Sent KB"))
+		for session in sorted(sessions, key=lambda session: -session.tick_time):
+			average = 1000 * session.tick_time / session.ticks if session.ticks > 0 else 0
+			state = "active" if session.is_active(now) else "idle"
+			print("%-16s %-7s %8d %10.3f %10.3f %10.1f" % (session.slot, state, session.ticks, average, 1000 * session.max_tick_time, session.sent / 1024))
+			session.ticks = 0
+			session.tick_time = 0.0
+			session.max_tick_time = 0.0
+			session.sent = 0
+		sys.stdout.flush()
+
+		self.report_time = now
+		self.report_cpu = cpu
+
+	async def run_reports(self, interval):
+		while True:
+			await asyncio.sleep(interval)
+			self.report()
+
+async def serve(host, args):
+	if args.unix:
+		server = await asyncio.start_unix_server(lambda reader, writer: host.handle_client(reader, writer, False), args.unix)
+	else:
+		server = await asyncio.start_server(lambda reader, writer: host.handle_client(reader, writer, True), args.bind, args.port)
+	for sock in server.sockets:
+		print("listening on " + str(sock.getsockname()))
+	sys.stdout.flush()
+
+	tasks = [ asyncio.ensure_future(host.run()) ]
+	if args.report > 0:
+		tasks.append(asyncio.ensure_future(host.run_reports(args.report)))
+
+	# stop on ctrl+c or SIGTERM, saving every session
+	stop = asyncio.Event()
+	loop = asyncio.get_running_loop()
+	for signal_number in (signal.SIGINT, signal.SIGTERM):
+		loop.add_signal_handler(signal_number, stop.set)
+	async with server:
+		await stop.wait()
+	for task in tasks:
+		task.cancel()
+	await host.close()
+
+def main():
+	parser = argparse.ArgumentParser(description="Host many games in one process, each player connects with telnet or over a unix socket and picks a slot")
+	parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="tcp port, clients connect with telnet")
+	parser.add_argument('--bind', default='127.0.0.1', help="address to listen on")
+	parser.add_argument('--unix', metavar='PATH', help="listen on a unix socket instead, connect with socat -,raw,echo=0 UNIX-CONNECT:PATH")
+	parser.add_argument('--save-path', help="directory for the slots, defaults to the game's")
+	parser.add_argument('--fps', type=float, default=MAX_FPS, help="most frames a second sent to each player")
+	parser.add_argument('--idle-time', type=float, default=IDLE_TIME, help="seconds without a key press before a player is only sent a frame a second")
+	parser.add_argument('--time-scale', type=float, default=game.TIME_SCALE, help="game seconds that pass each real second")
+	parser.add_argument('--report', type=float, default=REPORT_TIME, help="seconds between tick cost reports, 0 for none")
+	args = parser.parse_args()
+	game.TIME_SCALE = args.time_scale
+
+	save_path = get_save_path()
+	if args.save_path:
+		save_path = os.path.join(args.save_path, '')
+
+	host = Host(save_path, args.fps, args.idle_time)
+	try:
+		asyncio.run(serve(host, args))
+	except OSError as e:
+		print(str(e))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
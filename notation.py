@@ -0,0 +1,65 @@
+import math
+
+NOTATIONS = [ 'suffix', 'scientific', 'plain' ]
+SUFFIXES = [ '', 'K', 'M', 'B', 'T', 'Qa', 'Qi', 'Sx', 'Sp', 'Oc', 'No', 'Dc' ]
+SHORT_LIMIT = 1000000
+MAX_CACHE = 4096
+MAX_PLAIN_DIGITS = 100
+
+# formatted strings of large numbers for each notation, keyed by value
+caches = { notation : {} for notation in NOTATIONS }
+
+# mantissa in [1, 10) and exponent of a positive number. math.log10 reads big ints
+# from their top bits, so this costs the same however many digits the value has
+def split_number(value):
+	log = math.log10(value)
+	exponent = math.floor(log)
+	return 10 ** (log - exponent), exponent
+
+def format_scientific(value, digits=2):
+	mantissa, exponent = split_number(value)
+	if round(mantissa, digits) >= 10:
+		mantissa /= 10
+		exponent += 1
+
+	return "%.*fe%d" % (digits, mantissa, exponent)
+
+def format_suffix(value):
+	mantissa, exponent = split_number(value)
+	group = exponent // 3
+	scaled = mantissa * 10 ** (exponent % 3)
+	if round(scaled, 2) >= 1000:
+		scaled /= 1000
+		group += 1
+	if group >= len(SUFFIXES):
+		return format_scientific(value)
+
+	return "%.2f%s" % (scaled, SUFFIXES[group])
+
+# text for a number. values under SHORT_LIMIT are shown as they are, larger ones
+# are shortened by the notation and remembered so redrawing the same value is a lookup
+def format_number(value, notation='suffix'):
+	if -SHORT_LIMIT < value < SHORT_LIMIT:
+		return str(value)
+
+	cache = caches[notation]
+	text = cache.get(value)
+	if text is not None:
+		return text
+
+	if isinstance(value, float) and not math.isfinite(value):
+		text = str(value)
+	elif value < 0:
+		text = '-' + format_number(-value, notation)
+	elif notation == 'plain' and math.log10(value) < MAX_PLAIN_DIGITS:
+		text = '%d' % value
+	elif notation != 'suffix':
+		text = format_scientific(value)
+	else:
+		text = format_suffix(value)
+
+	if len(cache) >= MAX_CACHE:
+		cache.clear()
+	cache[value] = text
+
+	return text
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+import concurrent.futures
+from simulation import Simulation, SEQUENCE_INCREMENT
+from savefile import get_save_path, get_slot_path, load_state, save_state, DEFAULT_SLOT
+
+BUILDS = [ 'upgrade', 'rebirth', 'evolve' ]
+METRICS = [ 'gold', 'level', 'rebirths', 'evolves' ]
+
+worker_state = None
+worker_seconds = 0
+worker_metric = None
+
+def init_worker(state, seconds, metric):
+	global worker_state, worker_seconds, worker_metric
+	worker_state = state
+	worker_seconds = seconds
+	worker_metric = metric
+
+# play the worker's save with builds for the configured time and score it
+def evaluate_builds(builds):
+	simulation = Simulation(copy.deepcopy(worker_state))
+	simulation.fast_forwarding = True
+	simulation.state.builds.update(builds)
+	gold = simulation.state.total['gold']
+	simulation.advance(worker_seconds)
+
+	state = simulation.state
+	if worker_metric == 'gold':
+		return (state.total['gold'] - gold) / worker_seconds
+	elif worker_metric == 'level':
+		return state.highest['level']
+	elif worker_metric == 'rebirths':
+		return state.highest['rebirth']
+	elif worker_metric == 'evolves':
+		return state.highest['evolve']
+
+	raise ValueError("unknown metric " + worker_metric)
+
+# commands and maximum length of each build the save has unlocked
+def get_build_rules(state):
+	rules = {}
+	for name in BUILDS:
+		rank = state.perks.get('auto_' + name, 0)
+		if rank == 0:
+			continue
+
+		commands = '12'
+		if name == 'upgrade':
+			commands = 'u'
+			if 'can_upgrade_damage_increase' in state.perks:
+				commands += 'i'
+			if 'can_upgrade_attack_rate' in state.perks:
+				commands += 'o'
+
+		rules[name] = (commands, rank * SEQUENCE_INCREMENT)
+
+	return rules
+
+class Optimizer:
+
+	def __init__(self, state, rules, generator, population_size):
+		self.rules = rules
+		self.generator = generator
+		self.population_size = population_size
+		self.scores = {}
+		self.population = [ { name : state.builds.get(name, '') for name in rules } ]
+		while len(self.population) < population_size:
+			self.population.append(self.get_random())
+
+	def get_key(self, builds):
+		return tuple(builds[name] for name in sorted(builds))
+
+	def get_random(self):
+		builds = {}
+		for name, (commands, length) in self.rules.items():
+			builds[name] = ''.join(self.generator.choice(commands) for i in range(length))
+
+		return builds
+
+	def mutate(self, build, commands, length):
+		build = list(build)
+		choice = self.generator.random()
+		index = self.generator.randrange(len(build) + 1)
+		if choice < 0.5 and len(build) > 0:
+			build[min(index, len(build) - 1)] = self.generator.choice(commands)
+		elif choice < 0.75 and len(build) < length:
+			build.insert(index, self.generator.choice(commands))
+		elif len(build) > 0:
+			del build[min(index, len(build) - 1)]
+
+		return ''.join(build)
+
+	def breed(self, first, second):
+		builds = {}
+		for name, (commands, length) in self.rules.items():
+			split = self.generator.randrange(max(len(first[name]), len(second[name])) + 1)
+			build = first[name][:split] + second[name][split:]
+			if self.generator.random() < 0.8:
+				build = self.mutate(build, commands, length)
+			builds[name] = build[:length]
+
+		return builds
+
+	def get_ranking(self):
+		ranking = [ builds for builds in self.population if self.get_key(builds) in self.scores ]
+		ranking.sort(key=lambda builds: self.scores[self.get_key(builds)], reverse=True)
+		return ranking
+
+	# keep the best quarter and refill the population with their children
+	def next_generation(self):
+		elite = self.get_ranking()[:max(2, self.population_size // 4)]
+		self.population = list(elite)
+		seen = set(self.get_key(builds) for builds in self.population)
+		attempts = 0
+		while len(self.population) < self.population_size and attempts < self.population_size * 10:
+			attempts += 1
+			builds = self.breed(self.generator.choice(elite), self.generator.choice(elite))
+			key = self.get_key(builds)
+			if key not in seen:
+				seen.add(key)
+				self.population.append(builds)
+
+	# score the population in the pool, stopping at deadline
+	def evaluate(self, executor, deadline):
+		futures = {}
+		for builds in self.population:
+			key = self.get_key(builds)
+			if key not in self.scores:
+				futures[executor.submit(evaluate_builds, builds)] = key
+
+		done, pending = concurrent.futures.wait(futures, timeout=max(0, deadline - time.time()))
+		for future in pending:
+			future.cancel()
+		for future in done:
+			self.scores[futures[future]] = future.result()
+
+		return len(pending) == 0
+
+def optimize(state, seconds, metric, budget, workers, population_size, generator):
+	rules = get_build_rules(state)
+	if len(rules) == 0:
+		return None, None, 0
+
+	deadline = time.time() + budget
+	optimizer = Optimizer(state, rules, generator, population_size)
+	generations = 0
+	executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(state, seconds, metric))
+	try:
+		while optimizer.evaluate(executor, deadline) and time.time() < deadline:
+			generations += 1
+			optimizer.next_generation()
+	finally:
+
+		# don't wait on evaluations that missed the deadline
+		executor.shutdown(wait=False, cancel_futures=True)
+
+	ranking = optimizer.get_ranking()
+	if len(ranking) == 0:
+		return None, None, generations
+
+	best = ranking[0]
+	return best, optimizer.scores[optimizer.get_key(best)], generations
+
+def main():
+	parser = argparse.ArgumentParser(description="Search auto_upgrade, auto_rebirth and auto_evolve builds for a save, a running game saves over builds written while it plays")
+	parser.add_argument('file', nargs='?', help="save file, defaults to the save of --slot")
+	parser.add_argument('--slot', default=DEFAULT_SLOT, help="save slot to optimize")
+	parser.add_argument('--hours', type=float, default=24.0, help="simulated hours per candidate")
+	parser.add_argument('--metric', choices=METRICS, default='gold', help="gold per second, or highest level, rebirths or evolves")
+	parser.add_argument('--budget', type=float, default=60.0, help="wall-clock seconds to search for")
+	parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes, defaults to all cores")
+	parser.add_argument('--population', type=int, default=64, help="builds per generation")
+	parser.add_argument('--seed', type=int, help="random seed")
+	parser.add_argument('--dry-run', action='store_true', help="print the best builds without writing them to the save")
+	args = parser.parse_args()
+
+	save_file = args.file or get_slot_path(get_save_path(), args.slot)
+	try:
+		with open(save_file, 'rb') as f:
+			state = load_state(f)
+	except OSError as e:
+		print(str(e))
+		sys.exit(1)
+
+	best, score, generations = optimize(state, args.hours * 3600, args.metric, args.budget, args.workers, args.population, random.Random(args.seed))
+	if best is None:
+		print("Nothing to optimize, buy an auto_upgrade, auto_rebirth or auto_evolve perk first")
+		sys.exit(1)
+
+	print("Searched " + str(generations) + " generations, best " + args.metric + ": " + str(round(score, 2)))
+	for name in best:
+		print("%-8s '%s'" % (name, best[name]))
+
+	# the search can take minutes, only change the builds of whatever was saved meanwhile
+	if not args.dry_run:
+		try:
+			with open(save_file, 'rb') as f:
+				state = load_state(f)
+			state.builds.update(best)
+			save_state(save_file, state)
+		except OSError as e:
+			print(str(e))
+			sys.exit(1)
+		print("Wrote builds to " + save_file)
+
+if __name__ == '__main__':
+	main()
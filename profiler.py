@@ -0,0 +1,122 @@
+import json
+import time
+import collections
+
+PHASES = [ 'input', 'update', 'draw', 'save', 'wait' ]
+WINDOW = 600
+MAX_TRACE_EVENTS = 200000
+SUMMARY_TIME = 0.5
+
+def get_percentile(values, percent):
+	values = sorted(values)
+	index = min(len(values) - 1, int(len(values) * percent / 100.0))
+	return values[index]
+
+# stands in for Profiler when profiling is off, so timing a phase costs two empty calls
+class NullProfiler:
+
+	enabled = False
+
+	def start(self):
+		return 0
+
+	def stop(self, name, start):
+		pass
+
+	def end_frame(self, game, kills):
+		pass
+
+	def get_summary(self):
+		return ""
+
+	def write_trace(self, path):
+		pass
+
+# rolling timings of each phase of a frame, recorded as a chrome trace
+class Profiler:
+
+	enabled = True
+
+	def __init__(self):
+		self.origin = time.perf_counter()
+		self.samples = { name : collections.deque(maxlen=WINDOW) for name in PHASES + [ 'frame' ] }
+		self.kills = collections.deque(maxlen=WINDOW)
+		self.events = collections.deque(maxlen=MAX_TRACE_EVENTS)
+		self.frame_start = self.origin
+		self.rate_start = self.origin
+		self.rate_kills = None
+		self.rate_prestiges = None
+		self.rates = (0.0, 0.0)
+		self.writer_stats = None
+		self.summary = ""
+		self.summary_time = 0
+
+	def start(self):
+		return time.perf_counter()
+
+	def stop(self, name, start):
+		duration = time.perf_counter() - start
+		self.samples[name].append(duration)
+		self.events.append((name, start, duration))
+
+	# close the current frame, sampling kill and prestige rates and the save writer about once a second
+	def end_frame(self, game, kills):
+		now = time.perf_counter()
+		self.stop('frame', self.frame_start)
+		self.frame_start = now
+		self.kills.append(kills)
+
+		kills = game.state.total['kill']
+		if self.rate_kills is None or kills < self.rate_kills:
+			self.rate_start = now
+			self.rate_kills = kills
+			self.rate_prestiges = game.prestiges
+		elif now - self.rate_start >= 1.0:
+			elapsed = now - self.rate_start
+			self.rates = ((kills - self.rate_kills) / elapsed, (game.prestiges - self.rate_prestiges) / elapsed)
+			self.events.append(('rates', now, self.rates))
+			self.writer_stats = game.writer.get_stats()
+			self.events.append(('writer', now, self.writer_stats))
+			self.rate_start = now
+			self.rate_kills = kills
+			self.rate_prestiges = game.prestiges
+
+	def get_percentiles(self, values):
+		return [ get_percentile(values, percent) for percent in (50, 95, 99) ]
+
+	# one line of p50/p95/p99 in milliseconds, rebuilt a few times a second so it stays readable
+	def get_summary(self):
+		now = time.perf_counter()
+		if now - self.summary_time < SUMMARY_TIME:
+			return self.summary
+
+		self.summary_time = now
+		parts = []
+		for name in [ 'frame' ] + PHASES:
+			if len(self.samples[name]) > 0:
+				parts.append(name + " " + "/".join("%.2f" % (value * 1000) for value in self.get_percentiles(self.samples[name])))
+		if len(self.kills) > 0:
+			parts.append("kills/frame " + "/".join(str(value) for value in self.get_percentiles(self.kills)))
+		parts.append("kills %.1f/s prestige %.2f/s" % self.rates)
+		if self.writer_stats is not None:
+			stats = self.writer_stats
+			parts.append("save last/max %.2f/%.2f queue %d" % (stats['latency'] * 1000, stats['max_latency'] * 1000, stats['queue_depth']))
+		self.summary = " | ".join(parts)
+
+		return self.summary
+
+	# write events in the chrome trace format, readable by chrome://tracing and perfetto
+	def write_trace(self, path):
+		events = []
+		for name, start, value in self.events:
+			timestamp = (start - self.origin) * 1000000
+			if name == 'rates':
+				events.append({ 'name' : 'rates', 'ph' : 'C', 'ts' : timestamp, 'pid' : 1, 'args' : { 'kills' : value[0], 'prestiges' : value[1] } })
+			elif name == 'writer':
+				args = { 'latency_ms' : value['latency'] * 1000, 'max_latency_ms' : value['max_latency'] * 1000, 'queue_depth' : value['queue_depth'] }
+				events.append({ 'name' : 'save writer', 'ph' : 'C', 'ts' : timestamp, 'pid' : 1, 'args' : args })
+			else:
+				events.append({ 'name' : name, 'ph' : 'X', 'ts' : timestamp, 'dur' : value * 1000000, 'pid' : 1, 'tid' : 1 })
+
+		with open(path, 'w') as f:
+			json.dump({ 'traceEvents' : events, 'displayTimeUnit' : 'ms' }, f)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import sys
+import time
+import json
+import pickle
+import argparse
+from simulation import Simulation, PERKS, MAX_IDLE_TIME
+from savefile import get_save_path, get_slot_path, load_state, DEFAULT_SLOT
+
+STEP = 60
+
+# plays a copy of a save forward by the game's own rules, with its auto builds but no other input,
+# and notes when the next rank of each perk first becomes affordable. nothing is written back.
+# the time since the save is played first, as the game does on load, so the projection starts from now
+class Projection(Simulation):
+
+	def __init__(self, state, approximate=False, now=None):
+		Simulation.__init__(self, state.snapshot())
+		self.fast_forwarding = True
+		self.approximate = approximate
+		if now is None:
+			now = time.time()
+		self.offline = min(max(now - state.time, 0), MAX_IDLE_TIME)
+		self.advance(self.offline)
+		self.played = 0.0
+		self.ranks = self.get_perk_ranks()
+		self.afford_times = [ None ] * len(PERKS)
+		self.check_perks()
+
+	# perks are only checked between steps, so a price that's covered for less than a step can be missed
+	def check_perks(self):
+		for index, perk in enumerate(PERKS):
+			rank = self.ranks[index]
+			if self.afford_times[index] is None and rank < perk.ranks and self.can_buy_perk(rank, index):
+				self.afford_times[index] = self.played
+
+	def run(self, seconds, step=STEP):
+		while self.played < seconds:
+			frametime = min(step, seconds - self.played)
+			self.advance(frametime)
+			self.played += frametime
+			self.check_perks()
+
+	def get_report(self):
+		state = self.state
+		perks = []
+		for index, perk in enumerate(PERKS):
+			rank = self.ranks[index]
+			if rank >= perk.ranks:
+				continue
+
+			perks.append({
+				'name'    : perk.name,
+				'label'   : perk.label,
+				'rank'    : rank + 1,
+				'cost'    : self.get_perk_cost(rank, index),
+				'seconds' : self.afford_times[index],
+			})
+
+		return {
+			'offline_hours' : self.offline / 3600,
+			'hours'         : self.played / 3600,
+			'level'         : state.level,
+			'highest_level' : state.highest['level'],
+			'gold'          : state.gold,
+			'rebirths'      : state.rebirth.value,
+			'evolves'       : state.evolve.value,
+			'transforms'    : state.transform.value,
+			'dps'           : round(state.damage.value * state.attack_rate.value, 2),
+			'perks'         : perks,
+		}
+
+def format_time(seconds):
+	if seconds is None:
+		return "-"
+
+	return "%dh%02dm" % (seconds // 3600, seconds % 3600 // 60)
+
+def print_report(report):
+	print("After %.2f hours away and %.2f hours more" % (report['offline_hours'], report['hours']))
+	labels = [ ('level', 'Level'), ('highest_level', 'Highest Level'), ('gold', 'Gold'), ('rebirths', 'Rebirths'), ('evolves', 'Evolves'), ('transforms', 'Transforms'), ('dps', 'DPS') ]
+	for name, label in labels:
+		print("%-14s %s" % (label, report[name]))
+
+	print("")
+	print("%-22s %-5s %-12s %s" % ("Perk", "Rank", "Cost", "Affordable In"))
+	for perk in report['perks']:
+		print("%-22s %-5d %-12s %s" % (perk['label'], perk['rank'], str(perk['cost']) + 'g', format_time(perk['seconds'])))
+
+def main(args=None):
+	parser = argparse.ArgumentParser(prog="game.py simulate", description="Project a save ahead without playing it, the save itself is left as it is")
+	parser.add_argument('file', nargs='?', help="save file, defaults to the save of --slot")
+	parser.add_argument('--slot', default=DEFAULT_SLOT, help="save slot to project")
+	parser.add_argument('--hours', type=float, default=24.0, help="game hours to play ahead")
+	parser.add_argument('--step', type=float, default=STEP, help="game seconds between perk price checks")
+	parser.add_argument('--approximate', action='store_true', help="keep gold and prices as floats once they pass 2**63")
+	parser.add_argument('--json', action='store_true', help="print the projection as json")
+	args = parser.parse_args(args)
+
+	try:
+		with open(args.file or get_slot_path(get_save_path(), args.slot), 'rb') as f:
+			state = load_state(f)
+	except (OSError, ValueError, pickle.UnpicklingError) as e:
+		print(str(e))
+		sys.exit(1)
+
+	projection = Projection(state, args.approximate)
+	projection.run(args.hours * 3600, max(args.step, 1.0))
+	report = projection.get_report()
+	if args.json:
+		print(json.dumps(report, indent=1))
+	else:
+		print_report(report)
+
+if __name__ == '__main__':
+	main()
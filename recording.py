@@ -0,0 +1,117 @@
+import gzip
+import curses
+import struct
+from savefile import encode_state, decode_state
+
+MAGIC = b'THRC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHB')
+BLOB = struct.Struct('<I')
+TIMERS = struct.Struct('<ddH')
+COUNT = struct.Struct('<H')
+UPDATE = struct.Struct('<Hd')
+ADVANCE = struct.Struct('<d')
+OP_KEYS = b'k'
+
+# fixed timestep updates, written by games before live play moved to advance()
+OP_UPDATE = b'u'
+OP_ADVANCE = b'a'
+OP_DRAW = b'd'
+OP_END = b'e'
+
+# stands in for Recorder when nothing is being recorded
+class NullRecorder:
+
+	def add_keys(self, keys):
+		pass
+
+	def add_advance(self, frametime):
+		pass
+
+	def add_draw(self):
+		pass
+
+	def close(self, state):
+		pass
+
+# writes the keys a game handles and the advances and draws between them, in order, to a
+# gzipped file. along with the state play started from that's enough to play a session again
+class Recorder:
+
+	def __init__(self, path, game):
+		self.file = gzip.open(path, 'wb')
+		self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, game.approximate))
+		self.add_state(game.state)
+		self.file.write(TIMERS.pack(game.attack_timer, game.save_timer, game.penalties))
+
+	def add_state(self, state):
+		data = encode_state(state)
+		self.file.write(BLOB.pack(len(data)))
+		self.file.write(data)
+
+	# resizes only change the screen
+	def add_keys(self, keys):
+		keys = [ c for c in keys if c != curses.KEY_RESIZE ]
+		if len(keys) == 0:
+			return
+
+		self.file.write(OP_KEYS + COUNT.pack(len(keys)) + struct.pack('<%dH' % len(keys), *keys))
+
+	def add_advance(self, frametime):
+		self.file.write(OP_ADVANCE + ADVANCE.pack(frametime))
+
+	def add_draw(self):
+		self.file.write(OP_DRAW)
+
+	# finish with the state play ended at so a replay can be checked against it
+	def close(self, state):
+		self.file.write(OP_END)
+		self.add_state(state)
+		self.file.close()
+
+# session read back from a recording
+class Recording:
+
+	def __init__(self, path):
+		with gzip.open(path, 'rb') as f:
+			data = f.read()
+
+		magic, format_version, self.approximate = HEADER.unpack_from(data, 0)
+		if magic != MAGIC:
+			raise ValueError(path + " is not a recording")
+		if format_version != FORMAT_VERSION:
+			raise ValueError("unknown recording format " + str(format_version))
+
+		offset = HEADER.size
+		self.state, offset = self.read_state(data, offset)
+		self.attack_timer, self.save_timer, self.penalties = TIMERS.unpack_from(data, offset)
+		offset += TIMERS.size
+
+		# list of (op, value), the final state is None if the game never closed the recording
+		self.ops = []
+		self.final = None
+		while offset < len(data):
+			op = data[offset:offset + 1]
+			offset += 1
+			if op == OP_KEYS:
+				(count,) = COUNT.unpack_from(data, offset)
+				offset += COUNT.size
+				self.ops.append((op, list(struct.unpack_from('<%dH' % count, data, offset))))
+				offset += count * 2
+			elif op == OP_UPDATE:
+				self.ops.append((op, UPDATE.unpack_from(data, offset)))
+				offset += UPDATE.size
+			elif op == OP_ADVANCE:
+				self.ops.append((op, ADVANCE.unpack_from(data, offset)[0]))
+				offset += ADVANCE.size
+			elif op == OP_DRAW:
+				self.ops.append((op, None))
+			elif op == OP_END:
+				self.final, offset = self.read_state(data, offset)
+			else:
+				raise ValueError("bad recording op at " + str(offset - 1))
+
+	def read_state(self, data, offset):
+		(size,) = BLOB.unpack_from(data, offset)
+		offset += BLOB.size
+		return decode_state(data[offset:offset + size]), offset + size
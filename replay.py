@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import sys
+import time
+import struct
+import argparse
+from simulation import State
+from game import Game
+from recording import Recording, OP_KEYS, OP_UPDATE, OP_ADVANCE
+
+# comparable values of a state's fields, leaving out the wall clock time it was saved at
+def get_fields(state):
+	fields = {}
+	for name in State.__slots__:
+		if name != 'time':
+			fields[name] = get_value(getattr(state, name))
+
+	return fields
+
+def get_value(value):
+	if isinstance(value, dict):
+		return { key : get_value(item) for key, item in value.items() }
+	elif hasattr(value, '__slots__'):
+		return value.__getstate__()
+
+	return value
+
+# names of the fields that differ between two states
+def diff_states(state, expected):
+	fields = get_fields(state)
+	expected_fields = get_fields(expected)
+	return [ name for name in fields if fields[name] != expected_fields[name] ]
+
+# plays a recording back as fast as possible, without a terminal or save files
+class Replay(Game):
+
+	def __init__(self, recording):
+		Game.__init__(self)
+		self.state = recording.state.snapshot()
+		self.approximate = bool(recording.approximate)
+		self.attack_timer = recording.attack_timer
+		self.save_timer = recording.save_timer
+		self.penalties = recording.penalties
+		self.ops = recording.ops
+
+	def open(self):
+		pass
+
+	def set_alert(self, message):
+		self.set_message(message)
+
+	def save(self):
+		pass
+
+	def add_snapshot(self, kind):
+		pass
+
+	# apply every recorded op in order, returns the number of updates and advances
+	def run(self):
+		updates = 0
+		for op, value in self.ops:
+			if op == OP_KEYS:
+				self.handle_keys(value)
+			elif op == OP_ADVANCE:
+				self.advance(value)
+				updates += 1
+			elif op == OP_UPDATE:
+				count, frametime = value
+				for i in range(count):
+					self.update(frametime)
+				updates += count
+			else:
+				self.track_dps()
+
+		return updates
+
+def main():
+	parser = argparse.ArgumentParser(description="Play back a recording from game.py --record and check it ends in the recorded state")
+	parser.add_argument('file', help="recording to play")
+	parser.add_argument('--count', type=int, default=1, help="times to play it, for timing")
+	args = parser.parse_args()
+
+	try:
+		recording = Recording(args.file)
+	except (OSError, EOFError, ValueError, struct.error) as e:
+		print(str(e))
+		sys.exit(1)
+
+	keys = sum(len(value) for op, value in recording.ops if op == OP_KEYS)
+	times = []
+	for i in range(args.count):
+		replay = Replay(recording)
+		start = time.perf_counter()
+		updates = replay.run()
+		times.append(time.perf_counter() - start)
+
+	best = min(times)
+	print("%d ops, %d keys, %d updates" % (len(recording.ops), keys, updates))
+	print("best of %d: %.3fs, %.0f updates/s" % (args.count, best, updates / best if best > 0 else 0))
+
+	if recording.final is None:
+		print("recording has no final state to check")
+		sys.exit(1)
+
+	fields = diff_states(replay.state, recording.final)
+	if len(fields) > 0:
+		print("MISMATCH in " + ", ".join(fields))
+		sys.exit(1)
+
+	print("final state matches")
+
+if __name__ == '__main__':
+	main()
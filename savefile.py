@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import time
+import shutil
+import struct
+import pickle
+import argparse
+import threading
+from simulation import State, Upgrade, Cost, GAME_VERSION
+
+SLOT_EXTENSION = '.dat'
+DEFAULT_SLOT = 'save'
+MAGIC = b'THSV'
+FORMAT_VERSION = 3
+HEADER = struct.Struct('<4sHHH')
+
+# level, rebirths, evolves, transforms, time played and time saved, right after the header and followed
+# by gold, so a save can be described without decoding all of it. gold is kept exactly, as a kind byte
+# and then 8 bytes for q and d or a decimal string for n, the way the numbers after it are
+SUMMARY = struct.Struct('<qqqqdd')
+
+# format version 2 had the summary too, with gold as a float after the level
+SUMMARY_2 = struct.Struct('<qdqqqdd')
+SIZE = struct.Struct('<H')
+PERK = struct.Struct('<BH')
+
+# field layout of format version 1. changing any of these lists needs a new format version
+SCALARS_1 = [ 'level', 'gold', 'gold_multiplier', 'health', 'max_health', 'time' ]
+DICTS_1 = [
+	('base',     [ 'level', 'damage', 'damage_increase', 'damage_increase_amount', 'attack_rate', 'attack_rate_increase', 'gold', 'gold_multiplier', 'gold_multiplier_increase' ]),
+	('highest',  [ 'dps', 'level', 'rebirth', 'evolve', 'transform' ]),
+	('total',    [ 'time', 'kill', 'gold', 'gold_lost', 'upgrade', 'rebirth', 'evolve', 'transform' ]),
+	('since',    [ 'time', 'gold', 'upgrade' ]),
+	('sequence', [ 'upgrade', 'rebirth', 'evolve', 'transform' ]),
+]
+COSTS_1 = [ 'upgrade', 'rebirth', 'evolve', 'transform', 'health' ]
+UPGRADES_1 = [ 'damage', 'damage_increase', 'damage_increase_amount', 'attack_rate', 'attack_rate_increase', 'gold_increase', 'rebirth', 'evolve', 'transform' ]
+PERKS_1 = [
+	'can_upgrade_damage_increase', 'can_upgrade_attack_rate', 'can_rebirth', 'can_evolve', 'can_transform',
+	'show_dps', 'show_dps_increase', 'show_highest_level', 'show_highest_dps', 'show_elapsed',
+	'show_total_upgrades', 'show_total_kills', 'show_total_gold', 'show_health_percent',
+	'reduce_upgrade_price', 'auto_upgrade', 'auto_rebirth', 'auto_evolve',
+]
+PERK_INDEXES_1 = { name : index for index, name in enumerate(PERKS_1) }
+SUMMARY_FIELDS = [ 'level', 'rebirths', 'evolves', 'transforms', 'played', 'saved' ]
+SUMMARY_FIELDS_2 = [ 'level', 'gold', 'rebirths', 'evolves', 'transforms', 'played', 'saved' ]
+
+struct_cache = {}
+kinds_cache = {}
+
+def get_save_path():
+	if sys.platform.startswith("win"):
+		return os.getenv("APPDATA") + "\\terminalheroes\\"
+	else:
+		return os.getenv("HOME") + "/.local/share/terminalheroes/"
+
+def get_slot_path(save_path, name):
+	return save_path + name + SLOT_EXTENSION
+
+# names and summaries of the save slots in a directory, reading only their headers.
+# the summary is None for slots that can't be read
+def list_slots(save_path):
+	slots = []
+	for filename in sorted(os.listdir(save_path)):
+		if not filename.endswith(SLOT_EXTENSION):
+			continue
+
+		try:
+			with open(save_path + filename, 'rb') as f:
+				summary = read_summary(f)
+		except Exception:
+			summary = None
+		slots.append((filename[:-len(SLOT_EXTENSION)], summary))
+
+	return slots
+
+# read a binary or pickled save as it was written
+def read_state(f):
+	data = f.read()
+	if data[:len(MAGIC)] == MAGIC:
+		return decode_state(data)
+
+	return StateUnpickler(io.BytesIO(data)).load()
+
+def get_summary(state):
+	return {
+		'version'    : state.version,
+		'level'      : state.level,
+		'gold'       : state.gold,
+		'rebirths'   : state.rebirth.value,
+		'evolves'    : state.evolve.value,
+		'transforms' : state.transform.value,
+		'played'     : state.total['time'],
+		'saved'      : state.time,
+	}
+
+# describe a save from its summary header, decoding the whole save only when it's too old to have one
+def read_summary(f):
+	data = f.read(HEADER.size)
+	if data[:len(MAGIC)] == MAGIC and len(data) == HEADER.size:
+		magic, format_version, version, count = HEADER.unpack_from(data, 0)
+		if format_version >= 3:
+			summary = dict(zip(SUMMARY_FIELDS, SUMMARY.unpack(f.read(SUMMARY.size))))
+			summary['gold'] = read_gold(f)
+			summary['version'] = version
+			return summary
+		elif format_version == 2:
+			summary = dict(zip(SUMMARY_FIELDS_2, SUMMARY_2.unpack(f.read(SUMMARY_2.size))))
+
+			# whole floats below 2**53 were exact, show them as the ints they were
+			if summary['gold'].is_integer() and abs(summary['gold']) < 2**53:
+				summary['gold'] = int(summary['gold'])
+			summary['version'] = version
+			return summary
+
+	f.seek(0)
+	return get_summary(read_state(f))
+
+# read a save and upgrade it to the current game version
+def load_state(f):
+	return migrate_state(read_state(f))
+
+# struct for a run of numbers, q for int64, d for float and n for the index of a big int
+def get_struct(kinds):
+	if kinds not in struct_cache:
+		struct_cache[kinds] = struct.Struct('<' + kinds.replace(b'n', b'q').decode())
+
+	return struct_cache[kinds]
+
+def get_kinds(types):
+	if types not in kinds_cache:
+		kinds_cache[types] = bytes(ord('d') if value_type is float else ord('q') for value_type in types)
+
+	return kinds_cache[types]
+
+def encode_gold(gold):
+	kind = get_kinds((type(gold),))
+	if kind == b'q' and not -2**63 <= gold < 2**63:
+		return b'n' + encode_string(str(gold))
+
+	return kind + get_struct(kind).pack(gold)
+
+def decode_gold(data, offset):
+	kind = data[offset:offset + 1]
+	offset += 1
+	if kind == b'n':
+		value, offset = decode_string(data, offset)
+		return int(value), offset
+
+	numbers = get_struct(kind)
+	return numbers.unpack_from(data, offset)[0], offset + numbers.size
+
+# decode_gold() for a file, reading no further than the gold
+def read_gold(f):
+	kind = f.read(1)
+	if kind == b'n':
+		(size,) = SIZE.unpack(f.read(SIZE.size))
+		return int(f.read(size).decode())
+
+	numbers = get_struct(kind)
+	return numbers.unpack(f.read(numbers.size))[0]
+
+def encode_string(value):
+	data = value.encode()
+	return SIZE.pack(len(data)) + data
+
+def decode_string(data, offset):
+	(size,) = SIZE.unpack_from(data, offset)
+	offset += SIZE.size
+	return data[offset:offset + size].decode(), offset + size
+
+def encode_state(state):
+	values = [ getattr(state, name) for name in SCALARS_1 ]
+	for name, keys in DICTS_1:
+		container = getattr(state, name)
+		values.extend(container[key] for key in keys)
+	for name in COSTS_1:
+		cost = state.cost[name]
+		values.append(cost.growth)
+		values.append(cost.multiplier)
+	for name in UPGRADES_1:
+		upgrade = getattr(state, name)
+		values.append(upgrade.value)
+		values.append(upgrade.cost)
+		values.append(upgrade.cost_multiplier)
+
+	# ints that don't fit in 64 bits are stored after the numbers
+	kinds = get_kinds(tuple(map(type, values)))
+	big = []
+	try:
+		numbers = get_struct(kinds).pack(*values)
+	except struct.error:
+		kinds = bytearray(kinds)
+		for index, value in enumerate(values):
+			if kinds[index] == ord('q') and not -2**63 <= value < 2**63:
+				kinds[index] = ord('n')
+				big.append(value)
+				values[index] = len(big) - 1
+		kinds = bytes(kinds)
+		numbers = get_struct(kinds).pack(*values)
+
+	summary = get_summary(state)
+	parts = [
+		HEADER.pack(MAGIC, FORMAT_VERSION, state.version, len(values)),
+		SUMMARY.pack(*[ summary[name] for name in SUMMARY_FIELDS ]),
+		encode_gold(summary['gold']),
+		kinds, numbers, SIZE.pack(len(big)),
+	]
+	for value in big:
+		parts.append(encode_string(str(value)))
+
+	perks = [ (PERK_INDEXES_1[name], rank) for name, rank in state.perks.items() if name in PERK_INDEXES_1 ]
+	parts.append(SIZE.pack(len(perks)))
+	for index, rank in perks:
+		parts.append(PERK.pack(index, rank))
+
+	parts.append(SIZE.pack(len(state.builds)))
+	for name, build in state.builds.items():
+		parts.append(encode_string(name))
+		parts.append(encode_string(build))
+
+	return b''.join(parts)
+
+def decode_state(data):
+	magic, format_version, version, count = HEADER.unpack_from(data, 0)
+	if format_version > FORMAT_VERSION:
+		raise ValueError("unknown save format " + str(format_version))
+
+	offset = HEADER.size
+	if format_version >= 3:
+		gold, offset = decode_gold(data, offset + SUMMARY.size)
+	elif format_version == 2:
+		offset += SUMMARY_2.size
+	kinds = data[offset:offset + count]
+	offset += count
+	numbers = get_struct(kinds)
+	values = list(numbers.unpack_from(data, offset))
+	offset += numbers.size
+
+	(size,) = SIZE.unpack_from(data, offset)
+	offset += SIZE.size
+	big = []
+	for i in range(size):
+		value, offset = decode_string(data, offset)
+		big.append(int(value))
+	if len(big) > 0:
+		for index, kind in enumerate(kinds):
+			if kind == ord('n'):
+				values[index] = big[values[index]]
+
+	state = State.__new__(State)
+	state.version = version
+	index = len(SCALARS_1)
+	for name, value in zip(SCALARS_1, values):
+		setattr(state, name, value)
+	for name, keys in DICTS_1:
+		setattr(state, name, dict(zip(keys, values[index:index + len(keys)])))
+		index += len(keys)
+	state.cost = {}
+	for name in COSTS_1:
+		state.cost[name] = Cost(values[index], values[index + 1])
+		index += 2
+	for name in UPGRADES_1:
+		setattr(state, name, Upgrade(values[index], values[index + 1], values[index + 2]))
+		index += 3
+
+	(size,) = SIZE.unpack_from(data, offset)
+	offset += SIZE.size
+	state.perks = {}
+	for i in range(size):
+		index, rank = PERK.unpack_from(data, offset)
+		offset += PERK.size
+		state.perks[PERKS_1[index]] = rank
+
+	(size,) = SIZE.unpack_from(data, offset)
+	offset += SIZE.size
+	state.builds = {}
+	for i in range(size):
+		name, offset = decode_string(data, offset)
+		state.builds[name], offset = decode_string(data, offset)
+
+	return state
+
+# add anything a fresh State has that an older one lacks
+def add_missing_fields(state):
+	fresh = State(state.version + 1)
+	for name in State.__slots__:
+		value = getattr(fresh, name)
+		if not hasattr(state, name):
+			setattr(state, name, value)
+		elif isinstance(value, dict):
+			container = getattr(state, name)
+			for key in value:
+				if key not in container:
+					container[key] = value[key]
+
+# upgrade functions from a game version to the next one. versions without one only gain missing fields
+MIGRATIONS = {}
+
+def migrate_state(state):
+	if state.version > GAME_VERSION:
+		raise ValueError("save is from a newer version " + str(state.version))
+
+	while state.version < GAME_VERSION:
+		MIGRATIONS.get(state.version, add_missing_fields)(state)
+		state.version += 1
+
+	return state
+
+# write data next to path and rename it into place so a crash never leaves a partial file.
+# synced writes are flushed to disk first, which is slow but survives power loss
+def write_file(path, data, sync=True):
+	temp_path = path + '.tmp'
+	with open(temp_path, 'wb') as f:
+		f.write(data)
+		if sync:
+			f.flush()
+			os.fsync(f.fileno())
+	os.replace(temp_path, path)
+
+	# make the rename itself durable
+	if sync and hasattr(os, 'O_DIRECTORY'):
+		directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+		try:
+			os.fsync(directory)
+		finally:
+			os.close(directory)
+
+def save_state(path, state):
+	write_file(path, encode_state(state))
+
+class StateUnpickler(pickle.Unpickler):
+
+	def find_class(self, module, name):
+		if module == '__main__' and name in ('State', 'Upgrade', 'Cost'):
+			module = 'simulation'
+
+		return pickle.Unpickler.find_class(self, module, name)
+
+# writes saves on a background thread. only the newest pending state for each path is written
+class SaveWriter:
+
+	def __init__(self):
+		self.pending = {}
+		self.writing = 0
+		self.closed = False
+		self.condition = threading.Condition()
+		self.stats = {
+			'saves'       : 0,
+			'skipped'     : 0,
+			'errors'      : 0,
+			'latency'     : 0.0,
+			'max_latency' : 0.0,
+		}
+		self.error = None
+		self.thread = threading.Thread(target=self.run, name="SaveWriter", daemon=True)
+		self.thread.start()
+
+	# queue a snapshot of a state for writing
+	def save(self, path, state):
+		self.queue(path, (state, None, True))
+
+	# queue bytes for writing, unsynced writes skip the fsync
+	def save_data(self, path, data, sync=True):
+		self.queue(path, (None, data, sync))
+
+	def queue(self, path, item):
+		with self.condition:
+			if path in self.pending:
+				self.stats['skipped'] += 1
+			self.pending[path] = (item, time.perf_counter())
+			self.condition.notify()
+
+	# counts and latencies so far, with the number of saves waiting or being written as queue_depth
+	def get_stats(self):
+		with self.condition:
+			stats = dict(self.stats)
+			stats['queue_depth'] = len(self.pending) + self.writing
+
+		return stats
+
+	# wait until everything queued so far is on disk
+	def flush(self):
+		with self.condition:
+			while len(self.pending) > 0 or self.writing > 0:
+				self.condition.wait()
+
+	def close(self):
+		self.flush()
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+		self.thread.join()
+
+	def run(self):
+		while True:
+			with self.condition:
+				while len(self.pending) == 0 and not self.closed:
+					self.condition.wait()
+				if len(self.pending) == 0:
+					return
+
+				path, ((state, data, sync), queued) = self.pending.popitem()
+				self.writing += 1
+
+			try:
+				if state is not None:
+					save_state(path, state)
+				else:
+					write_file(path, data, sync)
+				error = None
+			except Exception as e:
+				error = e
+
+			with self.condition:
+				self.writing -= 1
+				if error is None:
+					latency = time.perf_counter() - queued
+					self.stats['saves'] += 1
+					self.stats['latency'] = latency
+					self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+				else:
+					self.stats['errors'] += 1
+					self.error = error
+				self.condition.notify_all()
+
+# rewrite saves in the current binary format, keeping a copy of pickled originals
+def convert(paths, backup):
+	for path in paths:
+		with open(path, 'rb') as f:
+			legacy = f.read(len(MAGIC)) != MAGIC
+			f.seek(0)
+			state = load_state(f)
+
+		if legacy and backup:
+			shutil.copyfile(path, path + '.pickle')
+		save_state(path, state)
+		print("Converted " + path + " (version " + str(state.version) + ", " + str(os.path.getsize(path)) + " bytes)")
+
+def main():
+	parser = argparse.ArgumentParser(description="Convert saves to the binary save format")
+	parser.add_argument('files', nargs='*', help="save files, defaults to the game's save.dat")
+	parser.add_argument('--no-backup', action='store_true', help="don't keep a .pickle copy of converted saves")
+	args = parser.parse_args()
+
+	try:
+		convert(args.files or [ get_save_path() + "save.dat" ], not args.no_backup)
+	except (OSError, ValueError, pickle.UnpicklingError) as e:
+		print(str(e))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
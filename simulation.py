@@ -0,0 +1,930 @@
+import time
+import math
+import bisect
+from notation import format_number
+
+GAME_VERSION = 14
+AUTOSAVE_TIME = 60
+MAX_IDLE_TIME = 60*60*24*365
+SEQUENCE_INCREMENT = 5
+PENALTIES_ALLOWED = 10
+MODE_PLAY = 0
+MODE_REBIRTH = 1
+MODE_EVOLVE = 2
+MODE_SHOP = 3
+MODE_SEQUENCE = 4
+MODE_TRANSFORM = 5
+MAX_BULK = 10000
+APPROXIMATE_LIMIT = 2**63
+BASE = {
+	'level'                    : 1,
+	'damage'                   : 1.0,
+	'damage_increase'          : 1.0,
+	'damage_increase_amount'   : 1.0,
+	'attack_rate'              : 1.0,
+	'attack_rate_increase'     : 0.1,
+	'gold'                     : 0,
+	'gold_multiplier'          : 1.0,
+	'gold_multiplier_increase' : 0.05,
+}
+UPGRADE_COSTS = {
+	'damage'                 : 5,
+	'damage_increase'        : 50,
+	'damage_increase_amount' : 1000,
+	'attack_rate'            : 100,
+	'attack_rate_increase'   : 10000,
+}
+PRESTIGE_COSTS = {
+	'rebirth'   : 10000,
+	'evolve'    : 10,
+	'transform' : 10,
+}
+
+# base stats and prestige counts that survive each tier
+PRESTIGE_KEEPS = {
+	'rebirth'   : [ 'damage', 'damage_increase', 'attack_rate', 'attack_rate_increase', 'rebirth', 'evolve', 'transform' ],
+	'evolve'    : [ 'damage', 'damage_increase', 'attack_rate', 'attack_rate_increase', 'evolve', 'transform' ],
+	'transform' : [ 'damage_increase', 'attack_rate_increase', 'transform' ],
+}
+UPGRADES = [ 'damage', 'damage_increase', 'damage_increase_amount', 'attack_rate', 'attack_rate_increase', 'gold_increase', 'rebirth', 'evolve', 'transform' ]
+
+class Perk:
+
+	def __init__(self, ranks, name, label, info, cost, level, rebirths, evolves, cost_multiplier):
+		self.ranks = ranks
+		self.name = name
+		self.label = label
+		self.info = info
+		self.cost = cost
+		self.level = level
+		self.rebirths = rebirths
+		self.evolves = evolves
+		self.cost_multiplier = cost_multiplier
+
+		# price of each rank
+		self.costs = [ int(cost * math.pow(cost_multiplier, rank)) for rank in range(ranks) ]
+
+# cost times a factor, rounded down like prices are. float costs from approximate mode stay floats so
+# they keep a fixed size, past APPROXIMATE_LIMIT they're whole numbers already
+def scale_cost(cost, factor):
+	if isinstance(cost, float):
+		return cost * factor
+
+	return int(cost * factor)
+
+# costs of consecutive purchases with running totals of their prices. each cost is registered
+# once so upgrades with the same growth share one table, float costs get tables of their own
+class CostTable:
+
+	def __init__(self, cost, growth):
+		self.growth = growth
+		self.costs = []
+		self.totals = {}
+		self.add(cost)
+
+	def add(self, cost):
+		key = (cost, self.growth, isinstance(cost, float))
+		if key not in cost_tables:
+			cost_tables[key] = (self, len(self.costs))
+		self.costs.append(cost)
+
+	def extend(self, size):
+		while len(self.costs) < size:
+			self.add(scale_cost(self.costs[-1], self.growth))
+
+	# totals[i] is the price of the purchases before costs[i]
+	def get_totals(self, multiplier, size):
+		self.extend(size)
+		totals = self.totals.setdefault(multiplier, [ 0 ])
+		while len(totals) < size:
+			totals.append(totals[-1] + scale_cost(self.costs[len(totals) - 1], multiplier))
+
+		return totals
+
+cost_tables = {}
+
+def get_cost_table(cost, growth):
+	key = (cost, growth, isinstance(cost, float))
+	if key not in cost_tables:
+		CostTable(cost, growth)
+
+	return cost_tables[key]
+
+# restore pickled fields. values come in __slots__ order, older saves pickled a __dict__
+def set_slots(instance, state):
+	names = type(instance).__slots__
+	if isinstance(state, dict):
+		for name, value in state.items():
+			if name in names:
+				setattr(instance, name, value)
+	else:
+		for name, value in zip(names, state):
+			setattr(instance, name, value)
+
+def get_slots(instance):
+	return tuple(getattr(instance, name) for name in type(instance).__slots__)
+
+class Upgrade:
+
+	__slots__ = ('value', 'cost', 'cost_multiplier')
+	__getstate__ = get_slots
+	__setstate__ = set_slots
+
+	def __init__(self, value, cost, cost_multiplier):
+		self.reset(value, cost, cost_multiplier)
+
+	def reset(self, value, cost, cost_multiplier):
+		self.value = value
+		self.cost = cost
+		self.cost_multiplier = cost_multiplier
+
+	def buy(self, amount):
+		self.cost = scale_cost(self.cost, self.cost_multiplier)
+		self.value += amount
+
+	# number and total price of the purchases gold covers, up to count
+	def get_bulk_price(self, gold, multiplier, count=MAX_BULK):
+		table, index = get_cost_table(self.cost, self.cost_multiplier)
+		count = min(count, MAX_BULK)
+		size = index + 2
+		while True:
+			size = min(size * 2, index + count + 1)
+			totals = table.get_totals(multiplier, size)
+			if totals[size - 1] - totals[index] > gold or size == index + count + 1:
+				break
+
+		count = bisect.bisect_right(totals, totals[index] + gold, index, size) - 1 - index
+		return count, totals[index + count] - totals[index]
+
+	# same as count calls to buy()
+	def buy_many(self, count, amount):
+		table, index = get_cost_table(self.cost, self.cost_multiplier)
+		table.extend(index + count + 1)
+		self.cost = table.costs[index + count]
+
+		# whole numbers add up exactly below 2**53, so one multiply matches count adds. other floats can round
+		# differently from count adds (1.5 against 1.5000000000000004), so those are added one at a time
+		total = amount * count
+		if float(amount).is_integer() and float(self.value).is_integer() and abs(self.value) + abs(total) < 2**53:
+			self.value += total
+			return
+
+		value = self.value
+		for i in range(count):
+			value += amount
+		self.value = value
+
+class Cost:
+
+	__slots__ = ('growth', 'multiplier')
+	__getstate__ = get_slots
+	__setstate__ = set_slots
+
+	def __init__(self, growth, multiplier):
+		self.growth = growth
+		self.multiplier = multiplier
+
+class State:
+
+	__slots__ = (
+		'version', 'base', 'cost', 'highest', 'total', 'since', 'sequence',
+		'level', 'damage', 'damage_increase', 'damage_increase_amount', 'attack_rate', 'attack_rate_increase',
+		'gold', 'gold_multiplier', 'gold_increase', 'rebirth', 'evolve', 'transform',
+		'perks', 'builds', 'health', 'max_health', 'time',
+	)
+	__getstate__ = get_slots
+	__setstate__ = set_slots
+
+	def __init__(self, version):
+		self.version = version
+
+		# base stats
+		self.base = dict(BASE)
+
+		# values associated with cost and increasing prices
+		self.cost = {
+			'upgrade'   : Cost(1.2, 1),
+			'rebirth'   : Cost(1.1, 1),
+			'evolve'    : Cost(1.1, 1),
+			'transform' : Cost(1.1, 1),
+			'health'    : Cost(1.5, 1),
+		}
+
+		# stats for records
+		self.highest = {
+			'dps'       : 0,
+			'level'     : 0,
+			'rebirth'   : 0,
+			'evolve'    : 0,
+			'transform' : 0,
+		}
+
+		# stats for running counts
+		self.total = {
+			'time'      : 0,
+			'kill'      : 0,
+			'gold'      : 0,
+			'gold_lost' : 0,
+			'upgrade'   : 0,
+			'rebirth'   : 0,
+			'evolve'    : 0,
+			'transform' : 0,
+		}
+
+		# stats since last rebirth/evolve/reset
+		self.since = {
+			'time'      : 0,
+			'gold'      : 0,
+			'upgrade'   : 0,
+		}
+
+		# current sequences
+		self.sequence = {
+			'upgrade'   : 0,
+			'rebirth'   : 0,
+			'evolve'    : 0,
+			'transform' : 0,
+		}
+
+		self.level = self.base['level']
+		self.damage = Upgrade(self.base['damage'], UPGRADE_COSTS['damage'], self.cost['upgrade'].growth)
+		self.damage_increase = Upgrade(self.base['damage_increase'], UPGRADE_COSTS['damage_increase'], self.cost['upgrade'].growth)
+		self.damage_increase_amount = Upgrade(self.base['damage_increase_amount'], UPGRADE_COSTS['damage_increase_amount'], self.cost['upgrade'].growth)
+		self.attack_rate = Upgrade(self.base['attack_rate'], UPGRADE_COSTS['attack_rate'], self.cost['upgrade'].growth)
+		self.attack_rate_increase = Upgrade(self.base['attack_rate_increase'], UPGRADE_COSTS['attack_rate_increase'], self.cost['upgrade'].growth)
+		self.gold = self.base['gold']
+		self.gold_multiplier = self.base['gold_multiplier']
+		self.gold_increase = Upgrade(self.base['gold_multiplier_increase'], 0, 0)
+		self.rebirth = Upgrade(0, PRESTIGE_COSTS['rebirth'], self.cost['rebirth'].growth)
+		self.evolve = Upgrade(0, PRESTIGE_COSTS['evolve'], self.cost['evolve'].growth)
+		self.transform = Upgrade(0, PRESTIGE_COSTS['transform'], self.cost['transform'].growth)
+		self.perks = {}
+		self.builds = {}
+		self.health = 0
+		self.max_health = 0
+		self.time = time.time()
+		self.calc()
+
+	# set values from base stats after rebirth/evolve
+	def calc(self):
+		self.damage.value = self.base['damage']
+		self.damage_increase.value = self.base['damage_increase']
+		self.damage_increase_amount.value = self.base['damage_increase_amount']
+		self.attack_rate.value = self.base['attack_rate']
+		self.attack_rate_increase.value = self.base['attack_rate_increase']
+
+	# start over for a prestige tier, clearing in place what a fresh State would have and keeping
+	# perks, builds, records, totals, sequences and the base stats and prestige counts the tier keeps
+	def prestige(self, tier):
+		keep = PRESTIGE_KEEPS[tier]
+		for name, value in BASE.items():
+			if name not in keep:
+				self.base[name] = value
+		for name in self.since:
+			self.since[name] = 0
+
+		growth = self.cost['upgrade'].growth
+		for name, cost in UPGRADE_COSTS.items():
+			getattr(self, name).reset(self.base[name], cost, growth)
+		self.gold_increase.reset(self.base['gold_multiplier_increase'], 0, 0)
+		for name, cost in PRESTIGE_COSTS.items():
+			if name not in keep:
+				getattr(self, name).reset(0, cost, self.cost[name].growth)
+
+		self.level = self.base['level']
+		self.gold = self.base['gold']
+		self.gold_multiplier = self.base['gold_multiplier']
+		self.health = 0
+		self.max_health = 0
+		self.time = time.time()
+
+	# copy containers and upgrades one level deep, enough for a save to stay unchanged while play goes on
+	def snapshot(self):
+		state = State.__new__(State)
+		for name in State.__slots__:
+			setattr(state, name, getattr(self, name))
+		state.base = dict(self.base)
+		state.cost = { name : Cost(cost.growth, cost.multiplier) for name, cost in self.cost.items() }
+		state.highest = dict(self.highest)
+		state.total = dict(self.total)
+		state.since = dict(self.since)
+		state.sequence = dict(self.sequence)
+		state.perks = dict(self.perks)
+		state.builds = dict(self.builds)
+		for name in UPGRADES:
+			upgrade = getattr(self, name)
+			setattr(state, name, Upgrade(upgrade.value, upgrade.cost, upgrade.cost_multiplier))
+
+		return state
+
+class Simulation:
+
+	def __init__(self, state=None):
+		self.version = GAME_VERSION
+		self.state = state
+		self.save_timer = 0
+		self.timestep = 1 / 100.0
+		self.mode = MODE_PLAY
+		self.rebirth_values = [ 1.0, 0.05 ]
+		self.evolve_values = [ 10.0, 1.0 ]
+		self.transform_values = [ 10.0, 1.0 ]
+		self.fast_forwarding = False
+		self.attack_timer = 0
+		self.penalties = 0
+		self.prestiges = 0
+		self.shadow = None
+		self.notation = 'suffix'
+		self.approximate = False
+		self.set_message("")
+
+		if self.state is None:
+			self.state = State(self.version)
+		self.init_level()
+
+	def penalize(self):
+		self.penalties += 1
+		if self.penalties > PENALTIES_ALLOWED:
+			gold_lost = math.ceil(self.state.gold * 0.1)
+			if gold_lost > 0:
+				self.state.total['gold_lost'] += gold_lost
+				self.state.gold -= gold_lost
+				self.set_alert("PENALIZED! YOU LOST " + format_number(gold_lost, self.notation) + " GOLD!")
+		else:
+			self.set_alert("PENALTIES LEFT: " + str(PENALTIES_ALLOWED - self.penalties))
+
+	def set_message(self, message, style=0):
+		self.message = message
+		self.message_style = style
+
+	# show a warning, front ends override to highlight it
+	def set_alert(self, message):
+		self.set_message(message)
+
+	# persist state, front ends override to write save files
+	def save(self):
+		pass
+
+	def get_next_sequence(self, name):
+		build = self.get_build(name)
+		sequence = self.state.sequence[name]
+		if sequence < len(build):
+			return build[sequence]
+
+		return ""
+
+	def get_build(self, build):
+		if build not in self.state.builds:
+			self.state.builds[build] = ""
+
+		return self.state.builds[build]
+
+	def get_perk_cost(self, rank, index):
+		perk = PERKS[index]
+		if rank >= perk.ranks:
+			rank = perk.ranks-1
+
+		return perk.costs[rank]
+
+	# rank of every perk by index, 0 for perks not owned
+	def get_perk_ranks(self):
+		ranks = [ 0 ] * len(PERKS)
+		for name, rank in self.state.perks.items():
+			index = PERK_INDEXES.get(name)
+			if index is not None:
+				ranks[index] = rank
+
+		return ranks
+
+	# sorted gold prices of the next rank of every perk that isn't maxed
+	def get_perk_thresholds(self, ranks):
+		return sorted(set(perk.costs[rank] for perk, rank in zip(PERKS, ranks) if rank < perk.ranks))
+
+	def can_buy_perk(self, rank, index):
+		perk = PERKS[index]
+		if self.state.rebirth.value < perk.rebirths:
+			return False
+
+		if self.state.evolve.value < perk.evolves:
+			return False
+
+		if self.state.level < perk.level:
+			return False
+
+		return self.state.gold >= self.get_perk_cost(rank, index)
+
+	def buy_perk(self, index):
+		perk = PERKS[index]
+
+		# get existing upgrade
+		has_upgrade = False
+		rank = 0
+		next_rank = 1
+		if perk.name in self.state.perks:
+			has_upgrade = True
+			rank = self.state.perks[perk.name]
+			next_rank = rank + 1
+
+		# check buy conditions
+		if rank < perk.ranks and self.can_buy_perk(rank, index):
+			self.state.perks[perk.name] = next_rank
+			self.state.gold -= self.get_perk_cost(rank, index)
+			self.set_message("Bought " + perk.name)
+			if perk.name == "reduce_upgrade_price":
+				self.state.cost['upgrade'].multiplier = 1.0 - next_rank * 0.05
+
+	def buy_upgrade(self, target, value):
+		cost = scale_cost(target.cost, self.state.cost['upgrade'].multiplier)
+		if self.state.gold >= cost:
+			self.state.gold -= cost
+			self.state.total['upgrade'] += 1
+			self.state.since['upgrade'] += 1
+			target.buy(value)
+			self.penalties = 0
+			return True
+
+		return False
+
+	# buy up to count upgrades at once, return how many were bought
+	def buy_upgrades(self, target, value, count=MAX_BULK):
+		count, price = target.get_bulk_price(self.state.gold, self.state.cost['upgrade'].multiplier, count)
+		if count > 0:
+			self.state.gold -= price
+			self.state.total['upgrade'] += count
+			self.state.since['upgrade'] += count
+			target.buy_many(count, value)
+			self.penalties = 0
+
+		return count
+
+	def buy_rebirth(self, option):
+		if option == '' or self.state.gold < self.state.rebirth.cost:
+			return False
+
+		self.prestiges += 1
+		self.state.rebirth.buy(1)
+		if self.state.rebirth.value > self.state.highest['rebirth']:
+			self.state.highest['rebirth'] = self.state.rebirth.value
+		state = self.state
+		damage_increase_amount = state.damage_increase_amount.value
+		attack_rate_increase = state.attack_rate_increase.value
+		state.prestige('rebirth')
+		state.sequence['upgrade'] = 0
+		state.sequence['rebirth'] += 1
+		state.damage_increase_amount.value = damage_increase_amount
+		state.attack_rate_increase.value = attack_rate_increase
+		if option == '1':
+			state.damage_increase_amount.value += self.rebirth_values[0]
+		elif option == '2':
+			state.attack_rate_increase.value += self.rebirth_values[1]
+
+		self.init_level()
+		self.penalties = 0
+		self.save()
+		self.mode = MODE_PLAY
+
+		return True
+
+	def buy_evolve(self, option):
+		if option == '' or self.state.rebirth.value < self.state.evolve.cost:
+			return False
+
+		self.prestiges += 1
+		self.state.evolve.buy(1)
+		if self.state.evolve.value > self.state.highest['evolve']:
+			self.state.highest['evolve'] = self.state.evolve.value
+		state = self.state
+		if option == '1':
+			state.base['damage'] += self.evolve_values[0]
+		elif option == '2':
+			state.base['attack_rate'] += self.evolve_values[1]
+		state.prestige('evolve')
+		state.sequence['upgrade'] = 0
+		state.sequence['rebirth'] = 0
+		state.sequence['evolve'] += 1
+		self.penalties = 0
+		self.init_level()
+		self.save()
+		self.mode = MODE_PLAY
+
+		return True
+
+	def buy_transform(self, option):
+		if option == '' or self.state.evolve.value < self.state.transform.cost:
+			return False
+
+		self.prestiges += 1
+		if option == '1':
+			self.state.base['damage_increase'] += self.transform_values[0]
+		elif option == '2':
+			self.state.base['attack_rate_increase'] += self.transform_values[1]
+
+		self.state.transform.buy(1)
+		if self.state.transform.value > self.state.highest['transform']:
+			self.state.highest['transform'] = self.state.transform.value
+		state = self.state
+		state.prestige('transform')
+		state.sequence['upgrade'] = 0
+		state.sequence['rebirth'] = 0
+		state.sequence['evolve'] = 0
+		state.sequence['transform'] += 1
+		self.penalties = 0
+		self.init_level()
+		self.save()
+		self.mode = MODE_PLAY
+
+		return True
+
+	def get_max_health(self, level):
+		return int(math.pow(level, self.state.cost['health'].growth) * self.state.cost['health'].multiplier)
+
+	def init_level(self):
+		self.state.max_health = self.get_max_health(self.state.level)
+		if self.state.health <= 0:
+			self.state.health = self.state.max_health
+
+	def update_health(self):
+		if self.state.health <= 0:
+			if self.update_reward():
+				self.state.level += 1
+				if self.state.level > self.state.highest['level']:
+					self.state.highest['level'] = self.state.level
+
+				self.init_level()
+
+	def get_reward(self, multiplier):
+		return int(self.state.level * multiplier)
+
+	# total reward for killing count enemies starting at level, the same as count calls to get_reward().
+	# a whole multiplier sums in closed form. any other is summed kill by kill, int(level * multiplier)
+	# rounds the float product up to a whole number at some levels, which no exact formula reproduces
+	def get_rewards(self, level, count, multiplier):
+		if count <= 0:
+			return 0
+
+		if float(multiplier).is_integer():
+			return int(multiplier) * (level * count + count * (count - 1) // 2)
+
+		return sum(int(i * multiplier) for i in range(level, level + count))
+
+	# return true if not restarting
+	def update_reward(self):
+		total_reward = self.get_reward(self.state.gold_multiplier)
+
+		if not self.fast_forwarding and self.mode == MODE_PLAY:
+			self.set_message("You earned " + format_number(total_reward, self.notation) + " gold!")
+
+		self.state.gold += total_reward
+		self.state.total['gold'] += total_reward
+		self.state.since['gold'] += total_reward
+		self.state.total['kill'] += 1
+		if self.approximate:
+			self.approximate_state()
+
+		# handle auto upgrades, capital commands buy as many as possible
+		if self.mode == MODE_PLAY:
+			command = self.get_next_sequence('upgrade')
+			count = 1
+			if command.isupper():
+				command = command.lower()
+				count = MAX_BULK
+			bought = False
+			if command == 'u':
+				bought = self.buy_upgrades(self.state.damage, self.state.damage_increase.value, count) > 0
+			elif command == 'i':
+				if 'can_upgrade_damage_increase' in self.state.perks:
+					bought = self.buy_upgrades(self.state.damage_increase, self.state.damage_increase_amount.value, count) > 0
+			elif command == 'o':
+				if 'can_upgrade_attack_rate' in self.state.perks:
+					bought = self.buy_upgrades(self.state.attack_rate, self.state.attack_rate_increase.value, count) > 0
+
+			if bought:
+				self.state.sequence['upgrade'] += 1
+
+			# handle auto rebirths
+			command = self.get_next_sequence('rebirth')
+			bought_rebirth = self.buy_rebirth(command)
+
+			# handle auto evolve
+			command = self.get_next_sequence('evolve')
+			bought_evolve = self.buy_evolve(command)
+
+			if bought_evolve or bought_rebirth:
+				return False
+
+		return True
+
+	# swap gold and prices past APPROXIMATE_LIMIT for floats, which keep a fixed size
+	# however far they grow where ints gain a digit every few purchases
+	def approximate_state(self):
+		state = self.state
+		if isinstance(state.gold, int) and state.gold >= APPROXIMATE_LIMIT:
+			state.gold = float(state.gold)
+		for container in (state.total, state.since):
+			if isinstance(container['gold'], int) and container['gold'] >= APPROXIMATE_LIMIT:
+				container['gold'] = float(container['gold'])
+		for name in UPGRADES:
+			upgrade = getattr(state, name)
+			if isinstance(upgrade.cost, int) and upgrade.cost >= APPROXIMATE_LIMIT:
+				upgrade.cost = float(upgrade.cost)
+
+	# number of attacks needed to kill an enemy with health
+	def get_kill_hits(self, health, damage):
+		return max(1, math.ceil(health / damage))
+
+	def get_level_hits(self, level, damage):
+		return self.get_kill_hits(self.get_max_health(level), damage)
+
+	# gold needed before the next kill changes the state, or None if no kill will
+	def get_event_gold(self):
+		if self.mode != MODE_PLAY:
+			return None
+
+		if self.get_next_sequence('evolve') != "" and self.state.rebirth.value >= self.state.evolve.cost:
+			return 0
+
+		thresholds = []
+		command = self.get_next_sequence('upgrade').lower()
+		multiplier = self.state.cost['upgrade'].multiplier
+		if command == 'u':
+			thresholds.append(scale_cost(self.state.damage.cost, multiplier))
+		elif command == 'i' and 'can_upgrade_damage_increase' in self.state.perks:
+			thresholds.append(scale_cost(self.state.damage_increase.cost, multiplier))
+		elif command == 'o' and 'can_upgrade_attack_rate' in self.state.perks:
+			thresholds.append(scale_cost(self.state.attack_rate.cost, multiplier))
+
+		if self.get_next_sequence('rebirth') != "":
+			thresholds.append(self.state.rebirth.cost)
+
+		if len(thresholds) == 0:
+			return None
+
+		return min(thresholds)
+
+	# kill fresh enemies in bulk without triggering any purchase, return attacks used
+	def kill_quietly(self, attacks):
+		state = self.state
+		damage = state.damage.value
+		multiplier = state.gold_multiplier
+		event_gold = self.get_event_gold()
+		level = state.level
+		used = 0
+		gold = 0
+		while True:
+
+			# find the range of levels that take the same number of hits
+			hits = self.get_level_hits(level, damage)
+			limit = (attacks - used) // hits
+			if limit <= 0:
+				break
+
+			low = 1
+			high = limit
+			while low < limit:
+				probe = min(low * 2, limit)
+				if self.get_level_hits(level + probe - 1, damage) > hits:
+					high = probe - 1
+					break
+				low = probe
+			while low < high:
+				middle = (low + high + 1) // 2
+				if self.get_level_hits(level + middle - 1, damage) <= hits:
+					low = middle
+				else:
+					high = middle - 1
+			count = low
+
+			# stop before the kill that reaches the next purchase
+			reached = False
+			if event_gold is not None:
+				remaining = event_gold - state.gold - gold
+				if self.get_rewards(level, count, multiplier) >= remaining:
+					low = 0
+					high = count - 1
+					while low < high:
+						middle = (low + high + 1) // 2
+						if self.get_rewards(level, middle, multiplier) < remaining:
+							low = middle
+						else:
+							high = middle - 1
+					count = low
+					reached = True
+
+			gold += self.get_rewards(level, count, multiplier)
+			used += count * hits
+			level += count
+			if reached:
+				break
+
+		kills = level - state.level
+		if kills > 0:
+			state.gold += gold
+			state.total['gold'] += gold
+			state.since['gold'] += gold
+			state.total['kill'] += kills
+			state.level = level
+			if self.approximate:
+				self.approximate_state()
+			if state.level > state.highest['level']:
+				state.highest['level'] = state.level
+
+			state.health = 0
+			self.init_level()
+
+		return used
+
+	# same as update() but jumps between kills that change the state instead of simulating every attack;
+	# matches update() up to float rounding of the attack timer and enemy health, so a tick-by-tick run
+	# can land a few attacks, and therefore at most a kill or a purchase, away from this one
+	def advance(self, frametime):
+		self.state.total['time'] += frametime
+		self.state.since['time'] += frametime
+
+		# handle autosave
+		self.save_timer += frametime
+		if self.save_timer >= AUTOSAVE_TIME:
+			self.save_timer = 0
+			self.save()
+
+		self.attack_timer += frametime
+		while True:
+			period = 1.0 / self.state.attack_rate.value
+			attacks = int(self.attack_timer / period)
+			if attacks <= 0:
+				break
+
+			# finish the current enemy, applying purchases through the normal rules
+			damage = self.state.damage.value
+			hits = self.get_kill_hits(self.state.health, damage)
+			if hits > attacks:
+				self.state.health -= attacks * damage
+				self.attack_timer -= attacks * period
+				break
+
+			self.state.health -= hits * damage
+			self.attack_timer -= hits * period
+			prestiges = self.prestiges
+			self.update_health()
+			if self.prestiges != prestiges:
+				if self.fast_forwarding:
+					self.skip_rebirths()
+
+				# the new run started at the last kill, what's left on the attack timer has been played since
+				self.state.since['time'] = self.attack_timer
+
+			# kill enemies up to the next purchase in bulk
+			period = 1.0 / self.state.attack_rate.value
+			used = self.kill_quietly(int(self.attack_timer / period))
+			self.attack_timer -= used * period
+
+	# right after a prestige, play out the auto rebirths that follow in one go when every run repeats the
+	# last one and only the rebirth cost it ends at grows. that holds while the upgrade build never buys
+	# attack rate, so all attacks take the same time, and the rebirth options only raise a stat it never uses
+	def skip_rebirths(self):
+		state = self.state
+		build = self.get_build('upgrade').lower()
+		if 'o' in build and 'can_upgrade_attack_rate' in state.perks:
+			return
+		uses_amount = 'i' in build and 'can_upgrade_damage_increase' in state.perks
+
+		# a shadow from an earlier call can carry on if its run started the same way
+		key = (
+			build, tuple(state.perks.items()), state.cost['upgrade'].multiplier, state.level, state.gold, state.gold_multiplier,
+			state.damage.value, state.damage.cost, state.damage_increase.value, state.damage_increase.cost,
+			uses_amount and state.damage_increase_amount.value, state.attack_rate.value,
+		)
+		shadow = None
+		if self.shadow is not None and self.shadow[0] == key:
+			shadow = self.shadow[1]
+
+		period = 1.0 / state.attack_rate.value
+		attacks = int(self.attack_timer / period)
+		while True:
+			command = self.get_next_sequence('rebirth')
+			if command == '' or (command == '1' and uses_amount):
+				break
+
+			# leave runs that end in an evolve to the normal path
+			if self.get_next_sequence('evolve') != '' and state.rebirth.value + 1 >= state.evolve.cost:
+				break
+
+			# every run is the start of the same long run, cut off at its rebirth cost. it's only worth
+			# playing that long run when at least one more rebirth like this one follows
+			if shadow is None:
+				following = self.get_build('rebirth')[state.sequence['rebirth'] + 1:state.sequence['rebirth'] + 2]
+				if following == '' or (following == '1' and uses_amount):
+					break
+				shadow = RunShadow(state.snapshot())
+				self.shadow = (key, shadow)
+			if not shadow.play_until(state.rebirth.cost, attacks):
+				break
+
+			attacks -= shadow.attacks
+			self.attack_timer -= shadow.attacks * period
+			for name in ('kill', 'gold', 'upgrade'):
+				state.total[name] += shadow.state.total[name] - shadow.start[name]
+			if shadow.level > state.level and shadow.level > state.highest['level']:
+				state.highest['level'] = shadow.level
+			state.gold = shadow.state.gold
+			self.buy_rebirth(command)
+
+	# simulated seconds until the next attack or autosave
+	def get_next_event(self):
+		attack = 1.0 / self.state.attack_rate.value - self.attack_timer
+		autosave = AUTOSAVE_TIME - self.save_timer
+		return max(0, min(attack, autosave))
+
+	# run count fixed timesteps
+	def step(self, count):
+		for i in range(count):
+			self.update(self.timestep)
+
+	def update(self, frametime):
+		self.state.total['time'] += frametime
+		self.state.since['time'] += frametime
+
+		# handle autosave
+		self.save_timer += frametime
+		if self.save_timer >= AUTOSAVE_TIME:
+			self.save_timer = 0
+			self.save()
+
+		# make an attack
+		period = 1.0 / self.state.attack_rate.value
+		self.attack_timer += frametime
+		while self.attack_timer >= period:
+			self.attack_timer -= period
+			self.state.health -= self.state.damage.value
+			self.update_health()
+			period = 1.0 / self.state.attack_rate.value
+
+# plays a run on from its start without ever prestiging, to find where auto rebirths at growing costs end it
+class RunShadow(Simulation):
+
+	def __init__(self, state):
+		Simulation.__init__(self, state)
+		self.fast_forwarding = True
+		self.state.builds['evolve'] = ""
+		self.start = dict(self.state.total)
+		self.attacks = 0
+		self.level = self.state.level
+		self.stopped = False
+
+	def buy_rebirth(self, option):
+		return False
+
+	def buy_evolve(self, option):
+		return False
+
+	# play to the first kill that leaves at least cost gold, using no more than attacks since the start.
+	# afterwards attacks and level hold the attacks used and the level of that kill
+	def play_until(self, cost, attacks):
+		state = self.state
+		state.rebirth.cost = cost
+		if self.stopped and state.gold >= cost:
+			return True
+
+		self.stopped = False
+		while True:
+			damage = state.damage.value
+			hits = self.get_kill_hits(state.health, damage)
+			if self.attacks + hits > attacks:
+				return False
+
+			self.attacks += hits
+			state.health -= hits * damage
+			self.level = state.level
+			self.update_health()
+			if state.gold >= cost:
+				self.stopped = True
+				return True
+
+			self.attacks += self.kill_quietly(attacks - self.attacks)
+
+PERKS = [
+	#     Max  Name                            Label                    Info                                                             Cost         Level   Reb  Ev   Cost Mult
+	Perk( 1,   "can_upgrade_damage_increase" , "Game is Hard I"       , "Allow Damage Increase to be upgraded"                         , 250        , 0,      0,   0,   0   ),
+	Perk( 1,   "can_upgrade_attack_rate"     , "Game is Hard II"      , "Allow Attack Rate to be upgraded"                             , 2000       , 0,      0,   0,   0   ),
+	Perk( 1,   "can_rebirth"                 , "Game is Hard III"     , "Allow Rebirthing"                                             , 20000      , 0,      0,   0,   0   ),
+	Perk( 1,   "can_evolve"                  , "Game is Hard IV"      , "Allow Evolving"                                               , 1000000    , 0,      0,   0,   0   ),
+	Perk( 1,   "can_transform"               , "Game is Hard V"       , "Allow Transforming"                                           , 100000000  , 0,      0,   15,  0   ),
+	Perk( 1,   "show_dps"                    , "Math is Hard I"       , "Show DPS"                                                     , 20000      , 0,      1,   0,   0   ),
+	Perk( 1,   "show_dps_increase"           , "Math is Hard II"      , "Show DPS increase next to upgrades"                           , 100000     , 0,      20,  0,   0   ),
+	Perk( 1,   "show_highest_level"          , "Memory is Hard I"     , "Show Highest Level"                                           , 50000      , 1000,   0,   1,   0   ),
+	Perk( 1,   "show_highest_dps"            , "Memory is Hard II"    , "Show Highest DPS"                                             , 100000     , 2000,   5,   1,   0   ),
+	Perk( 1,   "show_elapsed"                , "Memory is Hard III"   , "Show Elapsed Time"                                            , 150000     , 3000,   10,  5,   0   ),
+	Perk( 1,   "show_total_upgrades"         , "Counting is Hard I"   , "Show Total Upgrades"                                          , 10000000   , 10000,  0,   5,   0   ),
+	Perk( 1,   "show_total_kills"            , "Counting is Hard II"  , "Show Total Kills"                                             , 10000000   , 20000,  0,   10,  0   ),
+	Perk( 1,   "show_total_gold"             , "Counting is Hard III" , "Show Total Gold"                                              , 10000000   , 30000,  0,   15,  0   ),
+	Perk( 1,   "show_health_percent"         , "Reading is Hard I"    , "Show Health Percent"                                          , 500000     , 0,      1,   0,   0   ),
+	Perk( 10,  "reduce_upgrade_price"        , "Buying is Hard"       , "Reduce Upgrade Cost by 5% per Rank"                           , 1000000    , 0,      0,   10,  10  ),
+	Perk( 100, "auto_upgrade"                , "Upgrading is Hard"    , "Set an Upgrade Sequence on Rebirth"                           , 1000000    , 0,      0,   5,   2   ),
+	Perk( 100, "auto_rebirth"                , "Rebirthing is Hard"   , "Set a Rebirth Sequence on Evolve"                             , 10000000   , 0,      0,   10,  2   ),
+	Perk( 100, "auto_evolve"                 , "Evolving is Hard"     , "Set an Evolve Sequence on Transform"                          , 100000000  , 0,      0,   20,  2   ),
+]
+
+PERK_INDEXES = { perk.name : index for index, perk in enumerate(PERKS) }
+
+# unlock requirements, perk affordability can only change when one of these is crossed
+PERK_LEVELS = sorted(set(perk.level for perk in PERKS))
+PERK_REBIRTHS = sorted(set(perk.rebirths for perk in PERKS))
+PERK_EVOLVES = sorted(set(perk.evolves for perk in PERKS))
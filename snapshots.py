@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import io
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import pickle
+import hashlib
+import argparse
+from simulation import State, GAME_VERSION
+from savefile import get_save_path, get_slot_path, encode_state, read_state, migrate_state, save_state, write_file, DEFAULT_SLOT
+
+SNAPSHOT_DIR = "snapshots"
+INDEX_FILE = "index.json"
+DICTIONARY_FILE = "dictionary"
+PRESTIGE_INTERVAL = 60
+DAILY_INTERVAL = 60*60*24
+
+# snapshots kept of each kind for each slot, the oldest are dropped first
+KEEP = {
+	'prestige' : 10,
+	'daily'    : 7,
+	'new_game' : 5,
+	'newer'    : 3,
+	'replaced' : 3,
+}
+
+# rotating history of saves. each distinct save is stored once, compressed against a dictionary
+# made when the store was created, and an index lists what's kept. the number of snapshots of
+# each kind is capped, so the store stops growing however long the game runs
+class SnapshotStore:
+
+	def __init__(self, path):
+		self.path = path
+		self.entries = []
+		self.next_id = 1
+		if not os.path.exists(path):
+			os.makedirs(path)
+
+		index_path = os.path.join(path, INDEX_FILE)
+		if os.path.exists(index_path):
+			with open(index_path) as f:
+				index = json.load(f)
+			self.entries = index['entries']
+			self.next_id = index['next_id']
+
+		# a fresh save shares most of its bytes with any other, which makes a good dictionary
+		dictionary_path = os.path.join(path, DICTIONARY_FILE)
+		if os.path.exists(dictionary_path):
+			with open(dictionary_path, 'rb') as f:
+				self.dictionary = f.read()
+		else:
+			state = State(GAME_VERSION)
+			state.time = 0
+			self.dictionary = encode_state(state)
+			write_file(dictionary_path, self.dictionary)
+
+	def get_object_path(self, digest):
+		return os.path.join(self.path, digest + '.snap')
+
+	def write_index(self):
+		data = json.dumps({ 'next_id' : self.next_id, 'entries' : self.entries }, indent=1)
+		write_file(os.path.join(self.path, INDEX_FILE), data.encode(), sync=False)
+
+	# add the bytes of a save file, returns its index entry
+	def add_data(self, kind, data, summary, saved=None):
+		digest = hashlib.sha1(data).hexdigest()
+		object_path = self.get_object_path(digest)
+		if not os.path.exists(object_path):
+			compressor = zlib.compressobj(9, zdict=self.dictionary)
+			write_file(object_path, compressor.compress(data) + compressor.flush(), sync=False)
+
+		entry = { 'id' : self.next_id, 'kind' : kind, 'time' : saved or time.time(), 'hash' : digest }
+		entry.update(summary)
+		self.next_id += 1
+		self.entries.append(entry)
+		self.prune(kind, summary.get('slot', DEFAULT_SLOT))
+		self.write_index()
+
+		return entry
+
+	# add a copy of a state. its save time is left to the index so the same state is only stored once
+	def add(self, kind, state, slot=DEFAULT_SLOT):
+		snapshot = state.snapshot()
+		snapshot.time = 0
+		summary = {
+			'version'    : state.version,
+			'level'      : state.level,
+			'gold'       : state.gold,
+			'rebirths'   : state.rebirth.value,
+			'evolves'    : state.evolve.value,
+			'transforms' : state.transform.value,
+			'slot'       : slot,
+		}
+
+		return self.add_data(kind, encode_state(snapshot), summary)
+
+	# drop the oldest snapshots of a kind in a slot past its limit, and any objects nothing refers to anymore.
+	# each slot keeps its own, so one player's prestiges never push out another's
+	def prune(self, kind, slot):
+		entries = [ entry for entry in self.entries if entry['kind'] == kind and get_slot(entry) == slot ]
+		dropped = entries[:max(0, len(entries) - KEEP.get(kind, 1))]
+		if len(dropped) == 0:
+			return
+
+		self.entries = [ entry for entry in self.entries if entry not in dropped ]
+		used = set(entry['hash'] for entry in self.entries)
+		for entry in dropped:
+			if entry['hash'] not in used:
+				try:
+					os.remove(self.get_object_path(entry['hash']))
+				except OSError:
+					pass
+
+	def get_entry(self, snapshot_id):
+		for entry in self.entries:
+			if entry['id'] == snapshot_id:
+				return entry
+
+		return None
+
+	# time of the newest snapshot of a kind in a slot, or 0 when there's none
+	def get_last_time(self, kind, slot=DEFAULT_SLOT):
+		return max([ entry['time'] for entry in self.entries if entry['kind'] == kind and get_slot(entry) == slot ] + [ 0 ])
+
+	def get_data(self, entry):
+		with open(self.get_object_path(entry['hash']), 'rb') as f:
+			data = f.read()
+
+		decompressor = zlib.decompressobj(zdict=self.dictionary)
+		return decompressor.decompress(data) + decompressor.flush()
+
+	# state of a snapshot, upgraded to the current game version
+	def load(self, entry):
+		return migrate_state(read_state(io.BytesIO(self.get_data(entry))))
+
+	# write a snapshot over a save file, keeping what was there as a snapshot. the restored
+	# state is saved as of now so no offline time is counted for the time it spent in the store
+	def restore(self, entry, path, slot=DEFAULT_SLOT):
+		state = self.load(entry)
+		if os.path.exists(path):
+			with open(path, 'rb') as f:
+				self.add_data('replaced', f.read(), { 'slot' : slot })
+
+		state.time = time.time()
+		save_state(path, state)
+
+		return state
+
+	# move save.dat.<millis> backups and save.dat.<version> saves left by older versions into the store
+	def import_backups(self, path, slot=DEFAULT_SLOT):
+		directory, name = os.path.split(path)
+		pattern = re.compile(re.escape(name) + r'\.(\d+)$')
+		for filename in sorted(os.listdir(directory)):
+			match = pattern.match(filename)
+			if match is None:
+				continue
+
+			backup_path = os.path.join(directory, filename)
+			with open(backup_path, 'rb') as f:
+				data = f.read()
+
+			# new game backups are named by time in milliseconds, set aside saves by game version
+			suffix = int(match.group(1))
+			if suffix > GAME_VERSION * 1000:
+				self.add_data('new_game', data, { 'slot' : slot }, suffix / 1000.0)
+			else:
+				self.add_data('newer', data, { 'version' : suffix, 'slot' : slot }, os.path.getmtime(backup_path))
+			os.remove(backup_path)
+
+# entries from before slots were recorded all belong to the default one
+def get_slot(entry):
+	return entry.get('slot', DEFAULT_SLOT)
+
+def list_snapshots(store):
+	for entry in store.entries:
+		saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['time']))
+		details = ""
+		if 'level' in entry:
+			details = "level %d, %d rebirths, %d evolves, %d transforms" % (entry['level'], entry['rebirths'], entry['evolves'], entry['transforms'])
+		elif 'version' in entry:
+			details = "version " + str(entry['version'])
+		print("%4d  %-9s %-10s %s  %s" % (entry['id'], entry['kind'], get_slot(entry), saved, details))
+
+def main():
+	parser = argparse.ArgumentParser(description="List and restore snapshots of the game's save, don't restore while the game is running")
+	parser.add_argument('--restore', type=int, metavar='ID', help="write snapshot ID over the save")
+	parser.add_argument('--save', help="save file to restore to, defaults to the slot the snapshot came from")
+	args = parser.parse_args()
+
+	save_path = get_save_path()
+	try:
+		store = SnapshotStore(save_path + SNAPSHOT_DIR)
+		if args.restore is None:
+			list_snapshots(store)
+			return
+
+		entry = store.get_entry(args.restore)
+		if entry is None:
+			print("no snapshot " + str(args.restore))
+			sys.exit(1)
+
+		slot = get_slot(entry)
+		state = store.restore(entry, args.save or get_slot_path(save_path, slot), slot)
+		print("Restored snapshot " + str(entry['id']) + " at level " + str(state.level))
+	except (OSError, ValueError, pickle.UnpicklingError) as e:
+		print(str(e))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()